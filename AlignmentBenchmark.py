@@ -0,0 +1,76 @@
+"""Benchmark StockDatabase date alignment against the old dict-based one.
+
+Builds tickers with different start dates and randomly missing days, checks
+that both alignments give identical price arrays, and reports their times.
+"""
+
+import argparse
+import numpy as np
+from time import time
+
+import Config
+from Stock import Stock
+from StockDatabase import StockDatabase
+
+
+def getFilteredPricesByDict(stock_db):
+    """Align prices the old way, through a dict of dates to tickers to prices.
+
+    Args:
+        stock_db {StockDatabase}: Database whose cleaned prices to align.
+    Returns:
+        price_array {array}: Rows = Dates, Columns = Tickers
+    """
+    date_dict = {}
+    for ticker, (dates, prices) in stock_db._price_series.iteritems():
+        for date, price in zip(dates.tolist(), prices.tolist()):
+            if date not in date_dict:
+                date_dict[date] = {}
+            date_dict[date][ticker] = price
+    for date in date_dict.keys():
+        if len(date_dict[date].keys()) < len(stock_db.stock_dict.keys()):
+            del date_dict[date]
+    return np.array([
+        [date_dict[date][ticker] for ticker in stock_db.tickers]
+        for date in sorted(date_dict)], dtype=np.float64)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num_tickers', type=int, default=1500)
+    parser.add_argument('--num_days', type=int, default=5000)
+    args = parser.parse_args()
+
+    Config.MINIMUM_AMOUNT_DATA = 0
+    end = np.datetime64(Config.TODAY.date(), 'D')
+    all_dates = np.arange(end - args.num_days + 1, end + 1)
+    stock_dict = {}
+    for t in xrange(args.num_tickers):
+        start = np.random.randint(args.num_days // 10)
+        kept = np.random.rand(args.num_days - start) > 0.001
+        dates = all_dates[start:][kept]
+        prices = 10 * np.cumprod(1 + 0.01 * np.random.randn(len(dates)))
+        stock_dict['T%d' % t] = Stock.fromArrays(dates, prices, 'T%d' % t, 0)
+
+    start_time = time()
+    stock_db = StockDatabase(stock_dict)
+    vectorized_time = time() - start_time
+    start_time = time()
+    stock_db.dates = stock_db._getCommonDates()
+    stock_db.price_array = stock_db._getFilteredPrices()
+    alignment_time = time() - start_time
+    start_time = time()
+    price_array = getFilteredPricesByDict(stock_db)
+    dict_time = time() - start_time
+
+    assert np.array_equal(price_array, stock_db.price_array)
+    print('Aligned %d tickers to %d common days.' %
+          stock_db.price_array.shape[::-1])
+    print('StockDatabase (clean + align): %.3fs' % vectorized_time)
+    print('Vectorized alignment: %.3fs' % alignment_time)
+    print('Dict alignment: %.3fs (%.0fx slower)' % (
+        dict_time, dict_time / alignment_time))
+
+
+if __name__ == '__main__':
+    main()
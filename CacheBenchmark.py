@@ -0,0 +1,96 @@
+"""Benchmark cold loads of the price store under each codec and loader.
+
+Each codec gets its own copy of the store, and each load opens it afresh, so
+the manifest and payloads are read from disk (or the OS page cache, which this
+can't drop) every time.
+"""
+
+import argparse
+import numpy as np
+import os
+import shutil
+import tempfile
+from time import time
+
+import Config
+import DataIO
+from PriceStore import CODECS, PriceStore
+
+LOADERS = ('serial', 'thread', 'process')
+
+
+def buildStores(directory, num_tickers, num_days, source=None):
+    """Write the same prices into a store per codec.
+
+    Args:
+        directory {string}: Where to put the stores.
+        num_tickers {int}: Number of synthetic tickers.
+        num_days {int}: Trading days per synthetic ticker.
+        source {string}: A cache_files directory to use instead of synthetic
+            prices.
+    Returns:
+        tickers {list}: The stored tickers.
+    """
+    base = PriceStore(os.path.join(directory, 'raw'), 'raw')
+    if source:
+        base.migratePickleCache(source)
+    else:
+        end = np.datetime64(Config.TODAY.date(), 'D')
+        dates = np.arange(end - num_days + 1, end + 1)
+        now = time()
+        for t in xrange(num_tickers):
+            prices = np.round(10 * np.cumprod(
+                1 + 0.01 * np.random.randn(num_days)), 4)
+            base.write('T%d' % t, dates, prices, now)
+    for codec in CODECS:
+        if codec == 'raw':
+            continue
+        shutil.copytree(
+            os.path.join(directory, 'raw'), os.path.join(directory, codec))
+        PriceStore(os.path.join(directory, codec), codec).convert()
+    return base.getTickers()
+
+
+def getDiskBytes(directory):
+    return sum(os.path.getsize(os.path.join(directory, filename))
+               for filename in os.listdir(directory))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num_tickers', type=int, default=500)
+    parser.add_argument('--num_days', type=int, default=5000)
+    parser.add_argument('--source', help='A cache_files directory to load '
+                        'instead of synthetic prices.')
+    parser.add_argument('--workers', type=int,
+                        help='Workers for the thread and process loaders.')
+    args = parser.parse_args()
+
+    Config.MINIMUM_AMOUNT_DATA = 0
+    Config.CACHE_LOADER_WORKERS = args.workers
+    directory = tempfile.mkdtemp()
+    try:
+        tickers = buildStores(
+            directory, args.num_tickers, args.num_days, args.source)
+        print('%-6s %-8s %10s %10s %8s' % (
+            'Codec', 'Loader', 'Disk MB', 'MB/s', 'Seconds'))
+        for codec in sorted(CODECS):
+            store_directory = os.path.join(directory, codec)
+            disk_mb = getDiskBytes(store_directory) / 1e6
+            for loader in LOADERS:
+                Config.CACHE_LOADER = loader
+                DataIO.price_store = PriceStore(store_directory, codec)
+                start_time = time()
+                cache_data = DataIO._retrieveCacheFiles(tickers)
+                elapsed = time() - start_time
+                decoded_mb = sum(
+                    dates.nbytes + prices.nbytes
+                    for (dates, prices, _) in cache_data.itervalues()) / 1e6
+                print('%-6s %-8s %10.1f %10.1f %8.3f' % (
+                    codec, loader, disk_mb, decoded_mb / elapsed, elapsed))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
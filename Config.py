@@ -4,13 +4,63 @@ import datetime
 DAYS_IN_YEAR = 261
 INITIAL_PERCENTILE = 0.5
 
+# Simulated annealing.
+ANNEAL_MAX_EVALUATIONS = 32768
+ANNEAL_BATCH_SIZE = 64
+ANNEAL_START_ACCEPTANCE = 0.5
+ANNEAL_END_ACCEPTANCE = 0.001
+
+# Projected gradient.
+GRADIENT_MAX_ITERATIONS = 1000
+GRADIENT_POLISH_TRADE_AMOUNT = 1.0 / 64
+
+# Line search binary solver.
+LINE_SEARCH_BUYS = 16
+
+# Efficient frontier sweeps.
+WARM_START_TRADE_AMOUNT = 0.125
+
+# Rebalance plans stop at this correlation with the desired portfolio, or
+# after this many trades.
+REBALANCE_TARGET_CORRELATION = 0.99
+REBALANCE_MAX_TRADES = 20
+
+# Optimization server port, requests worked on at once, and seconds between
+# refreshes of the resident database.
+SERVER_PORT = 8765
+SERVER_WORKERS = 2
+SERVER_REFRESH_INTERVAL = 600.0
+
 TODAY = datetime.datetime.today()
 MINIMUM_AMOUNT_DATA = 8 * DAYS_IN_YEAR
 
 with open('api_key_ignore_.txt', 'r') as f:
     API_KEY = f.read()
 SIZE = 'full'  # compact|full
-MIN_TIME_BETWEEN_CALLS = 1.0
+# Price store payload codec (raw|zlib|bz2|lzma), and how cached tickers are
+# decoded (serial|thread|process) with how many workers.
+PRICE_STORE_CODEC = 'raw'
+CACHE_LOADER = 'serial'
+CACHE_LOADER_WORKERS = None
+# Built databases kept in the database cache.
+DATABASE_CACHE_ENTRIES = 4
+
+# API rate limiting and retries.
+API_CALLS_PER_SECOND = 1.0
+API_BURST = 1
+API_CONCURRENCY = 4
+API_MAX_ATTEMPTS = 120
+API_MAX_503S = 10
+API_BACKOFF = 1.0
+API_MAX_BACKOFF = 30.0
 BASE_REQUEST = (
     'https://www.alphavantage.co/query?function=TIME_SERIES_DAILY_ADJUSTED&apikey=' +
-    API_KEY + '&outputsize=' + SIZE + '&symbol=')
+    API_KEY + '&outputsize=%s&symbol=')
+# Cached tickers refreshed per run, and seconds allowed for it. Held tickers
+# count as REFRESH_IMPORTANCE times staler when choosing which to refresh.
+REFRESH_MAX_CALLS = 20
+REFRESH_MAX_TIME = 60.0
+REFRESH_IMPORTANCE = 4.0
+# Most relative difference between cached and refreshed adjusted closes before
+# a ticker's history is assumed to have been re-adjusted.
+REFRESH_TOLERANCE = 0.0001
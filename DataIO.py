@@ -2,28 +2,34 @@
 
 That includes caching, API calls, file reading, etc."""
 
-import bz2
-from collections import OrderedDict
 import csv
-import datetime
 from decimal import Decimal
-import os
-import cPickle as pickle
+from functools import partial
+import glob
 import math
+from multiprocessing import Pool as ProcessPool
 from multiprocessing.dummy import Pool
+import numpy as np
+import os
+import re
 from re import sub
 import requests
 from time import sleep, time
 
 import Config
+from PriceSeries import cleanPrices
+from PriceStore import PriceStore
+from RefreshScheduler import RefreshScheduler
+from TokenBucket import TokenBucket
 
-# TODO: Update cache mechanism.
-# Tickers should be written individually to a cache folder as JSON objects w/ timestamps.
-# Still discard any tickers w/o timestamps.
+# Each day's date and adjusted close in a daily adjusted API response.
+_ADJUSTED_CLOSE_PATTERN = re.compile(
+    r'"(\d{4}-\d{2}-\d{2})":\s*\{[^}]*?"5\. adjusted close":\s*"([^"]*)"')
 
 # Config options.
-last_request_time = time()
+rate_limiter = TokenBucket(Config.API_CALLS_PER_SECOND, Config.API_BURST)
 local_cache = {}
+price_store = PriceStore(codec=Config.PRICE_STORE_CODEC)
 
 
 def getTickerList(filename):
@@ -43,48 +49,132 @@ def getTickerList(filename):
         for row in reader:
             ticker = row[0]
             ticker = sub(r'[^A-Z]', '-', ticker)
-            expense = _stringToDecimal(row[1])
+            expense = _stringToFloat(row[1])
             ticker_list.append(ticker)
             expense_ratio_dict[ticker] = expense
     return ticker_list, expense_ratio_dict
 
 
-def getRawData(ticker_list, use_cache=True):
+def getRawData(
+        ticker_list, use_cache=True, important_tickers=(), max_calls=None,
+        max_time=None):
     """Check for valid cache data, or get raw stock data via API and cache it.
 
-    First loads the cache, then strips any outdated data.
+    Args:
+        ticker_list {list}: List of ticker symbols.
+        use_cache {boolean}: Whether to use the saved cache.
+        important_tickers {iterable}: Tickers to refresh sooner, e.g. held.
+        max_calls {int}: API calls for the run, Config.REFRESH_MAX_CALLS by
+            default. Missing tickers are always fetched.
+        max_time {float}: Seconds for refreshing cached tickers,
+            Config.REFRESH_MAX_TIME by default.
+    Returns:
+        raw_data {dict}: dict of tickers to (dates, prices), with sorted
+            datetime64[D] dates and float64 prices.
+    """
+    return loadRawData(updatePriceStore(
+        ticker_list, use_cache, important_tickers, max_calls, max_time))
+
+
+def updatePriceStore(
+        ticker_list, use_cache=True, important_tickers=(), max_calls=None,
+        max_time=None):
+    """Bring the price store up to date without decoding it.
+
+    First checks the store's manifest for fresh, long enough tickers.
     Calls the API for any missing (or removed) data.
-    Stores the new data in the cache.
-    Strips the data of _timestamp entries, and returns the result.
+    Then refreshes the most valuable cached tickers, within what is left of
+        the call budget and before the deadline.
     Args:
         ticker_list {list}: List of ticker symbols.
         use_cache {boolean}: Whether to use the saved cache.
+        important_tickers {iterable}: Tickers to refresh sooner, e.g. held.
+        max_calls {int}: API calls for the run, Config.REFRESH_MAX_CALLS by
+            default. Missing tickers are always fetched.
+        max_time {float}: Seconds for refreshing cached tickers,
+            Config.REFRESH_MAX_TIME by default.
     Returns:
-        raw_data {dict}: dict of tickers to dates to prices.
+        ticker_list {list}: Tickers the store now has enough fresh data for.
     """
+    if max_calls is None:
+        max_calls = Config.REFRESH_MAX_CALLS
+    if max_time is None:
+        max_time = Config.REFRESH_MAX_TIME
     if use_cache:
-        cache_data = _retrieveCacheFiles(ticker_list)
+        (cached_tickers, too_short_tickers) = _getCachedTickers(ticker_list)
     else:
-        cache_data = {}
-    for ticker in cache_data.keys():
-        if cache_data[ticker] == 'too_short':
-            del cache_data[ticker]
-            ticker_list.remove(ticker)
-    available_keys = sorted(
-        cache_data.keys(), key=lambda ticker: cache_data[ticker]['_timestamp'])
-    # Hack: Remove oldest tickers to slowly refresh cache throughout day.
-    for _ in xrange(int(math.ceil(len(available_keys) / 100.0))):
-        del available_keys[0]
+        (cached_tickers, too_short_tickers) = ([], [])
+    too_short_tickers = set(too_short_tickers)
+    ticker_list = [ticker for ticker in ticker_list
+                   if ticker not in too_short_tickers]
     # Determine missing keys and call API for them.
-    missing_tickers = set(ticker_list).difference(set(available_keys))
+    missing_tickers = set(ticker_list).difference(cached_tickers)
     print('Getting %d missing tickers.' % len(missing_tickers))
-    # Hack: To get the cache to store after each API call, I'm passing the
-    # tickers once at a time. I could refactor, but I'm feeling lazy.
-    cache_data.update(_getAPIData(missing_tickers))
-    for ticker in cache_data:
-        if '_timestamp' in cache_data[ticker]:
-            del cache_data[ticker]['_timestamp']
-    return cache_data
+    _getAPIData(missing_tickers)
+    # Spend the rest of the budget on the most valuable refreshes.
+    scheduler = RefreshScheduler(price_store, important_tickers)
+    refresh_list = scheduler.getRefreshList(
+        cached_tickers, max_calls - len(missing_tickers))
+    print('Refreshing %d cached tickers.' % len(refresh_list))
+    _getAPIData(refresh_list, time() + max_time)
+    return _getCachedTickers(ticker_list)[0]
+
+
+def loadRawData(ticker_list):
+    """Decode tickers from the price store.
+
+    Args:
+        ticker_list {list}: List of ticker symbols.
+    Returns:
+        raw_data {dict}: dict of tickers to (dates, prices), with sorted
+            datetime64[D] dates and float64 prices, for the tickers with
+            enough fresh data.
+    """
+    raw_data = {}
+    for ticker, cache_data in _retrieveCacheFiles(ticker_list).iteritems():
+        if cache_data != 'too_short':
+            (dates, prices, _) = cache_data
+            raw_data[ticker] = (dates, prices)
+    return raw_data
+
+
+def getStoreEntries(ticker_list):
+    """Get the price store's manifest entries for tickers.
+
+    Args:
+        ticker_list {list}: List of ticker symbols.
+    Returns:
+        entry_dict {dict}: Dict of tickers to their manifest entries, for the
+            tickers in the store.
+    """
+    entry_dict = {}
+    for ticker in ticker_list:
+        entry = price_store.getEntry(ticker)
+        if entry is not None:
+            entry_dict[ticker] = entry
+    return entry_dict
+
+
+def getLastDesiredTickers(directory):
+    """Get the tickers held in the most recent desired portfolio.
+
+    Args:
+        directory {string}: Where desired portfolios are written.
+    Returns:
+        tickers {list}: Tickers with a positive allocation, or an empty list
+            if there is no desired portfolio.
+    """
+    filenames = glob.glob(os.path.join(directory, 'DesiredPortfolio_*.csv'))
+    if not filenames:
+        return []
+    tickers = []
+    with open(max(filenames, key=os.path.getmtime), 'r') as f:
+        reader = csv.reader(f)
+        reader.next()  # Header
+        for row in reader:
+            if float(row[1]) > 0:
+                tickers.append(row[0])
+    return tickers
 
 
 def getCurrentData(filename):
@@ -125,21 +215,35 @@ def getDesiredReturn(filename):
         reader = csv.reader(f)
         reader.next()  # Header
         for row in reader:
-            raw_data.append(_stringToDecimal(row[0]))
+            raw_data.append(_stringToFloat(row[0]))
     if len(raw_data) > 1:
         raise ValueError('Should only have 2 rows, a header and a value.')
-    return float(raw_data[0])
+    return raw_data[0]
 
 
 def writeTrades(trade_factory, filename):
     """Write the desired trades to disk.
 
     Args:
-        trade_factory {TradeFactory}: The data to write.
+        trade_factory {TradeFactory}: The data to write, or a
+            RebalancePlanner's trades in order.
         filename {string}: Where to write the data.
     """
-    # TODO-implement
-    pass
+    with open(filename, 'wb') as f:
+        writer = csv.writer(f)
+        writer.writerow([
+            'Sell',
+            'Buy',
+            'Trade Percentage',
+            'New Correlation'
+        ])
+        for trade in trade_factory.trade_list:
+            writer.writerow([
+                trade.sell_ticker,
+                trade.buy_ticker,
+                trade.trade_percentage,
+                trade.new_correlation
+            ])
 
 
 def writeDesiredPortfolio(portfolio, stock_db, filename):
@@ -162,6 +266,35 @@ def writeDesiredPortfolio(portfolio, stock_db, filename):
         writer.writerows(sorted_output_data)
 
 
+def writeFrontier(required_returns, portfolios, filename):
+    """Write a summary of desired portfolios across required returns.
+
+    Args:
+        required_returns {list}: The required return of each portfolio.
+        portfolios {list}: Scored portfolios, in the same order.
+        filename {string}: Where to write the data.
+    """
+    with open(filename, 'wb') as f:
+        writer = csv.writer(f)
+        writer.writerow([
+            'Required Return',
+            'Expected Return',
+            'Downside Risk',
+            'Downside Correl',
+            'Score',
+            'Num Holdings'
+        ])
+        for required_return, portfolio in zip(required_returns, portfolios):
+            writer.writerow([
+                required_return,
+                math.pow(portfolio.average_return, Config.DAYS_IN_YEAR),
+                portfolio.downside_risk,
+                portfolio.downside_correl,
+                portfolio.score,
+                sum(1 for a in portfolio.allocation_array if a > 0)
+            ])
+
+
 def writeStockDatabase(stock_db, filename):
     """Write the database to disk.
 
@@ -190,159 +323,276 @@ def writeStockDatabase(stock_db, filename):
             writer.writerow(new_row)
 
 
-def _retrieveCache(filename):
-    """Pull data from a specific cache file.
+def _retrieveCache(ticker):
+    """Decode a ticker's data from the price store.
 
     Args:
-        filename {string}: Name of the cache file to read.
+        ticker {string}: The ticker to read.
     Returns:
-        contents {dict}: Dict of tickers to dates to prices. Each ticker also
-            has a _timestamp entry saying when it was pulled.
+        contents {dict}: Dict of the ticker to its (dates, prices, timestamp),
+            or to 'too_short' if it lacks enough data.
     """
     output = {}
-    try:
-        full_name = 'cache_files/' + filename
-        with bz2.BZ2File(full_name, 'r') as f:
-            raw_contents = f.read()
-            try:
-                contents = pickle.loads(raw_contents)
-                if contents['_timestamp'] < time() - 31 * 24 * 60 * 60:
-                    return {}
-            except KeyError:
-                raise IOError
-        for date in contents:
-            if date == '_timestamp':
-                continue
-            if datetime.datetime.strptime(date, '%Y-%m-%d') > Config.TODAY:
-                del contents[date]
-            elif contents[date] < 0.01:
-                del contents[date]
-        ticker = filename.split('.')[0]
-        output = {}
-        if len(contents.keys()) < Config.MINIMUM_AMOUNT_DATA:
-            output[ticker] = 'too_short'
-            return output
-        output[ticker] = OrderedDict(
-            sorted(contents.items(), key=lambda t: t[0]))
-    except IOError:
-        pass
+    (dates, prices) = cleanPrices(*price_store.read(ticker))
+    if dates is None:
+        output[ticker] = 'too_short'
+        return output
+    output[ticker] = (dates, prices, price_store.getTimestamp(ticker))
     return output
 
 
+def _getCachedTickers(ticker_list):
+    """Check tickers against the price store's manifest.
+
+    The first run migrates any existing cache_files pickles into the store.
+    Args:
+        ticker_list {list}: List of ticker symbols.
+    Returns:
+        cached_tickers {list}: Tickers with fresh, long enough data.
+        too_short_tickers {list}: Tickers with fresh data that is too short.
+    """
+    if not price_store.exists() and os.path.isdir('cache_files'):
+        print('Migrated %d cached tickers.' %
+              price_store.migratePickleCache('cache_files'))
+    cached_tickers = []
+    too_short_tickers = []
+    for ticker in ticker_list:
+        entry = price_store.getEntry(ticker)
+        if entry is None or entry['timestamp'] < time() - 31 * 24 * 60 * 60:
+            continue
+        if entry['num_rows'] < Config.MINIMUM_AMOUNT_DATA:
+            too_short_tickers.append(ticker)
+            continue
+        cached_tickers.append(ticker)
+    return cached_tickers, too_short_tickers
+
+
 def _retrieveCacheFiles(ticker_list):
-    """Retrieve valid cache files.
+    """Retrieve valid cached tickers from the price store.
 
+    Freshness and length are checked against the store's manifest, so only
+    tickers that pass are decoded, by Config.CACHE_LOADER.
     Returns:
-        cache_data {dict}: Dict of tickers to dates to prices. Each ticker also
-            has a _timestamp entry saying when it was pulled.
+        cache_data {dict}: Dict of tickers to (dates, prices, timestamp), where
+            timestamp says when the ticker was pulled.
     """
-    filenames = os.listdir('./cache_files')
-    # Remove any files we aren't actively looking for.
-    filenames = [filename for filename in filenames if filename.split('.')[
-        0] in ticker_list]
-    output = {}
-    pool = Pool()
-    content_dicts = pool.map(_retrieveCache, filenames, int(
-        math.ceil(math.sqrt(len(filenames)))))
-    pool.close()
+    (decode_tickers, too_short_tickers) = _getCachedTickers(ticker_list)
+    output = dict((ticker, 'too_short') for ticker in too_short_tickers)
+
+    if Config.CACHE_LOADER == 'serial' or not decode_tickers:
+        content_dicts = map(_retrieveCache, decode_tickers)
+    else:
+        if Config.CACHE_LOADER == 'process':
+            # Workers are forked with the store rather than pickling it.
+            pool = ProcessPool(Config.CACHE_LOADER_WORKERS)
+        else:
+            pool = Pool(Config.CACHE_LOADER_WORKERS)
+        content_dicts = pool.map(_retrieveCache, decode_tickers, int(
+            math.ceil(math.sqrt(len(decode_tickers)))))
+        pool.close()
+        pool.join()
     for content_dict in content_dicts:
         output.update(content_dict)
     return output
 
 
-def _storeCache(filename, cache_data):
-    """Write the cache to disk.
+def _storeCache(ticker, cache_data):
+    """Write a ticker's data to the price store.
 
     Args:
-        filename {string}: Where to write the file.
-        cache_data {dict}: What data to write.
+        ticker {string}: The ticker to write.
+        cache_data {tuple}: The ticker's (dates, prices, timestamp).
     """
-    data_pkl = pickle.dumps(cache_data)
-    with bz2.BZ2File(filename, 'wb') as f:
-        f.write(data_pkl)
+    (dates, prices, timestamp) = cache_data
+    price_store.write(ticker, dates, prices, timestamp)
 
 
-def _getAPIData(ticker_list):
+def _getAPIData(ticker_list, deadline=None):
     """Call the API to get raw price data.
 
+    Up to Config.API_CONCURRENCY tickers are fetched at once, in order and
+    sharing the rate limiter, while a background thread writes each one to the
+    cache.
     Args:
         ticker_list {list}: List of tickers we need data for.
+        deadline {float}: Time after which no more tickers are started.
     Returns:
-        cache_data {dict}: Dict of tickers to dates to prices. Each ticker also
-            has a _timestamp entry saying when it was pulled.
+        cache_data {dict}: Dict of tickers to (dates, prices, timestamp), where
+            timestamp says when the ticker was pulled.
     """
+    ticker_list = list(ticker_list)
     cache_data = {}
-    for t, ticker in enumerate(ticker_list):
-        print('Retrieving ticker %d of %d (%s)' %
-              (t + 1, len(ticker_list), ticker))
-        cache_data.update(_callApi(ticker))
-        _storeCache('cache_files/' + ticker + '.pkl.bz2', cache_data[ticker])
-        for date in cache_data[ticker]:
-            if date == '_timestamp':
+    if not ticker_list:
+        return cache_data
+    fetch_pool = Pool(Config.API_CONCURRENCY)
+    # One writer keeps the store's index updates in order.
+    write_pool = Pool(1)
+    writes = []
+    try:
+        for t, ticker_data in enumerate(fetch_pool.imap_unordered(
+                partial(_refreshTickerBefore, deadline), ticker_list)):
+            if not ticker_data:
                 continue
-            if datetime.datetime.strptime(date, '%Y-%m-%d') > Config.TODAY:
-                del cache_data[ticker][date]
-            elif cache_data[ticker][date] <= 0.01:
-                del cache_data[ticker][date]
-        if len(cache_data[ticker].keys()) < Config.MINIMUM_AMOUNT_DATA:
-            del cache_data[ticker]
+            ticker = ticker_data.keys()[0]
+            print('Retrieved ticker %d of %d (%s)' %
+                  (t + 1, len(ticker_list), ticker))
+            writes.append(write_pool.apply_async(
+                _storeCache, (ticker, ticker_data[ticker])))
+            (dates, prices, timestamp) = ticker_data[ticker]
+            (dates, prices) = cleanPrices(dates, prices)
+            if dates is not None:
+                cache_data[ticker] = (dates, prices, timestamp)
+    finally:
+        fetch_pool.close()
+        write_pool.close()
+        write_pool.join()
+    for write in writes:
+        write.get()
     return cache_data
 
 
-def _callApi(ticker):
+def _refreshTickerBefore(deadline, ticker):
+    """Refresh a ticker unless the deadline has passed.
+
+    Args:
+        deadline {float}: Time after which tickers are skipped, or None.
+        ticker {string}: The ticker to get data for.
+    Returns:
+        cache_data {dict}: As from _refreshTicker, or empty if skipped.
+    """
+    if deadline is not None and time() > deadline:
+        return {}
+    return _refreshTicker(ticker)
+
+
+def _refreshTicker(ticker):
+    """Get a ticker's full history, downloading as little as possible.
+
+    Tickers already in the price store only fetch the compact history and
+    merge it in. The full history is fetched when there is no cached history,
+    or the compact history doesn't overlap it or disagrees with it (e.g.,
+    after a split or dividend re-adjusts past closes). Either way the API is
+    called, rather than reusing a response from earlier in the process.
+    Args:
+        ticker {string}: The ticker to get data for.
+    Returns:
+        cache_data {dict}: Dict of the ticker to (dates, prices, timestamp).
+    """
+    if price_store.getTimestamp(ticker) is not None:
+        (dates, prices) = price_store.read(ticker)
+        merged_data = _mergeCompactData(
+            dates, prices,
+            _callApi(ticker, 'compact', use_local_cache=False)[ticker])
+        if merged_data is not None:
+            return {ticker: merged_data}
+    return _callApi(ticker, Config.SIZE, use_local_cache=False)
+
+
+def _mergeCompactData(dates, prices, compact_data):
+    """Append a compact API response to cached history.
+
+    Args:
+        dates {array}: Sorted datetime64[D] cached trading days.
+        prices {array}: Cached price on each day.
+        compact_data {tuple}: (dates, prices, timestamp) from the API.
+    Returns:
+        merged_data {tuple}: Merged (dates, prices, timestamp), or None if the
+            compact data doesn't overlap the cache or disagrees with it.
+    """
+    (new_dates, new_prices, timestamp) = compact_data
+    (_, cached_indices, new_indices) = np.intersect1d(
+        dates, new_dates, assume_unique=True, return_indices=True)
+    if not len(cached_indices) or not np.allclose(
+            prices[cached_indices], new_prices[new_indices],
+            rtol=Config.REFRESH_TOLERANCE, atol=0):
+        return None
+
+    kept = dates < new_dates[0]
+    return (
+        np.concatenate((dates[kept], new_dates)),
+        np.concatenate((prices[kept], new_prices)),
+        timestamp)
+
+
+def _callApi(ticker, size=Config.SIZE, use_local_cache=True):
     """Call the API for data about a single ticker.
 
     Args:
         ticker {string}: The ticker to get data for.
+        size {string}: 'compact' for the last 100 days, or 'full'.
+        use_local_cache {boolean}: Whether to reuse and keep responses from
+            earlier in the process.
     Returns:
-        cache_data {dict}: Dict of tickers to dates to prices. Each ticker also
-            has a _timestamp entry saying when it was pulled.
+        cache_data {dict}: Dict of the ticker to (dates, prices, timestamp),
+            where timestamp says when it was pulled.
     """
-    global last_request_time
     global local_cache
-    if ticker in local_cache:
-        return local_cache[ticker]
-    result = {}
+    if use_local_cache and (ticker, size) in local_cache:
+        return local_cache[(ticker, size)]
+    time_series = None
     # Track the number of 503s in case the server is down for an extended period.
     count_503s = 0
     attempts = 0
-    while 'Time Series (Daily)' not in result and attempts < 120:
+    while time_series is None and attempts < Config.API_MAX_ATTEMPTS:
         attempts += 1
-        sleep(max(
-            0,
-            Config.MIN_TIME_BETWEEN_CALLS - (time() - last_request_time)))
-        raw_result = requests.get(Config.BASE_REQUEST + ticker)
-        last_request_time = time()
-        try:
-            if raw_result.status_code == 503:
-                count_503s += 1
-                if count_503s >= 60:
-                    raise IOError('Too many 503s from API.')
-                continue
-            result = raw_result.json()
-        except ValueError as e:
-            print(raw_result)
-            raise e
-
-    if attempts >= 120:
+        rate_limiter.acquire()
+        raw_result = requests.get(Config.BASE_REQUEST % size + ticker)
+        if raw_result.status_code == 503:
+            count_503s += 1
+            if count_503s >= Config.API_MAX_503S:
+                raise IOError('Too many 503s from API.')
+            sleep(min(
+                Config.API_MAX_BACKOFF,
+                Config.API_BACKOFF * 2 ** (count_503s - 1)))
+            continue
+        time_series = _parseTimeSeries(raw_result.content)
+
+    if time_series is None:
         raise IOError('Could not get ticker %s' % ticker)
 
-    # Extract the date-price pairs.
-    data = {}
-    for date in result['Time Series (Daily)']:
-        data[date] = _stringToDecimal(
-            result['Time Series (Daily)'][date]['5. adjusted close'])
+    cache_data = {ticker: time_series + (time(),)}
 
-    # Convert the date-dict to an ordered one.
-    ordered_date_dict = OrderedDict(sorted(data.items(), key=lambda t: t[0]))
-    cache_data = {ticker: ordered_date_dict}
-    cache_data[ticker].update({'_timestamp': time()})
-
-    local_cache[ticker] = cache_data
+    if use_local_cache:
+        local_cache[(ticker, size)] = cache_data
 
     return cache_data
 
 
+def _parseTimeSeries(text):
+    """Parse a daily adjusted API response straight into arrays.
+
+    The adjusted closes are pulled out of the raw JSON text in one pass, so no
+    per-day dicts or Decimals are built.
+    Args:
+        text {string}: Body of a TIME_SERIES_DAILY_ADJUSTED response.
+    Returns:
+        time_series {tuple}: Sorted datetime64[D] dates and float64 adjusted
+            closes, or None if the response has no time series.
+    """
+    if '"Time Series (Daily)"' not in text:
+        return None
+    pairs = np.array(_ADJUSTED_CLOSE_PATTERN.findall(text), dtype=str)
+    if not len(pairs):
+        return (np.array([], dtype='M8[D]'), np.array([], dtype=np.float64))
+    dates = pairs[:, 0].astype('M8[D]')
+    order = np.argsort(dates)
+    return (dates[order], pairs[order, 1].astype(np.float64))
+
+
+def _stringToFloat(string_number):
+    """Convert a number formatted as a string (e.g., 0.04%) to a float.
+
+    Args:
+        string_number {string}: A number formatted as a string, e.g., "0.04%"
+    Returns:
+        amount {float}: The number converted to a float.
+    """
+    raw_amount = float(sub(r'[^\d\.\-]', '', string_number))
+    if string_number.endswith('%'):
+        raw_amount /= 100.0
+    return raw_amount
+
+
 def _stringToDecimal(string_money):
     """Convert money formatted as a string (e.g., -$170,000) to a Decminal
 
@@ -0,0 +1,175 @@
+import hashlib
+import json
+import numpy as np
+import os
+import shutil
+import tempfile
+
+import Config
+from Stock import EPOCH, Stock
+from StockDatabase import StockDatabase
+
+# Bump when the stored arrays, or how they are derived, change.
+FORMAT_VERSION = 1
+
+# Per-stock values stored alongside the arrays.
+STATS_DTYPE = np.dtype([
+    ('expense_ratio', '<f8'),
+    ('mean_annual_return', '<f8'),
+    ('st_dev_annual_return', '<f8'),
+    ('cons_annual_return', '<f8'),
+    ('log_return_sum', '<f8'),
+    ('return_mean', '<f8'),
+    ('return_squares', '<f8')])
+
+_ARRAY_NAMES = (
+    'dates', 'price_array', 'price_change_array', 'series_ordinals',
+    'series_prices', 'series_lengths', 'stats')
+
+
+class DatabaseCache(object):
+    """Content-addressed cache of built StockDatabases.
+
+    Building a database from the price store cleans, aligns and scores every
+    ticker, but gives the same result whenever its inputs are the same. Each
+    built database is saved as .npy files in a directory named by a hash of
+    those inputs, and loaded by memory mapping them, so a repeat run costs
+    little more than hashing the price store's manifest.
+    """
+
+    def __init__(self, directory='database_cache', max_entries=None):
+        """Initialize the cache.
+
+        Args:
+            directory {string}: Where the cache lives.
+            max_entries {int}: Most databases to keep,
+                Config.DATABASE_CACHE_ENTRIES by default.
+        """
+        if max_entries is None:
+            max_entries = Config.DATABASE_CACHE_ENTRIES
+        self._directory = directory
+        self._max_entries = max_entries
+
+    def getKey(self, expense_ratio_dict, entry_dict):
+        """Hash everything a built database depends on.
+
+        Prices are identified by their row counts and checksums rather than
+            when they were pulled, so refreshing a ticker to the same prices
+            keeps the key.
+        Args:
+            expense_ratio_dict {dict}: Dict of tickers to expense ratios.
+            entry_dict {dict}: Dict of the tickers to build with to their
+                price store manifest entries.
+        Returns:
+            key {string}: Hex digest naming the database.
+        """
+        inputs = {
+            'version': FORMAT_VERSION,
+            'today': str(Config.TODAY.date()),
+            'minimum_amount_data': Config.MINIMUM_AMOUNT_DATA,
+            'days_in_year': Config.DAYS_IN_YEAR,
+            'initial_percentile': Config.INITIAL_PERCENTILE,
+            'tickers': [
+                [ticker, repr(float(expense_ratio_dict[ticker])),
+                 entry_dict[ticker]['num_rows'],
+                 entry_dict[ticker]['checksum']]
+                for ticker in sorted(entry_dict)]
+        }
+        return hashlib.sha1(json.dumps(inputs, sort_keys=True)).hexdigest()
+
+    def load(self, key):
+        """Load a database, memory mapped copy-on-write.
+
+        Args:
+            key {string}: The database's key.
+        Returns:
+            stock_db {StockDatabase}: The database, or None if not cached.
+        """
+        directory = os.path.join(self._directory, key)
+        try:
+            with open(os.path.join(directory, 'tickers.json'), 'r') as f:
+                tickers = [str(ticker) for ticker in json.load(f)]
+            arrays = dict(
+                (name, np.load(os.path.join(directory, name + '.npy'),
+                               mmap_mode='c'))
+                for name in _ARRAY_NAMES)
+        except (IOError, ValueError):
+            return None
+        # Touch the entry so pruning drops the least recently used.
+        os.utime(directory, None)
+
+        ends = np.cumsum(arrays['series_lengths'])
+        stock_dict = {}
+        price_series = {}
+        for i, ticker in enumerate(tickers):
+            start = ends[i] - arrays['series_lengths'][i]
+            ordinals = arrays['series_ordinals'][start:ends[i]]
+            prices = arrays['series_prices'][start:ends[i]]
+            stats = arrays['stats'][i]
+            stock = Stock.__new__(Stock)
+            stock._setArrays(
+                ordinals, prices, ticker, float(stats['expense_ratio']))
+            stock._mean_annual_return = stats['mean_annual_return']
+            stock._st_dev_annual_return = stats['st_dev_annual_return']
+            stock.cons_annual_return = stats['cons_annual_return']
+            stock._log_return_sum = stats['log_return_sum']
+            stock._return_mean = stats['return_mean']
+            stock._return_squares = stats['return_squares']
+            stock_dict[ticker] = stock
+            price_series[ticker] = (EPOCH + ordinals, prices)
+        return StockDatabase.fromArrays(
+            stock_dict, price_series, arrays['dates'],
+            arrays['price_array'], arrays['price_change_array'])
+
+    def save(self, key, stock_db):
+        """Atomically save a database, pruning the least recently used.
+
+        Args:
+            key {string}: The database's key.
+            stock_db {StockDatabase}: The database to save.
+        """
+        if not os.path.isdir(self._directory):
+            os.makedirs(self._directory)
+        tickers = stock_db.tickers
+        series = [stock_db._price_series[ticker] for ticker in tickers]
+        stats = np.empty(len(tickers), dtype=STATS_DTYPE)
+        for i, ticker in enumerate(tickers):
+            stock = stock_db.stock_dict[ticker]
+            stats[i] = (
+                float(stock.expense_ratio), stock._mean_annual_return,
+                stock._st_dev_annual_return, stock.cons_annual_return,
+                stock._log_return_sum, stock._return_mean,
+                stock._return_squares)
+        arrays = {
+            'dates': stock_db.dates,
+            'price_array': stock_db.price_array,
+            'price_change_array': stock_db.price_change_array,
+            'series_ordinals': np.concatenate(
+                [np.zeros(0, dtype=np.int32)]
+                + [(dates - EPOCH).astype(np.int32) for (dates, _) in series]),
+            'series_prices': np.concatenate(
+                [np.zeros(0)] + [prices for (_, prices) in series]),
+            'series_lengths': np.array(
+                [len(dates) for (dates, _) in series], dtype=np.int64),
+            'stats': stats
+        }
+
+        temp_directory = tempfile.mkdtemp(dir=self._directory)
+        with open(os.path.join(temp_directory, 'tickers.json'), 'w') as f:
+            json.dump(tickers, f)
+        for name in _ARRAY_NAMES:
+            np.save(os.path.join(temp_directory, name + '.npy'), arrays[name])
+        directory = os.path.join(self._directory, key)
+        if os.path.isdir(directory):
+            shutil.rmtree(directory)
+        os.rename(temp_directory, directory)
+        self._prune()
+
+    def _prune(self):
+        """Remove all but the most recently used databases."""
+        directories = [
+            os.path.join(self._directory, name)
+            for name in os.listdir(self._directory)]
+        directories.sort(key=os.path.getmtime, reverse=True)
+        for directory in directories[self._max_entries:]:
+            shutil.rmtree(directory, ignore_errors=True)
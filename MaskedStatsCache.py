@@ -0,0 +1,213 @@
+import numpy as np
+from scipy.sparse import csr_matrix
+
+import Config
+
+
+class MaskedStatsCache(object):
+    """Caches masked price change statistics for downside correlation.
+
+    Neighboring candidates in a solve mostly share the same set of dates
+    below the required return. This keeps the count, per-ticker sums, sums of
+    squares, and the cross-products with the held tickers for one base mask,
+    so a candidate's downside correlation only costs the dates that flipped
+    in or out of the mask plus its held tickers.
+    """
+
+    def __init__(self, price_change_array, max_flips=None):
+        """Initialize the cache.
+
+        Args:
+            price_change_array {array}: Rows = Dates, Columns = Tickers.
+            max_flips {int}: Most dates a candidate's mask may differ from the
+                base mask by before its statistics are computed directly.
+        """
+        # Rows are centered as they are used so the sums of squares don't
+        # lose precision, without a private copy of a mapped array.
+        self._price_changes = np.asarray(price_change_array, dtype=np.float64)
+        self._means = self._price_changes.mean(axis=0)
+        if max_flips is None:
+            max_flips = max(1, len(self._price_changes) // 4)
+        self._max_flips = max_flips
+
+        self._key = None
+        self._mask = None
+        self._count = None
+        self._sums = None
+        self._squares = None
+        self._support = None
+        self._cross_products = None
+
+    def rebase(self, portfolio, required_return):
+        """Make a portfolio's below required dates the base mask.
+
+        Rebasing to the same mask and held tickers is a no-op.
+        Args:
+            portfolio {Portfolio}: Portfolio whose mask and holdings to use.
+            required_return {float}: The required level of return per year.
+        """
+        required_return = np.power(required_return, 1.0 / Config.DAYS_IN_YEAR)
+        mask = portfolio.backtested_returns < required_return
+        support = np.flatnonzero(portfolio.allocation_array)
+        key = (mask.tostring(), support.tostring())
+        if key == self._key:
+            return
+
+        masked_price_changes = self._price_changes[mask] - self._means
+        self._key = key
+        self._mask = mask
+        self._count = np.count_nonzero(mask)
+        self._sums = masked_price_changes.sum(axis=0)
+        self._squares = (masked_price_changes * masked_price_changes).sum(
+            axis=0)
+        self._support = support
+        # Rows = Tickers, Columns = Held tickers.
+        self._cross_products = np.matmul(
+            masked_price_changes.T, masked_price_changes[:, support])
+
+    def getDownsideCorrels(
+            self, allocation_matrix, returns_matrix, required_return):
+        """Calculate downside correlations for candidates near the base.
+
+        Candidates holding the base tickers plus at most one other, whose
+            masks differ from the base by at most max_flips dates, are updated
+            from the cache. Any others are computed directly.
+        Args:
+            allocation_matrix {array}: Rows = Candidates, Columns = Tickers.
+            returns_matrix {array}: Rows = Dates, Columns = Candidates.
+            required_return {float}: The de-annualized required return.
+        Returns:
+            downside_correls {array}: Downside correlation of each candidate.
+        """
+        below_desired = returns_matrix < required_return
+        downside_correls = np.empty(len(allocation_matrix))
+        cached = np.zeros(len(allocation_matrix), dtype=bool)
+        if self._mask is not None:
+            flipped = below_desired != self._mask[:, None]
+            other_holdings = allocation_matrix != 0
+            other_holdings[:, self._support] = False
+            cached = (
+                (flipped.sum(axis=0) <= self._max_flips)
+                & (other_holdings.sum(axis=1) <= 1))
+            if cached.any():
+                downside_correls[cached] = self._getUpdatedDownsideCorrels(
+                    allocation_matrix[cached], below_desired[:, cached],
+                    flipped[:, cached], other_holdings[cached])
+        for k in np.flatnonzero(~cached):
+            downside_correls[k] = self._getDirectDownsideCorrel(
+                allocation_matrix[k], below_desired[:, k])
+        return downside_correls
+
+    def _getUpdatedDownsideCorrels(
+            self, allocation_matrix, below_desired, flipped, other_holdings):
+        """Update the base statistics by each candidate's flipped dates.
+
+        Args:
+            allocation_matrix {array}: Rows = Candidates, Columns = Tickers.
+            below_desired {array}: Rows = Dates, Columns = Candidates.
+            flipped {array}: Rows = Dates, Columns = Candidates, True where a
+                candidate's mask differs from the base.
+            other_holdings {array}: Rows = Candidates, Columns = Tickers,
+                True for held tickers outside the base support.
+        Returns:
+            downside_correls {array}: Downside correlation of each candidate.
+        """
+        num_candidates = len(allocation_matrix)
+        candidates = np.arange(num_candidates)
+        support = self._support
+        # At most one other ticker per candidate, weight 0 if there is none.
+        others = np.argmax(other_holdings, axis=1)
+        other_weights = np.where(
+            other_holdings[candidates, others],
+            allocation_matrix[candidates, others], 0.0)
+        support_weights = allocation_matrix[:, support]
+
+        # Signed flipped dates: +1 entering the mask, -1 leaving it.
+        (dates, flip_candidates) = np.nonzero(flipped)
+        signs = np.where(below_desired[dates, flip_candidates], 1.0, -1.0)
+        flips = csr_matrix(
+            (signs, (flip_candidates, dates)),
+            shape=(num_candidates, len(self._mask)))
+        counts = self._count + np.bincount(
+            flip_candidates, weights=signs, minlength=num_candidates)
+        support_changes = (
+            self._price_changes[:, support] - self._means[support])
+        support_sums = self._sums[support] + flips.dot(support_changes)
+        support_squares = self._squares[support] + flips.dot(
+            support_changes * support_changes)
+        flip_changes = (
+            self._price_changes[dates, others[flip_candidates]]
+            - self._means[others[flip_candidates]])
+        other_sums = self._sums[others] + np.bincount(
+            flip_candidates, weights=signs * flip_changes,
+            minlength=num_candidates)
+        other_squares = self._squares[others] + np.bincount(
+            flip_candidates, weights=signs * flip_changes * flip_changes,
+            minlength=num_candidates)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            support_means = support_sums / counts[:, None]
+            other_means = other_sums / counts
+            support_weights = np.where(
+                support_weights != 0,
+                support_weights / np.sqrt(
+                    support_squares / counts[:, None]
+                    - support_means * support_means),
+                0.0)
+            other_weights = np.where(
+                other_weights != 0,
+                other_weights / np.sqrt(
+                    other_squares / counts - other_means * other_means),
+                0.0)
+
+            # Sum of squared projections over the base mask, from the cached
+            # cross-products...
+            projection_squares = (
+                (np.matmul(support_weights, self._cross_products[support])
+                 * support_weights).sum(axis=1)
+                + 2.0 * other_weights * (
+                    self._cross_products[others] * support_weights).sum(
+                        axis=1)
+                + other_weights * other_weights * self._squares[others])
+            # ...then corrected by the flipped dates.
+            flip_projections = (
+                (support_changes[dates]
+                 * support_weights[flip_candidates]).sum(axis=1)
+                + flip_changes * other_weights[flip_candidates])
+            projection_squares += np.bincount(
+                flip_candidates,
+                weights=signs * flip_projections * flip_projections,
+                minlength=num_candidates)
+
+            projection_means = (
+                (support_weights * support_means).sum(axis=1)
+                + other_weights * other_means)
+            return (
+                projection_squares / counts
+                - projection_means * projection_means)
+
+    def _getDirectDownsideCorrel(self, allocation_array, mask):
+        """Calculate one candidate's downside correlation from its own mask.
+
+        Args:
+            allocation_array {array}: Percent allocations of the candidate.
+            mask {array}: Whether each date is below the required return.
+        Returns:
+            downside_correl {float}: Downside correlation of the candidate.
+        """
+        support = np.flatnonzero(allocation_array)
+        price_changes = self._price_changes[np.ix_(
+            np.flatnonzero(mask), support)] - self._means[support]
+        count = len(price_changes)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = price_changes.sum(axis=0) / count
+            variances = (
+                (price_changes * price_changes).sum(axis=0) / count
+                - means * means)
+            projections = np.matmul(
+                price_changes,
+                allocation_array[support] / np.sqrt(variances))
+            projection_mean = projections.sum() / count
+            return (
+                np.dot(projections, projections) / count
+                - projection_mean * projection_mean)
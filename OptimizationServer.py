@@ -0,0 +1,333 @@
+"""Long-running server that keeps a StockDatabase resident.
+
+Requests are JSON POSTs to localhost:
+    /optimize: {"required_return": 1.05, "solver": "binary", ...}
+    /score: {"allocations": {"VTI": 0.6, "BND": 0.4}, "required_return": 1.05}
+    /trades: {"allocations": {...}} writes Trades.csv and RebalancePlan.csv.
+GET /status describes the resident database.
+"""
+
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+import datetime
+import json
+import math
+from Queue import Queue
+from SocketServer import ThreadingMixIn
+import threading
+import traceback
+
+import Config
+import DataIO
+from Portfolio import Portfolio
+from PortfolioFactory import PortfolioFactory
+from RebalancePlanner import RebalancePlanner
+from RefreshScheduler import RefreshScheduler
+from TradeFactory import TradeFactory
+
+# Request parameters passed through to PortfolioFactory. Its worker
+# processes aren't, as forking from a threaded server isn't safe.
+_SOLVER_ARGS = (
+    'solver', 'use_genetic', 'max_time', 'max_evaluations', 'polish')
+
+
+class OptimizationServer(ThreadingMixIn, HTTPServer):
+    """Threaded HTTP server answering requests from a resident database.
+
+    Each request is queued for a pool of worker threads, which share the
+    database. A background thread refreshes the stalest tickers every
+    refresh_interval seconds and appends their new days to the database in
+    place, waiting for running requests to finish first.
+    """
+    daemon_threads = True
+
+    def __init__(self, stock_db, current_alloc_dict, port=None,
+                 num_workers=None, refresh_interval=None,
+                 trades_filename='data/Trades.csv',
+                 plan_filename='data/RebalancePlan.csv',
+                 important_tickers=None):
+        """Start serving on a localhost port.
+
+        Args:
+            stock_db {StockDatabase}: The database to keep resident.
+            current_alloc_dict {dict}: Dict of tickers to current percentage
+                allocations.
+            port {int}: Port to serve on, Config.SERVER_PORT by default, or 0
+                for a free one.
+            num_workers {int}: Requests to work on at once,
+                Config.SERVER_WORKERS by default.
+            refresh_interval {float}: Seconds between refreshes,
+                Config.SERVER_REFRESH_INTERVAL by default, or 0 for none.
+            trades_filename {string}: Where trades requests write trades.
+            plan_filename {string}: Where trades requests write the plan.
+            important_tickers {iterable}: Tickers to refresh sooner, the held
+                ones by default.
+        """
+        if port is None:
+            port = Config.SERVER_PORT
+        if num_workers is None:
+            num_workers = Config.SERVER_WORKERS
+        if refresh_interval is None:
+            refresh_interval = Config.SERVER_REFRESH_INTERVAL
+        if important_tickers is None:
+            important_tickers = current_alloc_dict.keys()
+        HTTPServer.__init__(self, ('127.0.0.1', port), _OptimizationHandler)
+        self.stock_db = stock_db
+        self._current_alloc_dict = current_alloc_dict
+        self._trades_filename = trades_filename
+        self._plan_filename = plan_filename
+        self._lock = _ReadWriteLock()
+        self._queue = Queue()
+        self.num_refreshed = 0
+
+        self._threads = []
+        for _ in xrange(num_workers):
+            self._startThread(self._work)
+        self._scheduler = None
+        if refresh_interval:
+            # The scheduler re-reads the tickers, as they may change.
+            self._scheduler = RefreshScheduler(
+                DataIO.price_store, important_tickers)
+            self._scheduler.start(
+                self.stock_db.tickers, self._refresh,
+                Config.REFRESH_MAX_CALLS, refresh_interval)
+
+    def submit(self, action, request):
+        """Queue a request and wait for a worker to answer it.
+
+        Args:
+            action {string}: One of 'optimize', 'score', 'trades', 'status'.
+            request {dict}: The request's parameters.
+        Returns:
+            status {int}: HTTP status code.
+            response {dict}: The answer, or an 'error' message.
+        """
+        response_queue = Queue(1)
+        self._queue.put((action, request, response_queue))
+        return response_queue.get()
+
+    def applyPrices(self, price_dict):
+        """Append new prices to the resident database.
+
+        Histories that were re-adjusted rather than extended only take effect
+            after a restart, as appendPrices ignores days it already has.
+        Args:
+            price_dict {dict}: Dict of tickers to sorted (dates, prices).
+        Returns:
+            num_dates {int}: Number of days added.
+        """
+        price_dict = dict(
+            (ticker, prices) for ticker, prices in price_dict.iteritems()
+            if ticker in self.stock_db.stock_dict)
+        self._lock.acquireWrite()
+        try:
+            num_dates = self.stock_db.appendPrices(price_dict)
+            self.num_refreshed += len(price_dict)
+        finally:
+            self._lock.releaseWrite()
+        return num_dates
+
+    def stop(self):
+        """Stop serving, finishing queued requests first."""
+        if self._scheduler is not None:
+            self._scheduler.stop()
+        for _ in self._threads:
+            self._queue.put(None)
+        self.shutdown()
+        self.server_close()
+        for thread in self._threads:
+            thread.join()
+
+    def _startThread(self, target):
+        thread = threading.Thread(target=target)
+        thread.daemon = True
+        thread.start()
+        self._threads.append(thread)
+
+    def _work(self):
+        """Answer queued requests until stopped."""
+        actions = {
+            'optimize': self._optimize,
+            'score': self._score,
+            'trades': self._trades,
+            'status': self._status
+        }
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            (action, request, response_queue) = job
+            self._lock.acquireRead()
+            try:
+                response = (200, actions[action](request))
+            except (KeyError, TypeError, ValueError) as e:
+                response = (400, {'error': '%s: %s' % (
+                    e.__class__.__name__, e)})
+            except Exception as e:
+                # Keep the worker alive for the next request.
+                traceback.print_exc()
+                response = (500, {'error': '%s: %s' % (
+                    e.__class__.__name__, e)})
+            finally:
+                self._lock.releaseRead()
+            response_queue.put(response)
+
+    def _refresh(self, refresh_list):
+        """Refresh tickers from the API and append their new days.
+
+        Args:
+            refresh_list {list}: Tickers to refresh, as picked by the
+                scheduler each refresh interval.
+        """
+        # Days after the one the server started on are no longer future.
+        Config.TODAY = datetime.datetime.today()
+        cache_data = DataIO._getAPIData(refresh_list)
+        num_dates = self.applyPrices(dict(
+            (ticker, (dates, prices))
+            for ticker, (dates, prices, _) in cache_data.iteritems()))
+        print('Refreshed %d tickers, adding %d days.' % (
+            len(cache_data), num_dates))
+
+    def _optimize(self, request):
+        solver_args = dict(
+            (name, request[name]) for name in _SOLVER_ARGS if name in request)
+        portfolio = PortfolioFactory(
+            self.stock_db, float(request['required_return']),
+            **solver_args).desired_portfolio
+        if request.get('write'):
+            DataIO.writeDesiredPortfolio(
+                portfolio, self.stock_db,
+                'output/DesiredPortfolio_%.0f_%.4f_%s.csv' % (
+                    Config.MINIMUM_AMOUNT_DATA,
+                    float(request['required_return']), Config.TODAY.date()))
+        return self._describe(portfolio)
+
+    def _score(self, request):
+        portfolio = self._getPortfolio(request['allocations'])
+        portfolio.getScore(float(request['required_return']))
+        return self._describe(portfolio)
+
+    def _trades(self, request):
+        current_portfolio = self._getPortfolio(self._current_alloc_dict)
+        desired_portfolio = self._getPortfolio(request['allocations'])
+        DataIO.writeTrades(
+            TradeFactory(current_portfolio, desired_portfolio),
+            self._trades_filename)
+        planner = RebalancePlanner(current_portfolio, desired_portfolio)
+        DataIO.writeTrades(planner, self._plan_filename)
+        return {
+            'correlation': float(planner.correlation),
+            'trades': [
+                {'sell': trade.sell_ticker, 'buy': trade.buy_ticker,
+                 'trade_percentage': float(trade.trade_percentage),
+                 'new_correlation': float(trade.new_correlation)}
+                for trade in planner.trade_list]
+        }
+
+    def _status(self, request):
+        return {
+            'num_tickers': len(self.stock_db.tickers),
+            'num_dates': len(self.stock_db.dates),
+            'last_date': str(self.stock_db.dates[-1])
+            if len(self.stock_db.dates) else None,
+            'num_refreshed': self.num_refreshed
+        }
+
+    def _getPortfolio(self, alloc_dict):
+        """Build a portfolio of the resident database from allocations.
+
+        Args:
+            alloc_dict {dict}: Dict of tickers to percentage allocations.
+        Returns:
+            portfolio {Portfolio}: The portfolio.
+        """
+        unknown_tickers = set(alloc_dict).difference(self.stock_db.stock_dict)
+        if unknown_tickers:
+            raise ValueError(
+                'Unknown tickers %s.' % ', '.join(sorted(unknown_tickers)))
+        return Portfolio(
+            self.stock_db, percent_allocations_dict=dict(
+                (ticker, float(allocation))
+                for ticker, allocation in alloc_dict.iteritems()))
+
+    def _describe(self, portfolio):
+        """Describe a scored portfolio as JSON values."""
+        return {
+            'allocations': dict(
+                (ticker, float(allocation)) for ticker, allocation in zip(
+                    self.stock_db.tickers, portfolio.allocation_array)
+                if allocation > 0),
+            'expected_return': math.pow(
+                portfolio.average_return, Config.DAYS_IN_YEAR),
+            'downside_risk': float(portfolio.downside_risk),
+            'downside_correl': float(portfolio.downside_correl),
+            'score': float(portfolio.score)
+        }
+
+
+class _OptimizationHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path != '/status':
+            self._respond(404, {'error': 'Unknown path %s.' % self.path})
+            return
+        self._respond(*self.server.submit('status', {}))
+
+    def do_POST(self):
+        action = self.path.strip('/')
+        if action not in ('optimize', 'score', 'trades'):
+            self._respond(404, {'error': 'Unknown path %s.' % self.path})
+            return
+        try:
+            request = json.loads(self.rfile.read(
+                int(self.headers.getheader('Content-Length', 0))) or '{}')
+        except ValueError as e:
+            self._respond(400, {'error': 'Invalid JSON: %s' % e})
+            return
+        self._respond(*self.server.submit(action, request))
+
+    def _respond(self, status, response):
+        body = json.dumps(response)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class _ReadWriteLock(object):
+    """Lets many requests read the database, or one refresh update it."""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._num_readers = 0
+        self._num_writers_waiting = 0
+        self._writing = False
+
+    def acquireRead(self):
+        with self._condition:
+            # Waiting writers go first so refreshes aren't starved.
+            while self._writing or self._num_writers_waiting:
+                self._condition.wait()
+            self._num_readers += 1
+
+    def releaseRead(self):
+        with self._condition:
+            self._num_readers -= 1
+            if not self._num_readers:
+                self._condition.notify_all()
+
+    def acquireWrite(self):
+        with self._condition:
+            self._num_writers_waiting += 1
+            while self._writing or self._num_readers:
+                self._condition.wait()
+            self._num_writers_waiting -= 1
+            self._writing = True
+
+    def releaseWrite(self):
+        with self._condition:
+            self._writing = False
+            self._condition.notify_all()
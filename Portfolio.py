@@ -91,24 +91,14 @@ class Portfolio(object):
         """
 
         # Determine downside_risk.
-        returns = np.copy(self.backtested_returns)
-        returns -= required_return
-        returns = np.clip(returns, None, 0)
-        returns *= returns
-        downside_risk = np.sqrt(np.sum(returns) / returns.size)
+        downside_risk = _getDownsideRisk(
+            self.backtested_returns, required_return)
         self.downside_risk = downside_risk
 
         # Determine downside_correl.
-        returns = np.copy(self.backtested_returns)
-        below_desired = returns < required_return
-        filtered_returns = [
-            self._stock_db.price_change_array[x]
-            for x in xrange(len(below_desired)) if below_desired[x]]
-        downside_correl = np.matmul(
-            np.matmul(
-                self.allocation_array,
-                np.corrcoef(filtered_returns, rowvar=False)),
-            self.allocation_array)
+        downside_correl = _getDownsideCorrel(
+            self._stock_db.price_change_array, self.allocation_array,
+            self.backtested_returns, required_return)
         self.downside_correl = downside_correl
 
         # Determine score.
@@ -117,3 +107,254 @@ class Portfolio(object):
             / (downside_risk * downside_correl))
         self.score = score
         return score
+
+    def getScoreGradient(self, required_return):
+        """Calculate the gradient of the score with respect to allocations.
+
+        The dates below the required return are held fixed, which is exact
+            everywhere except where a date's return crosses it. Tickers with
+            no variance on those dates get a zero gradient.
+        Args:
+            required_return {float}: The required level of return per year.
+        Returns:
+            gradient {array}: Partial derivative of getScore for each ticker.
+        """
+        score = self.getScore(required_return)
+        required_return = np.power(required_return, 1.0 / Config.DAYS_IN_YEAR)
+        price_changes = np.asarray(
+            self._stock_db.price_change_array, dtype=np.float64)
+        returns = self.backtested_returns
+        num_dates = len(returns)
+
+        # Geometric mean: d/dw exp(mean(log(X * w))).
+        average_gradient = self.average_return * np.matmul(
+            1.0 / returns, price_changes) / num_dates
+
+        # Downside risk: d/dw sqrt(mean(min(X * w - required, 0) ** 2)).
+        shortfalls = np.clip(returns - required_return, None, 0)
+        risk_gradient = np.matmul(shortfalls, price_changes) / (
+            num_dates * self.downside_risk)
+
+        # Downside correlation: the variance of y = X_masked * (w / std),
+        # with X_masked centered on its masked means.
+        masked_changes = price_changes[returns < required_return]
+        num_masked = len(masked_changes)
+        masked_changes = masked_changes - masked_changes.mean(axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            inverse_stds = 1.0 / np.sqrt(
+                (masked_changes * masked_changes).mean(axis=0))
+            inverse_stds[~np.isfinite(inverse_stds)] = 0.0
+        projections = np.matmul(
+            masked_changes, self.allocation_array * inverse_stds)
+        correl_gradient = 2.0 * np.matmul(
+            projections, masked_changes) * inverse_stds / num_masked
+
+        # Quotient rule on (average - required) / (risk * correl).
+        return (
+            average_gradient
+            - score * (
+                risk_gradient * self.downside_correl
+                + self.downside_risk * correl_gradient)
+        ) / (self.downside_risk * self.downside_correl)
+
+    def getTradeScore(self, required_return, sell, buy, trade_amount):
+        """Calculate the score this portfolio would have after a single trade.
+
+        Moving trade_amount from sell to buy changes each backtested return by
+            trade_amount * (price_change[buy] - price_change[sell]), so the
+            new returns are built from the current ones and two column views
+            instead of a full matmul over every ticker. This portfolio is not
+            modified.
+        Args:
+            required_return {float}: The required level of return per year.
+            sell {int}: Index of the ticker to sell.
+            buy {int}: Index of the ticker to buy.
+            trade_amount {float}: Percent allocation to move from sell to buy.
+        Returns:
+            score {float}: The modified Sortino Ratio after the trade.
+        """
+        scores = self.getTradeScores(
+            required_return, [sell], [buy], [trade_amount])[0]
+        return scores[0]
+
+    def getTradeScores(
+            self, required_return, sells, buys, trade_amounts,
+            stats_cache=None):
+        """Calculate the scores of many single trades from this portfolio.
+
+        Vectorized form of getTradeScore: candidate k moves trade_amounts[k]
+            from sells[k] to buys[k]. This portfolio is not modified.
+        Args:
+            required_return {float}: The required level of return per year.
+            sells {list}: Index of the ticker to sell, per candidate.
+            buys {list}: Index of the ticker to buy, per candidate.
+            trade_amounts {list}: Percent allocation to move, per candidate.
+            stats_cache {MaskedStatsCache}: Optional cache of masked
+                statistics near this portfolio's downside mask.
+        Returns:
+            scores {array}: The modified Sortino Ratio of each candidate.
+            average_returns {array}: Geometric mean return of each candidate.
+            downside_risks {array}: Downside risk of each candidate.
+            downside_correls {array}: Downside correlation of each candidate.
+        """
+        sells = np.asarray(sells, dtype=np.intp)
+        buys = np.asarray(buys, dtype=np.intp)
+        trade_amounts = np.asarray(trade_amounts, dtype=np.float64)
+        price_change_array = self._stock_db.price_change_array
+
+        returns_matrix = self.backtested_returns[:, None] + trade_amounts * (
+            price_change_array[:, buys] - price_change_array[:, sells])
+        allocation_matrix = np.tile(self.allocation_array, (len(sells), 1))
+        candidates = np.arange(len(sells))
+        allocation_matrix[candidates, sells] -= trade_amounts
+        allocation_matrix[candidates, buys] += trade_amounts
+
+        return _getBatchScores(
+            price_change_array, allocation_matrix, returns_matrix,
+            required_return, stats_cache)
+
+
+def getBatchScores(
+        stock_db, allocation_matrix, required_return, stats_cache=None):
+    """Calculate the scores of many portfolios at once.
+
+    All backtested returns come from a single T x N by N x K matmul, and the
+        average return and downside risk are computed column-wise over the
+        result.
+    Args:
+        stock_db {StockDatabase}: Database of necessary information.
+        allocation_matrix {array}: Rows = Candidates, Columns = Tickers.
+        required_return {float}: The required level of return per year.
+        stats_cache {MaskedStatsCache}: Optional cache of masked statistics.
+    Returns:
+        scores {array}: The modified Sortino Ratio of each candidate.
+        average_returns {array}: Geometric mean return of each candidate.
+        downside_risks {array}: Downside risk of each candidate.
+        downside_correls {array}: Downside correlation of each candidate.
+    """
+    allocation_matrix = np.asarray(allocation_matrix, dtype=np.float64)
+    returns_matrix = np.matmul(
+        stock_db.price_change_array, allocation_matrix.T)
+    return _getBatchScores(
+        stock_db.price_change_array, allocation_matrix, returns_matrix,
+        required_return, stats_cache)
+
+
+def _getBatchScores(
+        price_change_array, allocation_matrix, returns_matrix,
+        required_return, stats_cache=None):
+    """Score candidates whose backtested returns are already known.
+
+    Args:
+        price_change_array {array}: Rows = Dates, Columns = Tickers.
+        allocation_matrix {array}: Rows = Candidates, Columns = Tickers.
+        returns_matrix {array}: Rows = Dates, Columns = Candidates.
+        required_return {float}: The required level of return per year.
+        stats_cache {MaskedStatsCache}: Optional cache of masked statistics.
+    Returns:
+        scores {array}: The modified Sortino Ratio of each candidate.
+        average_returns {array}: Geometric mean return of each candidate.
+        downside_risks {array}: Downside risk of each candidate.
+        downside_correls {array}: Downside correlation of each candidate.
+    """
+    required_return = np.power(required_return, 1.0 / Config.DAYS_IN_YEAR)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        average_returns = np.exp(np.mean(np.log(returns_matrix), axis=0))
+    downside_risks = _getDownsideRisk(returns_matrix, required_return)
+    if stats_cache is None:
+        downside_correls = _getDownsideCorrels(
+            price_change_array, allocation_matrix, returns_matrix,
+            required_return)
+    else:
+        downside_correls = stats_cache.getDownsideCorrels(
+            allocation_matrix, returns_matrix, required_return)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        scores = (
+            (average_returns - required_return)
+            / (downside_risks * downside_correls))
+    return scores, average_returns, downside_risks, downside_correls
+
+
+def _getDownsideRisk(backtested_returns, required_return):
+    """Calculate the downside semivariance below the required return.
+
+    Args:
+        backtested_returns {array}: Daily returns of a portfolio, or
+            Rows = Dates, Columns = Candidates.
+        required_return {float}: The de-annualized required return.
+    Returns:
+        downside_risk {float|array}: Root mean square of returns below
+            required, per candidate if given a matrix.
+    """
+    returns = backtested_returns - required_return
+    returns = np.clip(returns, None, 0)
+    returns *= returns
+    return np.sqrt(np.sum(returns, axis=0) / returns.shape[0])
+
+
+def _getDownsideCorrel(
+        price_change_array, allocation_array, backtested_returns,
+        required_return):
+    """Calculate the correlation of holdings in periods below required return.
+
+    Args:
+        price_change_array {array}: Rows = Dates, Columns = Tickers.
+        allocation_array {array}: Percent allocations of the portfolio.
+        backtested_returns {array}: Daily returns of the portfolio.
+        required_return {float}: The de-annualized required return.
+    Returns:
+        downside_correl {float}: Allocation weighted correlation of tickers
+            on days the portfolio is below the required return.
+    """
+    return _getDownsideCorrels(
+        price_change_array,
+        np.asarray(allocation_array, dtype=np.float64)[None, :],
+        np.asarray(backtested_returns)[:, None],
+        required_return)[0]
+
+
+def _getDownsideCorrels(
+        price_change_array, allocation_matrix, returns_matrix,
+        required_return):
+    """Calculate downside correlations for many candidates at once.
+
+    For weights w and the price changes X on days below the required return,
+        w' * corrcoef(X) * w is the variance of X * (w / std(X)), so it is
+        computed from masked column sums and squares plus one projection per
+        candidate, without building the filtered rows or the N x N
+        correlation matrix. Columns are centered first to keep the
+        sum-of-squares variance numerically stable. Tickers that are not held
+        have no effect, even if they do not vary on the masked days.
+    Args:
+        price_change_array {array}: Rows = Dates, Columns = Tickers.
+        allocation_matrix {array}: Rows = Candidates, Columns = Tickers.
+        returns_matrix {array}: Rows = Dates, Columns = Candidates.
+        required_return {float}: The de-annualized required return.
+    Returns:
+        downside_correls {array}: Downside correlation of each candidate.
+            NaN where the correlation is undefined, e.g. fewer than two
+            periods below required or a held ticker with no variance in
+            them.
+    """
+    price_changes = np.asarray(price_change_array, dtype=np.float64)
+    price_changes = price_changes - price_changes.mean(axis=0)
+    below_desired = (returns_matrix < required_return).astype(np.float64)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        counts = below_desired.sum(axis=0)
+        means = np.matmul(below_desired.T, price_changes) / counts[:, None]
+        variances = (
+            np.matmul(below_desired.T, price_changes * price_changes)
+            / counts[:, None]
+            - means * means)
+        scaled_allocations = np.where(
+            allocation_matrix != 0,
+            allocation_matrix / np.sqrt(variances), 0.0)
+        projections = np.matmul(
+            price_changes, scaled_allocations.T) * below_desired
+        projection_means = projections.sum(axis=0) / counts
+        return (
+            (projections * projections).sum(axis=0) / counts
+            - projection_means * projection_means)
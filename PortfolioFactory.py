@@ -1,31 +1,84 @@
 import math
+from multiprocessing import Pool
 import numpy as np
-import random
+import os
+import shutil
+import tempfile
 import time
 
-from Portfolio import Portfolio
+import Config
+from MaskedStatsCache import MaskedStatsCache
+from Portfolio import Portfolio, getBatchScores
+
+SOLVERS = ('binary', 'genetic', 'anneal', 'gradient', 'line_search')
+# When rounded, translates to +/- 1 basis point.
+MIN_TRADE_AMOUNT = 0.00005
 
 
 class PortfolioFactory(object):
     """Generates desired portfolio."""
 
-    def __init__(self, stock_db, required_return, use_genetic=False):
+    def __init__(
+            self, stock_db, required_return, use_genetic=False, num_workers=1,
+            chunk_size=None, solver='binary', max_time=3600,
+            max_evaluations=None, init_allocation=None, init_trade_amount=1,
+            polish=True):
         """Initialize the weight factory.
 
         Args:
             stock_db {StockDatabase}: Database of necessary stock data.
             required_return {float}: Return required to pay bills.
+            use_genetic {boolean}: Shorthand for solver='genetic'.
+            num_workers {int}: Number of processes for the binary solver.
+            chunk_size {int}: Sells handed to a worker process at a time.
+            solver {string}: One of SOLVERS. 'genetic' seeds the binary
+                solver with the genetic algorithm, 'line_search' sizes each
+                binary trade individually.
+            max_time {float}: Seconds the binary or annealing solver may run.
+            max_evaluations {int}: Candidate portfolios the annealing solver
+                may score, defaults to Config.ANNEAL_MAX_EVALUATIONS.
+            init_allocation {array}: Allocation to warm start from instead of
+                100% in the first ticker or a genetic seed.
+            init_trade_amount {float}: First trade size for the binary solver.
+            polish {boolean}: Whether to finish the gradient solver with a
+                short binary solve.
         """
+        if use_genetic:
+            solver = 'genetic'
+        if solver not in SOLVERS:
+            raise ValueError('Unknown solver %s.' % solver)
         self._stock_db = stock_db
         self._required_return = required_return
-        init_allocation = None
-        if use_genetic:
-            init_allocation = self._GeneticSolve().allocation_array
-        self.desired_portfolio = self._BinarySolve(
-            init_allocation=init_allocation)
+        self._num_workers = num_workers
+        self._chunk_size = chunk_size
+        self._max_time = max_time
+        self._max_evaluations = max_evaluations
+        self._stats_cache = MaskedStatsCache(stock_db.price_change_array)
+        if solver == 'anneal':
+            self.desired_portfolio = self._AnnealSolve(
+                init_allocation=init_allocation)
+        elif solver == 'gradient':
+            self.desired_portfolio = self._GradientSolve(
+                init_allocation=init_allocation)
+            if polish:
+                self.desired_portfolio = self._BinarySolve(
+                    init_allocation=self.desired_portfolio.allocation_array,
+                    init_trade_amount=Config.GRADIENT_POLISH_TRADE_AMOUNT)
+        else:
+            if solver == 'genetic' and init_allocation is None:
+                init_allocation = self._GeneticSolve().allocation_array
+            self.desired_portfolio = self._BinarySolve(
+                init_allocation=init_allocation,
+                init_trade_amount=init_trade_amount,
+                line_search=(solver == 'line_search'))
 
     def _GeneticSolve(self):
-        """Attempt to find an optimal solution via a genetic algorithm."""
+        """Attempt to find an optimal solution via a genetic algorithm.
+
+        The population is kept as an array of allocations (Rows = Portfolios,
+            Columns = Tickers) with a parallel array of scores, so culling,
+            breeding, and scoring each run over a whole generation at once.
+        """
         print('Starting Genetic Algo...')
         generation_size = len(self._stock_db.tickers)
         best_to_keep = int(math.ceil(math.sqrt(generation_size)))
@@ -37,98 +90,227 @@ class PortfolioFactory(object):
         start = time.time()
 
         # Generate initial random candidates.
-        population = []
-        for i in range(generation_size):
-            allocations = np.random.randint(2, size=generation_size)
-            allocations = allocations / (allocations.sum() + 0.0)
-            portfolio = Portfolio(
-                self._stock_db, percent_allocations=allocations)
-            portfolio.getScore(self._required_return)
-            population.append(portfolio)
-            num_portfolios += 1
-
+        population = np.random.randint(
+            2, size=(generation_size, generation_size))
+        population = population / (population.sum(axis=1)[:, None] + 0.0)
         # Generate some non-random candidates.
-        for i in range(generation_size):
-            allocations = np.zeros(generation_size)
-            allocations[i] = 1.0
-            portfolio = Portfolio(
-                self._stock_db, percent_allocations=allocations)
-            portfolio.getScore(self._required_return)
-            population.append(portfolio)
-            num_portfolios += 1
-        population.sort(key=lambda p: p.score, reverse=True)
+        population = np.vstack([population, np.eye(generation_size)])
+        scores = self._getGeneticScores(population)
+        num_portfolios += len(population)
 
         # 5) Repeat 2-5 until X portfolios have been tried.
         while (num_portfolios < max_portfolios or (time.time() - start) < min_time):
-            print('Generation %d best is %f' %
-                  (generation, population[0].score))
-            generation += 1
             # 2) Keeping top X%, cull randomly to under Y%.
-            while len(population) > best_to_keep * 2:
-                del population[random.randint(
-                    best_to_keep, len(population) - 1)]
+            if len(population) > best_to_keep * 2:
+                ranked = np.argpartition(-scores, best_to_keep - 1)
+                survivors = np.concatenate([
+                    ranked[:best_to_keep],
+                    np.random.choice(
+                        ranked[best_to_keep:], best_to_keep, replace=False)])
+                population = population[survivors]
+                scores = scores[survivors]
+            print('Generation %d best is %f' % (generation, scores.max()))
+            generation += 1
 
             # 3) Choose parents (based randomly on score) and breed.
-            while len(population) < generation_size:
-                parent_1 = random.choice(population)
-                parent_2 = random.choice(population)
-                while parent_1 == parent_2:
-                    parent_2 = random.choice(population)
+            children = np.empty((0, generation_size))
+            while len(population) + len(children) < generation_size:
+                num_children = (
+                    generation_size - len(population) - len(children))
+                parent_1 = np.random.randint(
+                    len(population), size=num_children)
+                parent_2 = np.random.randint(
+                    len(population) - 1, size=num_children)
+                parent_2 += parent_2 >= parent_1
 
                 # 3) Merging genes is 50/50 odds of getting each parents allocation for a stock.
-                allocations = np.zeros(len(self._stock_db.tickers))
-                for allocation_index in range(len(allocations)):
-                    if random.random() < mutation_rate:
-                        allocations[allocation_index] = random.random()
-                    elif random.random() < 0.5:
-                        allocations[allocation_index] = parent_1.allocation_array[allocation_index]
-                    else:
-                        allocations[allocation_index] = parent_2.allocation_array[allocation_index]
+                shape = (num_children, generation_size)
+                new_children = np.where(
+                    np.random.random(shape) < 0.5,
+                    population[parent_1], population[parent_2])
+                mutations = np.random.random(shape) < mutation_rate
+                new_children[mutations] = np.random.random(
+                    np.count_nonzero(mutations))
 
                 # Especially in the beginning, all zeroes is possible.
-                if allocations.sum() == 0:
-                    continue
+                totals = new_children.sum(axis=1)
+                new_children = new_children[totals > 0]
 
                 # Normalize.
-                allocations = allocations / (allocations.sum() + 0.0)
-                portfolio = Portfolio(
-                    self._stock_db, percent_allocations=allocations)
-                portfolio.getScore(self._required_return)
-                population.append(portfolio)
-                num_portfolios += 1
+                new_children /= totals[totals > 0][:, None]
+                children = np.vstack([children, new_children])
 
-            population.sort(key=lambda p: p.score, reverse=True)
+            # 4) Score the whole generation at once.
+            population = np.vstack([population, children])
+            scores = np.concatenate([
+                scores, self._getGeneticScores(children)])
+            num_portfolios += len(children)
 
-        return population[0]
+        portfolio = Portfolio(
+            self._stock_db, percent_allocations=population[np.argmax(scores)])
+        portfolio.getScore(self._required_return)
+        return portfolio
 
-    def _BinarySolveIndividualSell(self, input_args):
-        """Check if an individual sale of stock is an improvement on the current regime."""
-        (best, trade_amount, best_score, sell) = input_args
-        if best[sell] < trade_amount:
-            return (best, best_score)
+    def _getGeneticScores(self, allocation_matrix):
+        """Score a batch of genetic candidates, ranking NaN scores last.
+
+        Args:
+            allocation_matrix {array}: Rows = Candidates, Columns = Tickers.
+        Returns:
+            scores {array}: The score of each candidate.
+        """
+        if not len(allocation_matrix):
+            return np.empty(0)
+        scores = getBatchScores(
+            self._stock_db, allocation_matrix, self._required_return)[0]
+        scores[np.isnan(scores)] = -np.inf
+        return scores
+
+    def _AnnealSolve(self, init_allocation=None):
+        """Attempt to find an optimal solution via simulated annealing.
+
+        Moves are the same sell/buy trades the binary solver makes, sized from
+            its halving ladder of trade amounts. Proposals are scored a batch
+            at a time against the current portfolio and walked in order with
+            the Metropolis rule, so everything after an accepted move is
+            discarded. The temperature cools geometrically from one that
+            accepts an average worsening move with probability
+            Config.ANNEAL_START_ACCEPTANCE to one that accepts it with
+            Config.ANNEAL_END_ACCEPTANCE, following whichever of the time or
+            evaluation budget is used up faster.
 
-        curr = np.copy(best)
+        Args:
+            init_allocation {array}: Allocation to start from.
+        Returns:
+            portfolio {Portfolio}: The best portfolio seen.
+        """
+        print('Starting Annealing Algo...')
+        max_evaluations = self._max_evaluations
+        if max_evaluations is None:
+            max_evaluations = Config.ANNEAL_MAX_EVALUATIONS
+        trade_amounts = _getTradeLadder()
 
-        for buy in xrange(len(best)):
-            if buy == sell:
+        if init_allocation is None:
+            init_allocation = np.zeros(len(self._stock_db.tickers))
+            init_allocation[0] = 1
+        allocation = init_allocation
+        current = Portfolio(self._stock_db, percent_allocations=allocation)
+        current_score = current.getScore(self._required_return)
+        best = allocation
+        best_score = current_score
+        if len(allocation) < 2:
+            return current
+
+        start_temperature = None
+        num_evaluations = 0
+        accepted_moves = 0
+        start = time.time()
+        while (num_evaluations < max_evaluations
+               and time.time() - start < self._max_time):
+            self._stats_cache.rebase(current, self._required_return)
+            (sells, buys, amounts) = _getAnnealMoves(
+                current.allocation_array, trade_amounts,
+                Config.ANNEAL_BATCH_SIZE)
+            scores = current.getTradeScores(
+                self._required_return, sells, buys, amounts,
+                stats_cache=self._stats_cache)[0]
+            scores[np.isnan(scores)] = -np.inf
+            num_evaluations += len(scores)
+
+            with np.errstate(invalid='ignore'):
+                changes = scores - current_score
+            if start_temperature is None:
+                # Scale temperatures by how much a typical bad move costs.
+                losses = -changes[np.isfinite(changes) & (changes < 0)]
+                scale = losses.mean() if len(losses) else 1.0
+                start_temperature = -scale / math.log(
+                    Config.ANNEAL_START_ACCEPTANCE)
+                end_temperature = -scale / math.log(
+                    Config.ANNEAL_END_ACCEPTANCE)
+            progress = min(1.0, max(
+                num_evaluations / float(max_evaluations),
+                (time.time() - start) / self._max_time))
+            temperature = start_temperature * math.pow(
+                end_temperature / start_temperature, progress)
+
+            with np.errstate(invalid='ignore'):
+                acceptance = np.exp(np.minimum(changes, 0) / temperature)
+            accepted = np.flatnonzero(
+                np.random.random(len(scores)) < acceptance)
+            if not len(accepted):
                 continue
 
-            curr[sell] -= trade_amount
-            curr[buy] += trade_amount
+            move = accepted[0]
+            allocation = np.copy(current.allocation_array)
+            allocation[sells[move]] -= amounts[move]
+            allocation[buys[move]] += amounts[move]
+            current = Portfolio(self._stock_db, percent_allocations=allocation)
+            current_score = current.getScore(self._required_return)
+            accepted_moves += 1
+            if current_score > best_score:
+                best_score = current_score
+                best = allocation
+
+        print('Evaluated %d, accepted %d, best score: %f' %
+              (num_evaluations, accepted_moves, best_score))
+        portfolio = Portfolio(self._stock_db, percent_allocations=best)
+        portfolio.getScore(self._required_return)
+        return portfolio
 
-            portfolio = Portfolio(self._stock_db, percent_allocations=curr)
-            curr_score = portfolio.getScore(self._required_return)
+    def _GradientSolve(self, init_allocation=None):
+        """Attempt to find an optimal solution via projected gradient ascent.
 
-            if curr_score > best_score:
-                best_score = curr_score
-                best = np.copy(curr)
+        Steps along the analytic gradient of the score and projects back onto
+            the simplex of allocations (non-negative, summing to 1). The step
+            grows after an improvement and halves after a failure, stopping
+            once it moves no allocation by more than the minimum trade.
 
-            curr[sell] += trade_amount
-            curr[buy] -= trade_amount
+        Args:
+            init_allocation {array}: Allocation to start from, defaults to
+                equal weights.
+        Returns:
+            portfolio {Portfolio}: The best portfolio found.
+        """
+        print('Starting Gradient Algo...')
+        num_tickers = len(self._stock_db.tickers)
+        if init_allocation is None:
+            init_allocation = np.ones(num_tickers) / num_tickers
+        best = Portfolio(self._stock_db, percent_allocations=init_allocation)
+        best_score = best.getScore(self._required_return)
 
-        return (best, best_score)
+        step_size = None
+        iterations = 0
+        start = time.time()
+        while (iterations < Config.GRADIENT_MAX_ITERATIONS
+               and time.time() - start < self._max_time):
+            iterations += 1
+            gradient = best.getScoreGradient(self._required_return)
+            if not np.all(np.isfinite(gradient)):
+                break
+            if step_size is None:
+                # First step moves the steepest allocation by 10%.
+                step_size = 0.1 / max(np.abs(gradient).max(), 1e-12)
+
+            allocation = _projectToSimplex(
+                best.allocation_array + step_size * gradient)
+            if np.abs(allocation - best.allocation_array).max() < MIN_TRADE_AMOUNT:
+                break
+            portfolio = Portfolio(
+                self._stock_db, percent_allocations=allocation)
+            score = portfolio.getScore(self._required_return)
+            if score > best_score:
+                best = portfolio
+                best_score = score
+                step_size *= 1.5
+            else:
+                step_size /= 2.0
 
-    def _BinarySolve(self, init_allocation=None):
+        print('Iterations %d, score: %f' % (iterations, best_score))
+        return best
+
+    def _BinarySolve(
+            self, init_allocation=None, init_trade_amount=1,
+            line_search=False):
         """Actually run the solver.
 
         Uses a binary heuristic to optimize the solution. Start with 100% in an
@@ -139,11 +321,22 @@ class PortfolioFactory(object):
 
         Theoretically this could fall prey to local maxima, so improvements
             should be sought.
-        TODO: Attempt Simulated Annealing w/ ~32k portfolios.
         TODO: Attempt a middle ground of genetic and binary.
             # Create a basic portfolio w/ genetic, then run through binary to finesse it.
             # Add a caveat that trade_amount = min(trade_amount, best[sell])
 
+        With line_search, every sell instead tries selling all of its holding
+            and every smaller trade size on the halving ladder, keeping its
+            best (buy, size). Passes stop when none improve, rather than
+            spending whole passes at one size that suits few pairs. Every buy
+            is screened by the score gradient along (buy - sell), and only the
+            Config.LINE_SEARCH_BUYS most promising get the full ladder.
+
+        Args:
+            init_allocation {array}: Allocation to start from.
+            init_trade_amount {float}: Trade size to start from. A warm start
+                that is already close can skip the largest trades.
+            line_search {boolean}: Whether to size each trade individually.
         Returns:
             desired_allocations {dict}: Dictionary of tickers to percent
                 allocations.
@@ -156,42 +349,253 @@ class PortfolioFactory(object):
         best = init_allocation
         portfolio = Portfolio(self._stock_db, percent_allocations=best)
         best_score = portfolio.getScore(self._required_return)
-        # When rounded, translates to +/- 1 basis point.
-        min_trade_amount = 0.00005
-        max_time = 3600
-
-        trade_amount = 1
-        full_start = time.time()
-        while trade_amount >= min_trade_amount and time.time() - full_start < max_time:
-            improved = False
-
-            inputs = []
-            for sell in xrange(len(best)):
-                if best[sell] < trade_amount:
-                    continue
-                inputs.append((np.copy(best), trade_amount, best_score, sell))
-
-            start = time.time()
-            results = map(self._BinarySolveIndividualSell, inputs)
-            print('Selling %d took %d seconds' % (len(inputs), time.time() - start))
-
-            for result in results:
-                (curr, curr_score) = result
-                if curr_score > best_score:
-                    best_score = curr_score
-                    best = np.copy(curr)
-                    improved = True
-                    major_steps += 1
-
-            if not improved:
-                trade_amount /= 2.0
-                print('New trade amount: %f' % trade_amount)
+        min_trade_amount = MIN_TRADE_AMOUNT
+        max_time = self._max_time
+
+        # Workers map the price changes from disk instead of each getting a
+        # pickled copy.
+        pool = None
+        temp_dir = None
+        try:
+            if self._num_workers > 1:
+                temp_dir = tempfile.mkdtemp()
+                filename = os.path.join(temp_dir, 'price_change_array.npy')
+                np.save(filename, self._stock_db.price_change_array)
+                pool = Pool(
+                    self._num_workers, _initBinarySellWorker,
+                    (filename, self._required_return))
             else:
-                print('Improvements: %d, score: %f' %
-                      (major_steps, best_score))
+                sell_worker = _BinarySellWorker(
+                    self._stock_db, self._required_return, self._stats_cache)
+
+            trade_amount = init_trade_amount
+            trade_ladder = _getTradeLadder()
+            full_start = time.time()
+            while trade_amount >= min_trade_amount and time.time() - full_start < max_time:
+                improved = False
+
+                if line_search:
+                    gradient = Portfolio(
+                        self._stock_db, percent_allocations=best
+                    ).getScoreGradient(self._required_return)
+                inputs = []
+                for sell in xrange(len(best)):
+                    if line_search:
+                        if best[sell] < min_trade_amount:
+                            continue
+                        trade_amounts = [best[sell]] + [
+                            amount for amount in trade_ladder
+                            if amount < best[sell]]
+                        buys = _getPromisingBuys(
+                            gradient, sell, Config.LINE_SEARCH_BUYS)
+                    elif best[sell] < trade_amount:
+                        continue
+                    else:
+                        trade_amounts = [trade_amount]
+                        buys = None
+                    inputs.append((best, trade_amounts, best_score, sell, buys))
+
+                start = time.time()
+                # Results come back in sell order no matter the worker count.
+                if pool is not None:
+                    results = pool.map(
+                        _runBinarySellWorker, inputs, self._chunk_size)
+                else:
+                    results = map(sell_worker, inputs)
+                print('Selling %d took %d seconds' % (len(inputs), time.time() - start))
+
+                for result in results:
+                    (curr, curr_score) = result
+                    if curr_score > best_score:
+                        best_score = curr_score
+                        best = np.copy(curr)
+                        improved = True
+                        major_steps += 1
+
+                if not improved and line_search:
+                    break
+                elif not improved:
+                    trade_amount /= 2.0
+                    print('New trade amount: %f' % trade_amount)
+                else:
+                    print('Improvements: %d, score: %f' %
+                          (major_steps, best_score))
+        finally:
+            # Don't leave workers or the saved array behind on an error.
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+            if temp_dir is not None:
+                shutil.rmtree(temp_dir, ignore_errors=True)
 
         portfolio = Portfolio(self._stock_db, percent_allocations=best)
         portfolio.getScore(self._required_return)
 
         print ('Major steps %d' % major_steps)
         return portfolio
+
+
+def _projectToSimplex(allocation_array):
+    """Find the closest allocation that is non-negative and sums to 1.
+
+    Args:
+        allocation_array {array}: Any vector of allocations.
+    Returns:
+        allocation_array {array}: Its Euclidean projection onto the simplex.
+    """
+    descending = np.sort(allocation_array)[::-1]
+    excess = np.cumsum(descending) - 1.0
+    counts = np.arange(1, len(descending) + 1)
+    kept = np.flatnonzero(descending - excess / counts > 0)[-1]
+    return np.maximum(allocation_array - excess[kept] / (kept + 1.0), 0.0)
+
+
+def _getTradeLadder():
+    """List trade sizes from 100% halving down to the minimum trade.
+
+    Returns:
+        trade_amounts {array}: Trade sizes, largest first.
+    """
+    return np.power(0.5, np.arange(
+        int(math.floor(math.log(1.0 / MIN_TRADE_AMOUNT, 2))) + 1))
+
+
+def _getPromisingBuys(gradient, sell, num_buys):
+    """Pick the buys whose trade against a sell improves the score fastest.
+
+    Args:
+        gradient {array}: Score gradient of the portfolio.
+        sell {int}: Index of the ticker to sell.
+        num_buys {int}: Most buys to return.
+    Returns:
+        buys {array}: Indices of the most promising buys, or of every other
+            ticker if the gradient is undefined.
+    """
+    buys = np.array([buy for buy in xrange(len(gradient)) if buy != sell])
+    if not np.all(np.isfinite(gradient)) or len(buys) <= num_buys:
+        return buys
+    slopes = gradient[buys] - gradient[sell]
+    return np.sort(buys[np.argpartition(-slopes, num_buys - 1)[:num_buys]])
+
+
+def _getAnnealMoves(allocation_array, trade_amounts, num_moves):
+    """Draw random sell/buy trades from a portfolio.
+
+    Args:
+        allocation_array {array}: Percent allocations to trade from.
+        trade_amounts {array}: Trade sizes to choose from.
+        num_moves {int}: Number of trades to draw.
+    Returns:
+        sells {array}: Index of the held ticker to sell, per trade.
+        buys {array}: Index of a different ticker to buy, per trade.
+        amounts {array}: Amount to trade, at most the amount held.
+    """
+    held = np.flatnonzero(allocation_array > 0)
+    sells = held[np.random.randint(len(held), size=num_moves)]
+    buys = np.random.randint(len(allocation_array) - 1, size=num_moves)
+    buys += buys >= sells
+    amounts = np.minimum(
+        trade_amounts[np.random.randint(len(trade_amounts), size=num_moves)],
+        allocation_array[sells])
+    return sells, buys, amounts
+
+
+class _SharedStockDatabase(object):
+    """The price changes of a StockDatabase, as mapped by a worker process."""
+
+    def __init__(self, price_change_array):
+        """Initialize the database.
+
+        Args:
+            price_change_array {array}: Rows = Dates, Columns = Tickers.
+        """
+        self.price_change_array = price_change_array
+        self.tickers = range(price_change_array.shape[1])
+
+
+class _BinarySellWorker(object):
+    """Checks individual sales of stock against the current regime.
+
+    The same worker runs in process for a serial solve and in each pool
+    process for a parallel one, so results don't depend on worker count.
+    """
+
+    def __init__(self, stock_db, required_return, stats_cache=None):
+        """Initialize the worker.
+
+        Args:
+            stock_db {StockDatabase}: Database of necessary stock data.
+            required_return {float}: Return required to pay bills.
+            stats_cache {MaskedStatsCache}: Cache to reuse, if any.
+        """
+        self._stock_db = stock_db
+        self._required_return = required_return
+        if stats_cache is None:
+            stats_cache = MaskedStatsCache(stock_db.price_change_array)
+        self._stats_cache = stats_cache
+        self._portfolio = None
+
+    def __call__(self, input_args):
+        """Check if an individual sale of stock is an improvement on the current regime.
+
+        Args:
+            input_args {tuple}: The allocation to trade from, the trade sizes
+                to try in order, the score to beat, the ticker to sell, and
+                the tickers to buy (None for all others).
+        Returns:
+            result {tuple}: The best allocation found and its score.
+        """
+        (best, trade_amounts, best_score, sell, buys) = input_args
+        trade_amounts = [
+            amount for amount in trade_amounts if amount <= best[sell]]
+        if not trade_amounts:
+            return (best, best_score)
+
+        # Every sell in a pass trades from the same portfolio.
+        if (self._portfolio is None
+                or not np.array_equal(self._portfolio.allocation_array, best)):
+            self._portfolio = Portfolio(
+                self._stock_db, percent_allocations=best)
+            self._stats_cache.rebase(self._portfolio, self._required_return)
+
+        # Every (size, buy) pair, in size order, scored in one batch.
+        if buys is None:
+            buys = [buy for buy in xrange(len(best)) if buy != sell]
+        buys = np.asarray(buys)
+        amounts = np.repeat(trade_amounts, len(buys))
+        buys = np.tile(buys, len(trade_amounts))
+        scores = self._portfolio.getTradeScores(
+            self._required_return, np.repeat(sell, len(buys)), buys, amounts,
+            stats_cache=self._stats_cache)[0]
+        scores[np.isnan(scores)] = -np.inf
+
+        candidate = np.argmax(scores)
+        if scores[candidate] > best_score:
+            best_score = scores[candidate]
+            best = np.copy(best)
+            best[sell] -= amounts[candidate]
+            best[buys[candidate]] += amounts[candidate]
+
+        return (best, best_score)
+
+
+# Per process worker for parallel binary solves.
+_binary_sell_worker = None
+
+
+def _initBinarySellWorker(filename, required_return):
+    """Set up a pool process to run binary sells.
+
+    Args:
+        filename {string}: Saved price change array to memory map.
+        required_return {float}: Return required to pay bills.
+    """
+    global _binary_sell_worker
+    price_change_array = np.load(filename, mmap_mode='r')
+    _binary_sell_worker = _BinarySellWorker(
+        _SharedStockDatabase(price_change_array), required_return)
+
+
+def _runBinarySellWorker(input_args):
+    """Run one binary sell in a pool process."""
+    return _binary_sell_worker(input_args)
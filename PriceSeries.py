@@ -0,0 +1,33 @@
+import numpy as np
+
+import Config
+
+# Prices below this are treated as bad data.
+MINIMUM_PRICE = 0.01
+
+
+def cleanPrices(dates, prices, as_of=None, min_length=None):
+    """Clean one ticker's price history.
+
+    Drops days after the as-of date with a binary search, masks out bad
+    prices, then checks that enough days remain.
+    Args:
+        dates {array}: Sorted datetime64[D] trading days.
+        prices {array}: Price on each day.
+        as_of {datetime}: Last day to keep, Config.TODAY by default.
+        min_length {int}: Fewest days to keep, Config.MINIMUM_AMOUNT_DATA by
+            default.
+    Returns:
+        dates {array}: The kept trading days.
+        prices {array}: The kept prices, or None for both if there are fewer
+            than min_length.
+    """
+    if as_of is None:
+        as_of = Config.TODAY
+    if min_length is None:
+        min_length = Config.MINIMUM_AMOUNT_DATA
+    end = np.searchsorted(dates, np.datetime64(as_of.date(), 'D'), side='right')
+    valid = prices[:end] >= MINIMUM_PRICE
+    if np.count_nonzero(valid) < min_length:
+        return None, None
+    return dates[:end][valid], prices[:end][valid]
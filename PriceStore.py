@@ -0,0 +1,331 @@
+import argparse
+import bz2
+import cPickle as pickle
+import json
+import numpy as np
+import os
+import zlib
+
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+# One record per trading day, sorted by date.
+PRICE_DTYPE = np.dtype([('date', 'M8[D]'), ('price', '<f8')])
+
+# Payload codecs by name. raw payloads are .npy files read by memory mapping;
+# the others compress the records' bytes with the module's compress.
+CODECS = {'raw': None, 'zlib': zlib, 'bz2': bz2}
+if lzma is not None:
+    CODECS['lzma'] = lzma
+
+
+class PriceStore(object):
+    """Columnar on-disk store of daily prices.
+
+    Each ticker is an array of PRICE_DTYPE records. With the raw codec it is a
+    <TICKER>.npy file memory mapped on read, so opening the store costs
+    nothing and only the tickers asked for are paged in; other codecs trade
+    decode time for disk. manifest.json describes each ticker's payload (when
+    it was pulled from the API, its row count, first and last date, checksum,
+    and codec) so most decisions never have to open it.
+    """
+
+    def __init__(self, directory='price_store', codec='raw'):
+        """Initialize the store.
+
+        Args:
+            directory {string}: Where the store lives.
+            codec {string}: Codec for new payloads, one of CODECS.
+        """
+        if codec not in CODECS:
+            raise ValueError('Unknown or unavailable codec %s.' % codec)
+        self._directory = directory
+        self._codec = codec
+        self._manifest = None
+
+    def exists(self):
+        """Whether the store has been created on disk.
+
+        Returns:
+            exists {boolean}: True if the store has a manifest.
+        """
+        return (os.path.exists(self._getManifestFilename())
+                or os.path.exists(self._getIndexFilename()))
+
+    def getTickers(self):
+        """List the tickers in the store.
+
+        Returns:
+            tickers {list}: Tickers with stored prices.
+        """
+        return self._getManifest().keys()
+
+    def getEntry(self, ticker):
+        """Get a ticker's manifest entry.
+
+        Args:
+            ticker {string}: The ticker to look up.
+        Returns:
+            entry {dict}: The ticker's timestamp, num_rows, first_date,
+                last_date, checksum, and codec, or None if missing.
+        """
+        return self._getManifest().get(ticker)
+
+    def getTimestamp(self, ticker):
+        """Get when a ticker was last pulled from the API.
+
+        Args:
+            ticker {string}: The ticker to look up.
+        Returns:
+            timestamp {float}: Seconds since the epoch, or None if missing.
+        """
+        entry = self.getEntry(ticker)
+        if entry is None:
+            return None
+        return entry['timestamp']
+
+    def read(self, ticker):
+        """Read a ticker's prices, memory mapped for the raw codec.
+
+        Args:
+            ticker {string}: The ticker to read.
+        Returns:
+            dates {array}: Sorted datetime64[D] trading days.
+            prices {array}: float64 price on each day.
+        """
+        records = self._readRecords(ticker, self.getEntry(ticker)['codec'])
+        return records['date'], records['price']
+
+    def verify(self, ticker):
+        """Check a ticker's payload against its manifest entry.
+
+        Args:
+            ticker {string}: The ticker to check.
+        Returns:
+            valid {boolean}: True if the payload matches its checksum.
+        """
+        entry = self.getEntry(ticker)
+        if entry is None:
+            return False
+        try:
+            records = self._readRecords(ticker, entry['codec'])
+        except (IOError, ValueError, EOFError, zlib.error):
+            return False
+        return _getEntry(records, entry['timestamp'], entry['codec']) == entry
+
+    def write(self, ticker, dates, prices, timestamp):
+        """Replace a ticker's prices.
+
+        Unchanged prices only update the manifest timestamp.
+        Args:
+            ticker {string}: The ticker to write.
+            dates {array}: Trading days, as datetime64 or 'YYYY-MM-DD'.
+            prices {array}: Price on each day.
+            timestamp {float}: When the prices were pulled from the API.
+        """
+        records = _getRecords(dates, prices)
+        entry = _getEntry(records, timestamp, self._codec)
+        old_entry = dict(self.getEntry(ticker) or {}, timestamp=timestamp)
+        if entry != old_entry:
+            self._writeRecords(ticker, records, old_entry.get('codec'))
+        self._getManifest()[ticker] = entry
+        self._writeManifest()
+
+    def convert(self):
+        """Rewrite every payload with the store's codec.
+
+        Returns:
+            num_converted {int}: Number of tickers rewritten.
+        """
+        num_converted = 0
+        for ticker, entry in self._getManifest().items():
+            if entry['codec'] == self._codec:
+                continue
+            records = np.array(self._readRecords(ticker, entry['codec']))
+            self._writeRecords(ticker, records, entry['codec'])
+            self._getManifest()[ticker] = _getEntry(
+                records, entry['timestamp'], self._codec)
+            num_converted += 1
+        self._writeManifest()
+        return num_converted
+
+    def migratePickleCache(self, cache_directory='cache_files'):
+        """Copy a cache of bz2 compressed pickles into the store.
+
+        Files that can't be read or have no _timestamp are skipped, as the
+            pickle cache would have ignored them.
+        Args:
+            cache_directory {string}: Where the pickle cache lives.
+        Returns:
+            num_migrated {int}: Number of tickers copied.
+        """
+        num_migrated = 0
+        for filename in os.listdir(cache_directory):
+            if not filename.endswith('.pkl.bz2'):
+                continue
+            try:
+                with bz2.BZ2File(
+                        os.path.join(cache_directory, filename), 'r') as f:
+                    contents = pickle.loads(f.read())
+            except (IOError, EOFError, pickle.UnpicklingError):
+                continue
+            timestamp = contents.pop('_timestamp', None)
+            if timestamp is None:
+                continue
+            ticker = filename.split('.')[0]
+            dates = sorted(contents.keys())
+            records = _getRecords(
+                dates, [float(contents[date]) for date in dates])
+            old_entry = self.getEntry(ticker) or {}
+            self._writeRecords(ticker, records, old_entry.get('codec'))
+            self._getManifest()[ticker] = _getEntry(
+                records, timestamp, self._codec)
+            num_migrated += 1
+        self._writeManifest()
+        return num_migrated
+
+    def _readRecords(self, ticker, codec):
+        """Read a ticker's price records.
+
+        Args:
+            ticker {string}: The ticker to read.
+            codec {string}: Codec the payload was written with.
+        Returns:
+            records {array}: Read-only PRICE_DTYPE records.
+        """
+        filename = self._getFilename(ticker, codec)
+        if CODECS[codec] is None:
+            return np.load(filename, mmap_mode='r')
+        with open(filename, 'rb') as f:
+            return np.frombuffer(
+                CODECS[codec].decompress(f.read()), dtype=PRICE_DTYPE)
+
+    def _writeRecords(self, ticker, records, old_codec=None):
+        """Atomically write a ticker's price file with the store's codec.
+
+        Args:
+            ticker {string}: The ticker to write.
+            records {array}: Sorted PRICE_DTYPE records.
+            old_codec {string}: Codec of the payload being replaced, if any.
+        """
+        if not os.path.isdir(self._directory):
+            os.makedirs(self._directory)
+        filename = self._getFilename(ticker, self._codec)
+        with open(filename + '.tmp', 'wb') as f:
+            if CODECS[self._codec] is None:
+                np.save(f, records)
+            else:
+                f.write(CODECS[self._codec].compress(records.tostring()))
+        os.rename(filename + '.tmp', filename)
+        if old_codec is not None and old_codec != self._codec:
+            os.remove(self._getFilename(ticker, old_codec))
+
+    def _getManifest(self):
+        """Load the manifest on first use.
+
+        A store from before the manifest only has index.json, a dict of
+            tickers to timestamps, so its manifest is built from the payloads.
+        Returns:
+            manifest {dict}: Dict of tickers to manifest entries.
+        """
+        if self._manifest is None:
+            self._manifest = {}
+            if os.path.exists(self._getManifestFilename()):
+                with open(self._getManifestFilename(), 'r') as f:
+                    self._manifest = json.load(f)
+                # Manifests from before codecs only held raw payloads.
+                for entry in self._manifest.itervalues():
+                    entry.setdefault('codec', 'raw')
+            elif os.path.exists(self._getIndexFilename()):
+                with open(self._getIndexFilename(), 'r') as f:
+                    index = json.load(f)
+                for ticker, timestamp in index.iteritems():
+                    self._manifest[ticker] = _getEntry(
+                        self._readRecords(ticker, 'raw'), timestamp, 'raw')
+                self._writeManifest()
+                os.remove(self._getIndexFilename())
+        return self._manifest
+
+    def _writeManifest(self):
+        """Atomically write the manifest to disk."""
+        if not os.path.isdir(self._directory):
+            os.makedirs(self._directory)
+        filename = self._getManifestFilename()
+        with open(filename + '.tmp', 'w') as f:
+            json.dump(self._getManifest(), f)
+        os.rename(filename + '.tmp', filename)
+
+    def _getFilename(self, ticker, codec):
+        extension = 'npy' if codec == 'raw' else codec
+        return os.path.join(self._directory, ticker + '.' + extension)
+
+    def _getManifestFilename(self):
+        return os.path.join(self._directory, 'manifest.json')
+
+    def _getIndexFilename(self):
+        return os.path.join(self._directory, 'index.json')
+
+
+def _getRecords(dates, prices):
+    """Build sorted price records.
+
+    Args:
+        dates {array}: Trading days, as datetime64 or 'YYYY-MM-DD'.
+        prices {array}: Price on each day.
+    Returns:
+        records {array}: PRICE_DTYPE records sorted by date.
+    """
+    records = np.empty(len(dates), dtype=PRICE_DTYPE)
+    records['date'] = np.asarray(dates, dtype='M8[D]')
+    records['price'] = np.asarray(prices, dtype=np.float64)
+    records.sort(order='date')
+    return records
+
+
+def _getEntry(records, timestamp, codec):
+    """Describe price records for the manifest.
+
+    Args:
+        records {array}: Sorted PRICE_DTYPE records.
+        timestamp {float}: When the prices were pulled from the API.
+        codec {string}: Codec the payload is written with.
+    Returns:
+        entry {dict}: The timestamp, num_rows, first_date, last_date,
+            checksum, and codec of the records.
+    """
+    dates = records['date']
+    return {
+        'timestamp': timestamp,
+        'num_rows': len(records),
+        'first_date': str(dates[0]) if len(records) else None,
+        'last_date': str(dates[-1]) if len(records) else None,
+        'checksum': zlib.crc32(np.ascontiguousarray(records).data) & 0xffffffff,
+        'codec': codec
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Convert a price store, or a cache_files pickle cache, '
+        'to a codec.')
+    parser.add_argument('--directory', default='price_store',
+                        help='The price store to convert.')
+    parser.add_argument('--codec', choices=sorted(CODECS), required=True)
+    parser.add_argument('--from_cache', help='A cache_files directory of bz2 '
+                        'pickles to migrate into the store first.')
+    args = parser.parse_args()
+
+    store = PriceStore(args.directory, args.codec)
+    if args.from_cache:
+        print('Migrated %d tickers.' %
+              store.migratePickleCache(args.from_cache))
+    print('Converted %d tickers to %s.' % (store.convert(), args.codec))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+import numpy as np
+
+import Config
+from Trade import Trade
+from TradeFactory import _center
+
+
+class RebalancePlanner(object):
+    """Plans a sequence of trades from the current to the desired portfolio.
+
+    Each step greedily takes the trade whose resulting portfolio is most
+    correlated with the desired one. A trade shifts the planned portfolio's
+    returns, which moves every other trade's correlation up or down, so a
+    heap of earlier scores can't be trusted to hold the best one. Instead
+    every open trade is rescored each step, together and in closed form from
+    running covariances updated in O(N) per trade.
+    """
+
+    def __init__(self, current_portfolio, desired_portfolio,
+                 target_correlation=None, max_trades=None):
+        """Initialize the planner.
+
+        Args:
+            current_portfolio {Portfolio}: Current investments and backtests.
+            desired_portfolio {Portfolio}: Desired investments and backtests.
+            target_correlation {float}: Correlation with the desired
+                portfolio to stop at, Config.REBALANCE_TARGET_CORRELATION by
+                default.
+            max_trades {int}: Most trades to plan,
+                Config.REBALANCE_MAX_TRADES by default.
+        """
+        if target_correlation is None:
+            target_correlation = Config.REBALANCE_TARGET_CORRELATION
+        if max_trades is None:
+            max_trades = Config.REBALANCE_MAX_TRADES
+        self._stock_db = current_portfolio._stock_db
+        self._current_portfolio = current_portfolio
+        self._desired_portfolio = desired_portfolio
+        self._target_correlation = target_correlation
+        self._max_trades = max_trades
+        self.trade_list = self._getTradeList()
+
+    def _getTradeList(self):
+        """Plan trades until the target correlation or trade count.
+
+        Returns:
+            trade_list {list}: Trades in the order to make them, each with the
+                correlation after it.
+        """
+        self._initializeState()
+        if self.correlation >= self._target_correlation:
+            return []
+        # Every overweight ticker against every underweight one.
+        (sells, buys) = np.nonzero(
+            (self._differences[:, None] > 0) & (self._differences < 0))
+
+        trade_list = []
+        while len(sells) and len(trade_list) < self._max_trades:
+            (_, covariances, variances) = self._getTradeEffect(sells, buys)
+            best = np.argmax(
+                covariances / np.sqrt(variances * self._desired_variance))
+            (sell, buy) = (sells[best], buys[best])
+            trade_percentage = self._makeTrade(sell, buy)
+            trade_list.append(Trade.fromValues(
+                self._tickers[buy], self._tickers[sell], trade_percentage,
+                self.correlation))
+            if self.correlation >= self._target_correlation:
+                break
+            # The trade balanced one of its tickers, closing its other trades.
+            open_trades = ((self._differences[sells] != 0)
+                           & (self._differences[buys] != 0))
+            (sells, buys) = (sells[open_trades], buys[open_trades])
+        return trade_list
+
+    def _initializeState(self):
+        """Precompute covariances among the over- and underweight tickers."""
+        differences = (self._current_portfolio.allocation_array
+                       - self._desired_portfolio.allocation_array)
+        candidates = np.flatnonzero(differences != 0)
+        self._tickers = [self._stock_db.tickers[i] for i in candidates]
+        self._differences = differences[candidates]
+
+        # Sums of products of centered values. The shared 1 / (n - 1) cancels
+        # out of every correlation.
+        price_changes = _center(
+            self._stock_db.price_change_array[:, candidates])
+        current_returns = _center(self._current_portfolio.backtested_returns)
+        desired_returns = _center(self._desired_portfolio.backtested_returns)
+        self._pair_covs = np.dot(price_changes.T, price_changes)
+        self._desired_covs = np.dot(desired_returns, price_changes)
+        self._current_covs = np.dot(current_returns, price_changes)
+        self._desired_variance = np.dot(desired_returns, desired_returns)
+        self._current_variance = np.dot(current_returns, current_returns)
+        self._covariance = np.dot(current_returns, desired_returns)
+        self.correlation = self._covariance / np.sqrt(
+            self._current_variance * self._desired_variance)
+
+    def _getTradeEffect(self, sell, buy):
+        """Evaluate a trade against the planned portfolio so far.
+
+        Args:
+            sell {int}: Candidate index of the overweight ticker, or an array
+                of them.
+            buy {int}: Candidate index of the underweight ticker, or an array
+                of them.
+        Returns:
+            trade_percentage {float}: How much the trade moves.
+            covariance {float}: Of returns after the trade with desired ones.
+            variance {float}: Of returns after the trade.
+        """
+        trade_percentage = np.minimum(
+            self._differences[sell], -self._differences[buy])
+        covariance = self._covariance + trade_percentage * (
+            self._desired_covs[buy] - self._desired_covs[sell])
+        variance = (
+            self._current_variance
+            + 2 * trade_percentage * (
+                self._current_covs[buy] - self._current_covs[sell])
+            + trade_percentage ** 2 * (
+                self._pair_covs[sell, sell] + self._pair_covs[buy, buy]
+                - 2 * self._pair_covs[sell, buy]))
+        return trade_percentage, covariance, variance
+
+    def _makeTrade(self, sell, buy):
+        """Update the planned portfolio for a trade.
+
+        Args:
+            sell {int}: Candidate index of the overweight ticker.
+            buy {int}: Candidate index of the underweight ticker.
+        Returns:
+            trade_percentage {float}: How much the trade moved.
+        """
+        (trade_percentage, self._covariance,
+         self._current_variance) = self._getTradeEffect(sell, buy)
+        self.correlation = self._covariance / np.sqrt(
+            self._current_variance * self._desired_variance)
+        self._current_covs += trade_percentage * (
+            self._pair_covs[:, buy] - self._pair_covs[:, sell])
+        # The smaller imbalance is closed exactly.
+        if self._differences[sell] <= -self._differences[buy]:
+            self._differences[buy] += self._differences[sell]
+            self._differences[sell] = 0
+        else:
+            self._differences[sell] += self._differences[buy]
+            self._differences[buy] = 0
+        return trade_percentage
@@ -0,0 +1,139 @@
+"""Local stand-in for the price API that serves recorded responses.
+
+Running this module benchmarks fetch throughput against it offline.
+"""
+
+import argparse
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from collections import defaultdict
+import datetime
+import json
+import numpy as np
+from SocketServer import ThreadingMixIn
+import threading
+from time import sleep, time
+from urlparse import parse_qs, urlparse
+
+
+class RecordedApiServer(ThreadingMixIn, HTTPServer):
+    """Threaded HTTP server answering API queries from recorded JSON.
+
+    Requests are answered by their symbol query parameter. A ticker can be
+    made to answer 503 a number of times before succeeding.
+    """
+    daemon_threads = True
+
+    def __init__(self, recordings, num_503s=None, latency=0.0):
+        """Start serving on a free localhost port.
+
+        Args:
+            recordings {dict}: Dict of tickers to recorded JSON responses.
+            num_503s {dict}: Dict of tickers to how many 503s to answer first.
+            latency {float}: Seconds to wait before answering each request.
+        """
+        HTTPServer.__init__(self, ('127.0.0.1', 0), _RecordedApiHandler)
+        self.recordings = recordings
+        self.num_503s = defaultdict(int, num_503s or {})
+        self.latency = latency
+        self.requests = []
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def getBaseRequest(self):
+        """Get a Config.BASE_REQUEST pointing at this server.
+
+        Returns:
+            base_request {string}: Request format taking the output size.
+        """
+        return 'http://127.0.0.1:%d/query?outputsize=%%s&symbol=' % (
+            self.server_address[1])
+
+    def stop(self):
+        """Stop serving and close the socket."""
+        self.shutdown()
+        self.server_close()
+
+
+class _RecordedApiHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        ticker = query['symbol'][0]
+        self.server.requests.append((ticker, query['outputsize'][0]))
+        sleep(self.server.latency)
+        if self.server.num_503s[ticker] > 0:
+            self.server.num_503s[ticker] -= 1
+            self.send_response(503)
+            self.end_headers()
+            return
+        body = self.server.recordings[ticker]
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def recordDailyAdjusted(dates, prices):
+    """Build a TIME_SERIES_DAILY_ADJUSTED response.
+
+    Args:
+        dates {list}: Trading days as 'YYYY-MM-DD'.
+        prices {list}: Adjusted close on each day.
+    Returns:
+        recording {string}: The JSON response.
+    """
+    time_series = {}
+    for date, price in zip(dates, prices):
+        time_series[date] = {'5. adjusted close': '%.4f' % price}
+    return json.dumps({'Time Series (Daily)': time_series})
+
+
+def main():
+    import Config
+    import DataIO
+    from PriceStore import PriceStore
+    from TokenBucket import TokenBucket
+    import shutil
+    import tempfile
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num_tickers', type=int, default=50)
+    parser.add_argument('--num_days', type=int, default=5000)
+    parser.add_argument('--latency', type=float, default=0.1)
+    parser.add_argument('--calls_per_second', type=float, default=20.0)
+    parser.add_argument(
+        '--concurrency', type=int, default=Config.API_CONCURRENCY)
+    args = parser.parse_args()
+
+    end = datetime.date.today()
+    dates = [str(end - datetime.timedelta(days=d))
+             for d in xrange(args.num_days)]
+    recordings = {}
+    for t in xrange(args.num_tickers):
+        prices = 10 * np.cumprod(1 + 0.01 * np.random.randn(args.num_days))
+        recordings['T%d' % t] = recordDailyAdjusted(dates, prices)
+
+    server = RecordedApiServer(recordings, latency=args.latency)
+    directory = tempfile.mkdtemp()
+    Config.BASE_REQUEST = server.getBaseRequest()
+    Config.API_CONCURRENCY = args.concurrency
+    DataIO.rate_limiter = TokenBucket(args.calls_per_second)
+    DataIO.price_store = PriceStore(directory)
+    try:
+        start_time = time()
+        DataIO._getAPIData(sorted(recordings))
+        elapsed = time() - start_time
+    finally:
+        server.stop()
+        shutil.rmtree(directory)
+    print('Fetched %d tickers in %.2fs (%.1f tickers/s).' % (
+        args.num_tickers, elapsed, args.num_tickers / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+import heapq
+import threading
+from time import time
+import traceback
+
+import Config
+
+
+class RefreshScheduler(object):
+    """Decides which cached tickers to refresh from the API first.
+
+    Cached tickers are kept in a heap ordered by staleness. Important tickers
+    (e.g., ones currently held or in the last desired portfolio) count as
+    Config.REFRESH_IMPORTANCE times staler, so they are refreshed sooner.
+    """
+
+    def __init__(self, price_store, important_tickers=()):
+        """Initialize the scheduler.
+
+        Args:
+            price_store {PriceStore}: Store holding the cached tickers.
+            important_tickers {iterable}: Tickers to refresh sooner.
+        """
+        self._price_store = price_store
+        self._important_tickers = set(important_tickers)
+        self._thread = None
+        self._stop_event = threading.Event()
+
+    def getQueue(self, ticker_list, now=None):
+        """Build a heap of cached tickers, most valuable to refresh first.
+
+        Args:
+            ticker_list {list}: Tickers to consider; uncached ones are skipped.
+            now {float}: Time to measure staleness from.
+        Returns:
+            queue {list}: Heap of (-priority, ticker) pairs.
+        """
+        if now is None:
+            now = time()
+        queue = []
+        for ticker in ticker_list:
+            timestamp = self._price_store.getTimestamp(ticker)
+            if timestamp is None:
+                continue
+            priority = now - timestamp
+            if ticker in self._important_tickers:
+                priority *= Config.REFRESH_IMPORTANCE
+            queue.append((-priority, ticker))
+        heapq.heapify(queue)
+        return queue
+
+    def getRefreshList(self, ticker_list, max_calls):
+        """Pick the most valuable tickers to refresh within a call budget.
+
+        Args:
+            ticker_list {list}: Tickers to consider.
+            max_calls {int}: Most tickers to pick.
+        Returns:
+            refresh_list {list}: Tickers to refresh, most valuable first.
+        """
+        queue = self.getQueue(ticker_list)
+        return [heapq.heappop(queue)[1]
+                for _ in xrange(min(max(0, max_calls), len(queue)))]
+
+    def start(self, ticker_list, refresh_function, max_calls, interval=0.0,
+              max_passes=None):
+        """Keep refreshing the stalest tickers on a background thread.
+
+        Each pass waits interval seconds, then picks up to max_calls tickers
+            by their staleness in the price store at that time, so tickers
+            refreshed by any pass go to the back of the queue.
+        Args:
+            ticker_list {list}: Tickers to consider, which may change between
+                passes.
+            refresh_function {function}: Called with the list of tickers to
+                refresh each pass. It should fetch from the API rather than
+                the local cache, and write the results to the price store.
+            max_calls {int}: Most tickers to refresh per pass.
+            interval {float}: Seconds to wait before each pass.
+            max_passes {int}: Passes to make, or None to run until stopped.
+        """
+        self.stop()
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(
+            ticker_list, refresh_function, max_calls, interval, max_passes))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stop the background thread, waiting for its current pass."""
+        if self._thread is not None:
+            self._stop_event.set()
+            self._thread.join()
+            self._thread = None
+
+    def _run(self, ticker_list, refresh_function, max_calls, interval,
+             max_passes):
+        num_passes = 0
+        while max_passes is None or num_passes < max_passes:
+            if self._stop_event.wait(interval):
+                break
+            num_passes += 1
+            try:
+                refresh_list = self.getRefreshList(ticker_list, max_calls)
+                if refresh_list:
+                    refresh_function(refresh_list)
+            except Exception:
+                # One failed pass, e.g. while the API is down, shouldn't end
+                # refreshing.
+                traceback.print_exc()
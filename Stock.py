@@ -1,12 +1,24 @@
 import numpy as np
 from scipy.stats import t
-from scipy.stats.mstats import gmean
 
 import Config
 
+# Dates are stored as int32 days since 1970-01-01.
+EPOCH = np.datetime64('1970-01-01', 'D')
+
 
 class Stock(object):
-    """Represent a single stock and its performance."""
+    """Represent a single stock and its performance.
+
+    Prices and dates are held as arrays, which buildStocks makes views into
+    arrays shared by every stock, so a Stock costs 12 bytes per trading day
+    plus a few scalars.
+    """
+
+    __slots__ = (
+        'ticker', 'expense_ratio', '_ordinals', '_price_array',
+        '_mean_annual_return', '_st_dev_annual_return', 'cons_annual_return',
+        '_log_return_sum', '_return_mean', '_return_squares')
 
     def __init__(self, ordered_date_dict, ticker, expense_ratio):
         """Initialize major values.
@@ -16,25 +28,85 @@ class Stock(object):
                 in order.
             ticker {string}: Ticker of this stock.
         """
-        self.ordered_date_dict = ordered_date_dict
+        self._setArrays(
+            np.array(ordered_date_dict.keys(), dtype='M8[D]'),
+            np.array(ordered_date_dict.values(), dtype=np.float64),
+            ticker, expense_ratio)
+        setStatistics([self])
+
+    @classmethod
+    def fromArrays(cls, date_array, price_array, ticker, expense_ratio):
+        """Create a stock from arrays of dates and prices.
+
+        Args:
+            date_array {array}: Sorted datetime64[D] trading days.
+            price_array {array}: float64 price on each day.
+            ticker {string}: Ticker of this stock.
+            expense_ratio {float}: Annual expense ratio of this stock.
+        Returns:
+            stock {Stock}: The stock.
+        """
+        stock = cls.__new__(cls)
+        stock._setArrays(date_array, price_array, ticker, expense_ratio)
+        setStatistics([stock])
+        return stock
+
+    @property
+    def date_array(self):
+        """Array of datetime64[D] trading days."""
+        return EPOCH + self._ordinals
+
+    @property
+    def return_array(self):
+        """Array of daily returns, net of expenses."""
+        return self._getReturnArray()
+
+    def _setArrays(self, date_array, price_array, ticker, expense_ratio):
+        """Store the stock's prices without calculating its statistics."""
         self.ticker = ticker
         self.expense_ratio = expense_ratio
+        self._ordinals = _getOrdinals(date_array)
+        self._price_array = np.asarray(price_array, dtype=np.float64)
 
-        self._price_array = self._getPriceArray()
-        self.return_array = self._getReturnArray()
-        self._mean_annual_return = self._getMeanAnnualReturn()
-        self._st_dev_annual_return = self._getStDevAnnualReturn()
-        self.cons_annual_return = self._getConservativeAnnualReturn(
-            Config.INITIAL_PERCENTILE)
-
-    def _getPriceArray(self):
-        """Extract the ordered_date_dict into an array of prices.
+    def appendPrices(self, date_array, price_array):
+        """Append later prices, updating the statistics in place.
 
-        Returns:
-            price_array {Array}: Array of stock prices.
+        Days on or before the last known day are ignored. The stock's arrays
+            are copied, so it stops sharing them with other stocks.
+        Args:
+            date_array {array}: Sorted datetime64[D] trading days.
+            price_array {array}: Price on each day.
         """
-        return np.array(
-            self.ordered_date_dict.values(), dtype=np.float64)
+        ordinals = _getOrdinals(date_array)
+        start = np.searchsorted(ordinals, self._ordinals[-1], side='right')
+        ordinals = ordinals[start:]
+        price_array = np.asarray(price_array[start:], dtype=np.float64)
+        if not len(ordinals):
+            return
+        prev_prices = np.concatenate(
+            ([self._price_array[-1]], price_array[:-1]))
+        new_returns = price_array / prev_prices * self._getDailyExpenseFactor()
+        num_old = len(self._price_array) - 1
+        self._ordinals = np.concatenate((self._ordinals, ordinals))
+        self._price_array = np.concatenate((self._price_array, price_array))
+
+        # Merge the new returns' mean and squared deviations into the old.
+        num_returns = num_old + len(new_returns)
+        new_mean = np.mean(new_returns)
+        delta = new_mean - self._return_mean
+        self._log_return_sum += np.log(new_returns).sum()
+        self._return_squares += (
+            np.sum((new_returns - new_mean) ** 2)
+            + delta * delta * num_old * len(new_returns) / num_returns)
+        self._return_mean += delta * len(new_returns) / num_returns
+
+        self._mean_annual_return = np.power(
+            np.exp(self._log_return_sum / num_returns), Config.DAYS_IN_YEAR)
+        self._st_dev_annual_return = np.sqrt(
+            self._return_squares / (num_returns - 1)) * np.power(
+                Config.DAYS_IN_YEAR, 0.5)
+        self.cons_annual_return = self._getConservativeAnnualReturn(
+            Config.INITIAL_PERCENTILE)
 
     def _getReturnArray(self):
         """Convert price_array to an array of returns.
@@ -43,36 +115,21 @@ class Stock(object):
             return_array {Array}: Array of daily stock returns.
         """
         raw_price_array = self._price_array[1:] / self._price_array[:-1]
-        daily_expense_ratio = np.power(float(1 + self.expense_ratio), 1.0 / Config.DAYS_IN_YEAR) - 1
-        price_array = raw_price_array * float(1 - daily_expense_ratio)
+        price_array = raw_price_array * self._getDailyExpenseFactor()
         return price_array
 
-    def _getMeanAnnualReturn(self):
-        """Calculate the mean annual return from the return_array.
+    def _getDailyExpenseFactor(self):
+        """Calculate what's left of each day's return after expenses.
 
         Returns:
-            mean_annual_return {float}: Artihmetic mean of daily stock returns,
-                extrapolated out to one year.
+            expense_factor {float}: One minus the daily expense ratio.
         """
-        return np.power(gmean(self.return_array), Config.DAYS_IN_YEAR)
-
-    def _getStDevAnnualReturn(self):
-        """Calculate the standard deviation of annual returns from return_array.
-
-        Returns:
-            st_dev_annual_return {float}: Standard deviation of annual returns,
-                extrapoted out to one year.
-        """
-        return np.std(self.return_array, ddof=1) * np.power(Config.DAYS_IN_YEAR, 0.5)
+        daily_expense_ratio = np.power(float(1 + self.expense_ratio), 1.0 / Config.DAYS_IN_YEAR) - 1
+        return float(1 - daily_expense_ratio)
 
     def _getConservativeAnnualReturn(self, p):
         """Calculate a conservative estimate of the annual return.
 
-        Note: The t-distribution is used instead of the normal distribution, as
-            I only assume that *years* are independent, not days. With a few
-            years of data on a given stock (~10-20), this stops mattering, but
-            for stocks with small amounts of data it means they'll take an
-            outsized hit from their standard deviations.
         Args:
             p {float}: The percentile at which to estimate the return.
         Returns:
@@ -80,11 +137,151 @@ class Stock(object):
                 annual return using t distribution, mean return, and st dev
                 return.
         """
-        years_of_data = np.true_divide(
-            len(self.return_array), Config.DAYS_IN_YEAR)
-        t_value = t.ppf(p, years_of_data)
-        initial_estimate = (self._mean_annual_return
-                            + (t_value
-                               * self._st_dev_annual_return
-                               / np.power(years_of_data, 0.5)))
-        return initial_estimate - initial_estimate * float(self.expense_ratio)
+        return _getConservativeReturns(
+            p, np.array([len(self._price_array) - 1]),
+            self._mean_annual_return, self._st_dev_annual_return,
+            np.array([float(self.expense_ratio)]))[0]
+
+
+def buildStocks(price_dict, expense_ratio_dict):
+    """Create stocks that share one date array and one price array.
+
+    Args:
+        price_dict {dict}: Dict of tickers to (dates, prices) arrays, with
+            dates sorted.
+        expense_ratio_dict {dict}: Dict of tickers to annual expense ratios.
+    Returns:
+        stock_dict {dict}: Dict of tickers to stocks.
+    """
+    tickers = sorted(price_dict)
+    lengths = [len(price_dict[ticker][0]) for ticker in tickers]
+    ends = np.cumsum(lengths)
+    ordinals = np.empty(sum(lengths), dtype=np.int32)
+    prices = np.empty(sum(lengths), dtype=np.float64)
+    stocks = []
+    for ticker, end, length in zip(tickers, ends, lengths):
+        (dates, ticker_prices) = price_dict[ticker]
+        ordinals[end - length:end] = _getOrdinals(dates)
+        prices[end - length:end] = ticker_prices
+        stock = Stock.__new__(Stock)
+        stock._setArrays(
+            ordinals[end - length:end], prices[end - length:end], ticker,
+            expense_ratio_dict[ticker])
+        stocks.append(stock)
+    setStatistics(stocks)
+    return dict(zip(tickers, stocks))
+
+
+def setStatistics(stocks):
+    """Calculate the statistics of many stocks in one vectorized pass.
+
+    Args:
+        stocks {list}: The stocks to update.
+    """
+    if not stocks:
+        return
+    lengths = np.array([len(stock._price_array) for stock in stocks])
+    num_returns = np.maximum(lengths - 1, 0)
+    starts = np.cumsum(lengths) - lengths
+    price_array = np.concatenate([stock._price_array for stock in stocks])
+    # Raw returns of all stocks end to end. The return across each boundary
+    # between two stocks is computed but left out of every sum.
+    raw_returns = np.empty(len(price_array))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        np.divide(price_array[1:], price_array[:-1], out=raw_returns[:-1])
+        raw_returns[-1:] = 1.0
+        raw_log_sums = _sumSegments(np.log(raw_returns), starts, num_returns)
+        # Shifting returns to be near zero keeps the sum of squares accurate.
+        raw_returns -= 1.0
+        shifted_sums = _sumSegments(raw_returns, starts, num_returns)
+        raw_returns *= raw_returns
+        shifted_squares = _sumSegments(raw_returns, starts, num_returns)
+
+        # Expenses scale every return of a stock by the same factor.
+        expense_factors = np.array(
+            [stock._getDailyExpenseFactor() for stock in stocks])
+        log_return_sums = raw_log_sums + num_returns * np.log(expense_factors)
+        return_means = (1.0 + shifted_sums / num_returns) * expense_factors
+        return_squares = (
+            shifted_squares - shifted_sums * shifted_sums / num_returns) * \
+            expense_factors * expense_factors
+        mean_annual_returns = np.power(
+            np.exp(log_return_sums / num_returns), Config.DAYS_IN_YEAR)
+        st_dev_annual_returns = np.sqrt(
+            return_squares / (num_returns - 1)) * np.power(
+                Config.DAYS_IN_YEAR, 0.5)
+        cons_annual_returns = _getConservativeReturns(
+            Config.INITIAL_PERCENTILE, num_returns, mean_annual_returns,
+            st_dev_annual_returns,
+            np.array([float(stock.expense_ratio) for stock in stocks]))
+
+    for i, stock in enumerate(stocks):
+        stock._log_return_sum = log_return_sums[i]
+        stock._return_mean = return_means[i]
+        stock._return_squares = return_squares[i]
+        stock._mean_annual_return = mean_annual_returns[i]
+        stock._st_dev_annual_return = st_dev_annual_returns[i]
+        stock.cons_annual_return = cons_annual_returns[i]
+
+
+def _sumSegments(values, starts, lengths):
+    """Sum consecutive segments of an array.
+
+    Args:
+        values {array}: The values to sum.
+        starts {array}: Index of each segment's first value.
+        lengths {array}: Number of values in each segment.
+    Returns:
+        sums {array}: Sum of each segment, 0 if empty.
+    """
+    indices = np.empty(2 * len(starts), dtype=np.intp)
+    indices[0::2] = starts
+    indices[1::2] = starts + lengths
+    sums = np.add.reduceat(values, np.minimum(indices, len(values) - 1))[0::2]
+    sums[lengths == 0] = 0.0
+    return sums
+
+
+def _getConservativeReturns(p, num_returns, mean_annual_returns,
+                            st_dev_annual_returns, expense_ratios):
+    """Calculate conservative estimates of annual returns.
+
+    Note: The t-distribution is used instead of the normal distribution, as
+        I only assume that *years* are independent, not days. With a few
+        years of data on a given stock (~10-20), this stops mattering, but
+        for stocks with small amounts of data it means they'll take an
+        outsized hit from their standard deviations.
+    Args:
+        p {float}: The percentile at which to estimate the returns.
+        num_returns {array}: Number of daily returns of each stock.
+        mean_annual_returns {array}: Mean annual return of each stock.
+        st_dev_annual_returns {array}: St dev of annual returns of each stock.
+        expense_ratios {array}: Annual expense ratio of each stock.
+    Returns:
+        cons_annual_returns {array}: Lower bound of confidence interval for
+            annual return using t distribution, mean return, and st dev
+            return.
+    """
+    years_of_data = np.true_divide(num_returns, Config.DAYS_IN_YEAR)
+    # Many stocks share a history length, so only look each one up once.
+    (distinct_years, inverse) = np.unique(years_of_data, return_inverse=True)
+    t_values = t.ppf(p, distinct_years)[inverse]
+    initial_estimates = (mean_annual_returns
+                         + (t_values
+                            * st_dev_annual_returns
+                            / np.power(years_of_data, 0.5)))
+    return initial_estimates - initial_estimates * expense_ratios
+
+
+def _getOrdinals(date_array):
+    """Convert trading days to int32 days since the epoch.
+
+    Args:
+        date_array {array}: datetime64 trading days, or int32 ordinals.
+    Returns:
+        ordinals {array}: int32 days since 1970-01-01.
+    """
+    date_array = np.asarray(date_array)
+    if date_array.dtype == np.int32:
+        return date_array
+    return (date_array.astype('M8[D]') - EPOCH).astype(np.int32)
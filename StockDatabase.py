@@ -1,8 +1,8 @@
-from collections import OrderedDict
-import datetime
+from bisect import bisect
 import numpy as np
 
 import Config
+from PriceSeries import cleanPrices
 
 
 class StockDatabase(object):
@@ -14,13 +14,197 @@ class StockDatabase(object):
         Args:
             stock_dict {dict}: Dict of stock objects.
         """
-        self.stock_dict = stock_dict
+        self.stock_dict = self._filterStocks(stock_dict)
         # Create a "standard" order of tickers.
         self.tickers = sorted(self.stock_dict.keys())
+        self.dates = self._getCommonDates()
         self.price_array = self._getFilteredPrices()
         self.price_change_array = self._getPriceChangeArray()
         # TODO: Need to add CASH as a valid investment.
 
+    @classmethod
+    def fromArrays(cls, stock_dict, price_series, dates, price_array,
+                   price_change_array):
+        """Create a database from already aligned arrays.
+
+        Args:
+            stock_dict {dict}: Dict of stock objects.
+            price_series {dict}: Dict of tickers to their cleaned, sorted
+                (dates, prices) arrays.
+            dates {array}: Sorted datetime64[D] days every ticker has a price.
+            price_array {array}: Rows = Dates, Columns = Tickers
+            price_change_array {array}: The percent changes of all prices.
+        Returns:
+            stock_db {StockDatabase}: The database.
+        """
+        stock_db = cls.__new__(cls)
+        stock_db.stock_dict = stock_dict
+        stock_db._price_series = price_series
+        stock_db.tickers = sorted(stock_dict.keys())
+        stock_db.dates = dates
+        stock_db._setPriceArray(price_array, price_change_array)
+        return stock_db
+
+    def _filterStocks(self, stock_dict):
+        """Clean each stock's prices, dropping stocks without enough data.
+
+        Args:
+            stock_dict {dict}: Dict of stock objects.
+        Returns:
+            stock_dict {dict}: Dict of the stocks with enough data.
+        """
+        self._price_series = {}
+        for ticker, stock in stock_dict.iteritems():
+            order = np.argsort(stock.date_array, kind='mergesort')
+            (dates, prices) = cleanPrices(
+                stock.date_array[order], stock._price_array[order])
+            if dates is not None:
+                self._price_series[ticker] = (dates, prices)
+        return dict((ticker, stock_dict[ticker])
+                    for ticker in self._price_series)
+
+    def appendPrices(self, price_dict):
+        """Append later prices, adding rows for days every ticker now has.
+
+        Each ticker's Stock is updated too. Days a ticker reports before the
+            others are kept until every ticker has them.
+        Args:
+            price_dict {dict}: Dict of tickers to sorted (dates, prices)
+                arrays. Days on or before a ticker's last known day are
+                ignored.
+        Returns:
+            num_dates {int}: Number of rows added.
+        """
+        for ticker, (dates, prices) in price_dict.iteritems():
+            (old_dates, old_prices) = self._price_series[ticker]
+            start = np.searchsorted(dates, old_dates[-1], side='right')
+            (dates, prices) = cleanPrices(
+                dates[start:], prices[start:], min_length=0)
+            if not len(dates):
+                continue
+            self._price_series[ticker] = (
+                np.concatenate((old_dates, dates)),
+                np.concatenate((old_prices, prices)))
+            self.stock_dict[ticker].appendPrices(dates, prices)
+
+        if len(self.dates):
+            new_dates = self._getCommonDates(after=self.dates[-1])
+        else:
+            new_dates = self._getCommonDates()
+        if not len(new_dates):
+            return 0
+        num_dates = len(self.dates)
+        new_prices = self._gatherPrices(new_dates)
+        self.dates = np.concatenate((self.dates, new_dates))
+        self._price_buffer = _appendRows(
+            self._price_buffer, num_dates, new_prices)
+        self.price_array = self._price_buffer[:len(self.dates)]
+        # Changes from the last old day through the new ones.
+        new_changes = self._getPriceChanges(
+            self.price_array[max(0, num_dates - 1):])
+        self._price_change_buffer = _appendRows(
+            self._price_change_buffer, max(0, num_dates - 1), new_changes)
+        self.price_change_array = self._price_change_buffer[
+            :max(0, len(self.dates) - 1)]
+        return len(new_dates)
+
+    def addStock(self, stock):
+        """Add a stock as a new column.
+
+        Days the stock has no price for are dropped from the database.
+        Args:
+            stock {Stock}: The stock to add.
+        Returns:
+            added {boolean}: False if the stock has too little data to add.
+        """
+        if stock.ticker in self.stock_dict:
+            raise ValueError('%s is already in the database.' % stock.ticker)
+        order = np.argsort(stock.date_array, kind='mergesort')
+        (dates, prices) = cleanPrices(
+            stock.date_array[order], stock._price_array[order])
+        if dates is None:
+            return False
+        self.stock_dict[stock.ticker] = stock
+        self._price_series[stock.ticker] = (dates, prices)
+        column = bisect(self.tickers, stock.ticker)
+        self.tickers.insert(column, stock.ticker)
+        if len(self.tickers) == 1:
+            self.dates = dates
+            self._setPriceArray(self._gatherPrices(dates))
+            return True
+
+        indices = np.searchsorted(dates, self.dates)
+        indices[indices == len(dates)] = 0
+        found = dates[indices] == self.dates
+        price_array = np.insert(
+            self.price_array, column, prices[indices], axis=1)
+        if found.all():
+            price_change_array = np.insert(
+                self.price_change_array, column,
+                self._getPriceChanges(
+                    price_array[:, column:column + 1], [stock.ticker])[:, 0],
+                axis=1)
+        else:
+            self.dates = self.dates[found]
+            price_array = price_array[found]
+            price_change_array = None
+        self._setPriceArray(price_array, price_change_array)
+        return True
+
+    def removeStock(self, ticker):
+        """Drop a stock's column.
+
+        Days that were only missing for this stock stay dropped until the
+            database is rebuilt.
+        Args:
+            ticker {string}: The ticker to remove.
+        """
+        column = self.tickers.index(ticker)
+        del self.tickers[column]
+        del self.stock_dict[ticker]
+        del self._price_series[ticker]
+        self._setPriceArray(
+            np.delete(self.price_array, column, axis=1),
+            np.delete(self.price_change_array, column, axis=1))
+
+    def _setPriceArray(self, price_array, price_change_array=None):
+        """Replace the price arrays.
+
+        Args:
+            price_array {array}: Rows = Dates, Columns = Tickers
+            price_change_array {array}: Its price changes, or None to
+                calculate them.
+        """
+        self.price_array = self._price_buffer = price_array
+        if price_change_array is None:
+            price_change_array = self._getPriceChangeArray()
+        self.price_change_array = price_change_array
+        self._price_change_buffer = price_change_array
+
+    def _getCommonDates(self, after=None):
+        """Intersect the tickers' trading days.
+
+        Args:
+            after {datetime64}: Only consider days after this one.
+        Returns:
+            dates {array}: Sorted datetime64[D] days every ticker has a price.
+        """
+        if not self._price_series:
+            return np.array([], dtype='M8[D]')
+        series = [dates for (dates, _) in self._price_series.itervalues()]
+        if after is not None:
+            series = [dates[np.searchsorted(dates, after, side='right'):]
+                      for dates in series]
+        common_dates = series[0]
+        # Each ticker's days are sorted, so membership is a binary search.
+        for dates in series[1:]:
+            if not len(dates):
+                return dates
+            indices = np.searchsorted(dates, common_dates)
+            indices[indices == len(dates)] = 0
+            common_dates = common_dates[dates[indices] == common_dates]
+        return common_dates
+
     def _getFilteredPrices(self):
         """Generate an array of all days with prices for every ticker.
 
@@ -29,34 +213,24 @@ class StockDatabase(object):
         Returns:
             price_array {array}: Rows = Dates, Columns = Tickers
         """
-        # Create dict of dates to tickers to prices.
-        date_dict = {}
-        for stock in self.stock_dict.values():
-            for date in stock.ordered_date_dict.keys():
-                if date not in date_dict:
-                    date_dict[date] = {}
-                date_dict[date][stock.ticker] = stock.ordered_date_dict[date]
-
-        # Remove dates w/ missing tickers.
-        for date in date_dict.keys():
-            if len(date_dict[date].keys()) < len(self.stock_dict.keys()):
-                del date_dict[date]
-            elif datetime.datetime.strptime(date, '%Y-%m-%d') > Config.TODAY:
-                del date_dict[date]
-
-        # Order the dates.
-        ordered_date_dict = OrderedDict(
-            sorted(date_dict.items(), key=lambda t: t[0]))
-
-        # Convert ordered date dict of prices, to the same thing in an array.
+        price_array = self._gatherPrices(self.dates)
+        self._price_buffer = price_array
+        return price_array
+
+    def _gatherPrices(self, dates):
+        """Gather every ticker's prices on days they all have.
+
+        Args:
+            dates {array}: Sorted datetime64[D] days to gather.
+        Returns:
+            price_array {array}: Rows = Dates, Columns = Tickers
+        """
         # Rows = dates, columns = tickers, makes easier splicing.
         # Ticker order = self.tickers
-        price_array = np.array([
-            [
-                ordered_date_dict[date][ticker]
-                for ticker in self.tickers]
-            for date in ordered_date_dict], dtype=np.float64)
-
+        price_array = np.empty((len(dates), len(self.tickers)))
+        for i, ticker in enumerate(self.tickers):
+            (ticker_dates, prices) = self._price_series[ticker]
+            price_array[:, i] = prices[np.searchsorted(ticker_dates, dates)]
         return price_array
 
     def _getPriceChangeArray(self):
@@ -65,14 +239,52 @@ class StockDatabase(object):
         Returns:
             price_change_array {array}: The percent changes of all prices.
         """
-        prices = self.price_array[1:]
-        prev_prices = self.price_array[:-1]
+        price_changes = self._getPriceChanges(self.price_array)
+        self._price_change_buffer = price_changes
+        return price_changes
+
+    def _getPriceChanges(self, price_array, tickers=None):
+        """Calculate the price changes of consecutive rows, net of expenses.
+
+        Args:
+            price_array {array}: Rows = Dates, Columns = Tickers
+            tickers {list}: The tickers of price_array's columns, if not
+                self.tickers.
+        Returns:
+            price_changes {array}: One fewer row of price changes.
+        """
+        prices = price_array[1:]
+        prev_prices = price_array[:-1]
         raw_price_changes = prices / prev_prices
+        if tickers is None:
+            tickers = self.tickers
         expense_array = np.array(
-            [self.stock_dict[ticker].expense_ratio for ticker in self.tickers], dtype=np.float64)
+            [self.stock_dict[ticker].expense_ratio for ticker in tickers], dtype=np.float64)
         expense_array = np.power(
             expense_array + 1.0, 1.0 / Config.DAYS_IN_YEAR) - 1.0
         expense_array = 1.0 - expense_array
         price_changes = raw_price_changes * \
             np.transpose(expense_array[:, None])
         return price_changes
+
+
+def _appendRows(buffer_array, num_rows, rows):
+    """Write rows after the first num_rows of a buffer, growing it if needed.
+
+    The buffer at least doubles when it grows, so appending is amortized
+    constant time per row.
+    Args:
+        buffer_array {array}: The buffer, with num_rows rows in use.
+        num_rows {int}: Number of rows in use.
+        rows {array}: Rows to write after them.
+    Returns:
+        buffer_array {array}: The buffer holding the rows, which may be new.
+    """
+    if num_rows + len(rows) > len(buffer_array):
+        new_buffer = np.empty(
+            (max(2 * len(buffer_array), num_rows + len(rows)),)
+            + rows.shape[1:])
+        new_buffer[:num_rows] = buffer_array[:num_rows]
+        buffer_array = new_buffer
+    buffer_array[num_rows:num_rows + len(rows)] = rows
+    return buffer_array
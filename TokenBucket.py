@@ -0,0 +1,39 @@
+import threading
+from time import sleep, time
+
+
+class TokenBucket(object):
+    """Thread-safe token bucket rate limiter.
+
+    Tokens refill continuously at rate per second up to capacity, and each
+    call to acquire takes one, so callers can burst up to capacity and then
+    average at most rate calls per second.
+    """
+
+    def __init__(self, rate, capacity=1):
+        """Initialize the bucket full.
+
+        Args:
+            rate {float}: Tokens added per second.
+            capacity {int}: Most tokens the bucket holds.
+        """
+        self._rate = float(rate)
+        self._capacity = float(capacity)
+        self._tokens = float(capacity)
+        self._last_time = time()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available, then take it."""
+        while True:
+            with self._lock:
+                now = time()
+                self._tokens = min(
+                    self._capacity,
+                    self._tokens + (now - self._last_time) * self._rate)
+                self._last_time = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self._rate
+            sleep(wait)
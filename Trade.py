@@ -1,3 +1,8 @@
+import numpy as np
+
+from Portfolio import Portfolio
+
+
 class Trade(object):
     """This represents a single potential trade.
 
@@ -29,8 +34,30 @@ class Trade(object):
         self.trade_percentage = None
         # Correlation of hypothetical new portfolio with desired portfolio.
         self.new_correlation = None
-        # TODO-implement
-        pass
+        self._getBuySellAndPercent()
+        if self.buy_ticker is not None:
+            self._getNewCorrelation()
+
+    @classmethod
+    def fromValues(cls, buy_ticker, sell_ticker, trade_percentage,
+                   new_correlation):
+        """Create an already evaluated trade.
+
+        Args:
+            buy_ticker {string}: Which investment to buy.
+            sell_ticker {string}: Which investment to sell.
+            trade_percentage {float}: How much to shift between them.
+            new_correlation {float}: Correlation of the portfolio after the
+                trade with the desired portfolio.
+        Returns:
+            trade {Trade}: The trade.
+        """
+        trade = cls.__new__(cls)
+        trade.buy_ticker = buy_ticker
+        trade.sell_ticker = sell_ticker
+        trade.trade_percentage = trade_percentage
+        trade.new_correlation = new_correlation
+        return trade
 
     def _getBuySellAndPercent(self):
         """Set the buy_ticker, sell_ticker, and trade_percentage.
@@ -40,14 +67,31 @@ class Trade(object):
             to be bought, and the lesser of how over- / underweight they are
             as the trade percentage.
         """
-        # TODO-implement
-        pass
+        differences = (self.curr_portfolio.allocation_array
+                       - self._desired_portfolio.allocation_array)
+        difference1 = differences[self._stock_db.tickers.index(self._ticker1)]
+        difference2 = differences[self._stock_db.tickers.index(self._ticker2)]
+        if difference1 > 0 and difference2 < 0:
+            (self.sell_ticker, self.buy_ticker) = (self._ticker1, self._ticker2)
+        elif difference1 < 0 and difference2 > 0:
+            (self.sell_ticker, self.buy_ticker) = (self._ticker2, self._ticker1)
+        else:
+            return
+        self.trade_percentage = min(abs(difference1), abs(difference2))
 
     def _getNewCorrelation(self):
         """Determine the correlation after this trade with desired portfolio.
-        
+
         Generates a new temporary portfolio with backtested returns.
         """
-        # Use utils.
-        # TODO-implement
-        pass
\ No newline at end of file
+        allocation_array = np.array(
+            self.curr_portfolio.allocation_array, dtype=np.float64)
+        allocation_array[self._stock_db.tickers.index(self.sell_ticker)] -= \
+            self.trade_percentage
+        allocation_array[self._stock_db.tickers.index(self.buy_ticker)] += \
+            self.trade_percentage
+        new_portfolio = Portfolio(
+            self._stock_db, percent_allocations=allocation_array)
+        self.new_correlation = np.corrcoef(
+            new_portfolio.backtested_returns,
+            self._desired_portfolio.backtested_returns)[0, 1]
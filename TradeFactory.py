@@ -1,3 +1,8 @@
+import numpy as np
+
+from Trade import Trade
+
+
 class TradeFactory(object):
     """Gets a list of trades and their resulting effects on correlations."""
 
@@ -8,16 +13,74 @@ class TradeFactory(object):
             current_portfolio {Portfolio}: Current investments and backtests.
             desired_portfolio {Portfolio}: Desired investments and backtests.
         """
-        # TODO-implement
-        pass
+        self._stock_db = current_portfolio._stock_db
+        self._current_portfolio = current_portfolio
+        self._desired_portfolio = desired_portfolio
+        self.trade_list = self._getTradeList()
 
     def _getTradeList(self):
         """Generate a list of trades sorted by final correlation.
 
         For every combination (not permutation) of tickers, try to trade them
-            and find the outcome correlation.
+            and find the outcome correlation. Only an overweight ticker can be
+            sold for an underweight one. Trading a from sell s to buy b shifts
+            the backtested returns by a * (x_b - x_s), so with covariances
+            against each ticker computed once, every pair's correlation is
+            closed form rather than a new Portfolio.
         Returns:
             trade_list {list}: List of sorted trades by correlation.
         """
-        # TODO-implement
-        pass
\ No newline at end of file
+        differences = (self._current_portfolio.allocation_array
+                       - self._desired_portfolio.allocation_array)
+        sells = np.flatnonzero(differences > 0)
+        buys = np.flatnonzero(differences < 0)
+        if not len(sells) or not len(buys):
+            return []
+        # Rows = sells, columns = buys.
+        trade_percentages = np.minimum(
+            differences[sells][:, None], -differences[buys][None, :])
+
+        # Sums of products of centered values. The shared 1 / (n - 1) cancels
+        # out of every correlation.
+        sell_changes = _center(self._stock_db.price_change_array[:, sells])
+        buy_changes = _center(self._stock_db.price_change_array[:, buys])
+        current_returns = _center(self._current_portfolio.backtested_returns)
+        desired_returns = _center(self._desired_portfolio.backtested_returns)
+
+        # cov(current + a * (x_b - x_s), desired)
+        desired_changes = (np.dot(desired_returns, buy_changes)[None, :]
+                           - np.dot(desired_returns, sell_changes)[:, None])
+        new_covariances = (np.dot(current_returns, desired_returns)
+                           + trade_percentages * desired_changes)
+        # var(current + a * (x_b - x_s))
+        current_changes = (np.dot(current_returns, buy_changes)[None, :]
+                           - np.dot(current_returns, sell_changes)[:, None])
+        pair_variances = (
+            np.einsum('ij,ij->j', sell_changes, sell_changes)[:, None]
+            + np.einsum('ij,ij->j', buy_changes, buy_changes)[None, :]
+            - 2 * np.dot(sell_changes.T, buy_changes))
+        new_variances = (np.dot(current_returns, current_returns)
+                         + 2 * trade_percentages * current_changes
+                         + trade_percentages ** 2 * pair_variances)
+        new_correlations = new_covariances / np.sqrt(
+            new_variances * np.dot(desired_returns, desired_returns))
+
+        order = np.argsort(-new_correlations, axis=None, kind='mergesort')
+        return [
+            Trade.fromValues(
+                self._stock_db.tickers[buys[j]],
+                self._stock_db.tickers[sells[i]],
+                trade_percentages[i, j], new_correlations[i, j])
+            for i, j in zip(*np.unravel_index(order, new_correlations.shape))]
+
+
+def _center(values):
+    """Subtract the mean of each column.
+
+    Args:
+        values {array}: Rows = Dates, with one column or many.
+    Returns:
+        centered {array}: The values less their column means.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    return values - values.mean(axis=0)
@@ -1,18 +1,27 @@
 import argparse
 import datetime
 import math
+from multiprocessing import Pool
+import numpy as np
 
 import Config
+from DatabaseCache import DatabaseCache
 import DataIO
+from OptimizationServer import OptimizationServer
 from Portfolio import Portfolio
-from PortfolioFactory import PortfolioFactory
-from Stock import Stock
+from PortfolioFactory import PortfolioFactory, SOLVERS
+from RebalancePlanner import RebalancePlanner
+from Stock import buildStocks
 from StockDatabase import StockDatabase
+from TradeFactory import TradeFactory
 
 
-def getInputData():
+def getInputData(refresh=True):
     """Get all necessary input data for running a model.
 
+    Args:
+        refresh {boolean}: Whether to refresh cached tickers from the API.
+            Missing tickers are fetched either way.
     Returns:
         current_portfolio {Portfolio}: A Portfolio of current investments.
         stock_db {StockDatabase}: A database of all necessary stock info.
@@ -25,20 +34,30 @@ def getInputData():
     ticker_list, expense_ratio_dict = DataIO.getTickerList(
         'data/tickers_expenses.csv')
 
-    # Get raw data.
-    raw_data = DataIO.getRawData(ticker_list)
+    # Bring the price store up to date, refreshing held tickers sooner.
+    ticker_list = DataIO.updatePriceStore(
+        ticker_list, important_tickers=getImportantTickers(current_alloc_dict),
+        max_calls=None if refresh else 0)
+
+    # Reuse the database built from the same prices, if there is one.
+    database_cache = DatabaseCache()
+    key = database_cache.getKey(
+        expense_ratio_dict, DataIO.getStoreEntries(ticker_list))
+    stock_db = database_cache.load(key)
+    if stock_db is None:
+        raw_data = DataIO.loadRawData(ticker_list)
 
-    # Create all stock objects.
-    stock_dict = {}
-    for ticker in raw_data.keys():
-        stock_dict[ticker] = Stock(
-            raw_data[ticker], ticker, expense_ratio_dict[ticker])
+        # Create all stock objects.
+        stock_dict = buildStocks(raw_data, expense_ratio_dict)
 
-    if not len(stock_dict.keys()):
-        raise ValueError('No keys found.')
+        if not len(stock_dict.keys()):
+            raise ValueError('No keys found.')
 
-    # Create stock database.
-    stock_db = StockDatabase(stock_dict)
+        # Create stock database.
+        stock_db = StockDatabase(stock_dict)
+        database_cache.save(key, stock_db)
+    else:
+        print('Loaded database %s.' % key)
 
     # Create current portfolio.
     current_portfolio = Portfolio(
@@ -47,28 +66,60 @@ def getInputData():
     return current_portfolio, stock_db
 
 
+def getImportantTickers(current_alloc_dict):
+    """Get the tickers to refresh sooner than others.
+
+    Args:
+        current_alloc_dict {dict}: Dict of tickers to current percentage
+            allocations.
+    Returns:
+        important_tickers {set}: Held tickers, and those in the last desired
+            portfolio.
+    """
+    return set(current_alloc_dict).union(
+        DataIO.getLastDesiredTickers('output'))
+
+
 def getTrades(current_portfolio, desired_portfolio):
     """Get a list of potential trades to get to a desired correlation.
 
     Args:
         current_portfolio {Portfolio}: A Portfolio of current investments.
         desired_portfolio {Portfolio}: A Portfolio with chosen weights.
+    Returns:
+        trade_factory {TradeFactory}: Trades ranked by resulting correlation.
     """
     # Create trade factory between current and desired portfolio.
-    # tf = TradeFactory.TradeFactory(current_portfolio, desired_portfolio)
+    return TradeFactory(current_portfolio, desired_portfolio)
 
-    return {}
 
-
-def optimizeForReturn(required_return, stock_db, use_genetic):
+def optimizeForReturn(
+        required_return, stock_db, use_genetic, num_workers=1, chunk_size=None,
+        solver='binary', max_time=3600, max_evaluations=None,
+        init_allocation=None, init_trade_amount=1, polish=True):
     """Optimize and write a solution for a given return.
 
     Args:
         required_return (float): What return to require.
         stock_db {StockDatabase}: A database of all necessary stock info.
+        use_genetic {boolean}: Whether to seed with the genetic algorithm.
+        num_workers {int}: Number of processes for the binary solver.
+        chunk_size {int}: Sells handed to a worker process at a time.
+        solver {string}: Which PortfolioFactory solver to run.
+        max_time {float}: Seconds the solver may run.
+        max_evaluations {int}: Candidate budget for the annealing solver.
+        init_allocation {array}: Allocation to warm start from.
+        init_trade_amount {float}: First trade size for the binary solver.
+        polish {boolean}: Whether to finish the gradient solver with a short
+            binary solve.
     """
     print('Optimizing portfolio for %f' % required_return)
-    pf = PortfolioFactory(stock_db, required_return, use_genetic=use_genetic)
+    pf = PortfolioFactory(
+        stock_db, required_return, use_genetic=use_genetic,
+        num_workers=num_workers, chunk_size=chunk_size, solver=solver,
+        max_time=max_time, max_evaluations=max_evaluations,
+        init_allocation=init_allocation, init_trade_amount=init_trade_amount,
+        polish=polish)
     desired_portfolio = pf.desired_portfolio
     print('Required Return: %f' % required_return)
     print('Expected Return: %f' % math.pow(
@@ -88,6 +139,133 @@ def optimizeForReturn(required_return, stock_db, use_genetic):
     return desired_portfolio
 
 
+def sweepReturns(required_returns, stock_db, sweep_workers, solver_args):
+    """Optimize and write solutions along the efficient frontier.
+
+    Each required return is warm started from the solution for the one below
+        it. With several workers, the sorted returns are split into
+        contiguous runs that are each warm started in turn.
+    Args:
+        required_returns {list}: What returns to require.
+        stock_db {StockDatabase}: A database of all necessary stock info.
+        sweep_workers {int}: Number of processes to split the returns over.
+        solver_args {dict}: Keyword arguments for optimizeForReturn.
+    Returns:
+        desired_portfolios {list}: Scored portfolios, in the order of the
+            sorted required returns.
+    """
+    global _sweep_stock_db
+    required_returns = sorted(required_returns)
+    if sweep_workers > 1:
+        # Workers are forked with the database rather than pickling it.
+        _sweep_stock_db = stock_db
+        pool = Pool(sweep_workers)
+        try:
+            chunks = [
+                (list(chunk), solver_args)
+                for chunk in np.array_split(required_returns, sweep_workers)
+                if len(chunk)]
+            allocations = sum(pool.map(_sweepChunk, chunks, 1), [])
+        finally:
+            # Don't leave workers behind on an error.
+            pool.terminate()
+            pool.join()
+    else:
+        allocations = _sweep(required_returns, stock_db, solver_args)
+
+    desired_portfolios = []
+    for required_return, allocation_array in zip(
+            required_returns, allocations):
+        portfolio = Portfolio(stock_db, percent_allocations=allocation_array)
+        portfolio.getScore(required_return)
+        desired_portfolios.append(portfolio)
+    DataIO.writeFrontier(
+        required_returns, desired_portfolios,
+        'output/Frontier_%.0f_%s.csv' % (
+            Config.MINIMUM_AMOUNT_DATA, Config.TODAY.date()))
+    return desired_portfolios
+
+
+# Database shared with forked sweep workers.
+_sweep_stock_db = None
+
+
+def _sweepChunk(input_args):
+    """Run a contiguous run of a sweep in a pool process."""
+    (required_returns, solver_args) = input_args
+    return _sweep(required_returns, _sweep_stock_db, solver_args)
+
+
+def _sweep(required_returns, stock_db, solver_args):
+    """Optimize required returns in order, warm starting each from the last.
+
+    Args:
+        required_returns {list}: What returns to require, sorted.
+        stock_db {StockDatabase}: A database of all necessary stock info.
+        solver_args {dict}: Keyword arguments for optimizeForReturn.
+    Returns:
+        allocations {list}: Allocation array for each required return.
+    """
+    allocations = []
+    init_allocation = None
+    init_trade_amount = 1
+    for required_return in required_returns:
+        desired_portfolio = optimizeForReturn(
+            required_return, stock_db, init_allocation=init_allocation,
+            init_trade_amount=init_trade_amount, **solver_args)
+        init_allocation = desired_portfolio.allocation_array
+        init_trade_amount = Config.WARM_START_TRADE_AMOUNT
+        allocations.append(init_allocation)
+    return allocations
+
+
+def serve(current_portfolio, stock_db, port, refresh=True):
+    """Answer optimization requests until interrupted.
+
+    Args:
+        current_portfolio {Portfolio}: A Portfolio of current investments.
+        stock_db {StockDatabase}: A database of all necessary stock info.
+        port {int}: Localhost port to serve on.
+        refresh {boolean}: Whether to keep refreshing the database.
+    """
+    current_alloc_dict = dict(
+        (ticker, allocation) for ticker, allocation in zip(
+            stock_db.tickers, current_portfolio.allocation_array)
+        if allocation)
+    server = OptimizationServer(
+        stock_db, current_alloc_dict, port=port,
+        refresh_interval=None if refresh else 0,
+        important_tickers=getImportantTickers(current_alloc_dict))
+    print('Serving on http://127.0.0.1:%d' % server.server_address[1])
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+def _parseReturns(text):
+    """Parse required returns as a list (1.03,1.05) or range (1.03:1.10:0.01).
+
+    Args:
+        text {string}: Comma separated returns, or an inclusive
+            start:stop:step range.
+    Returns:
+        required_returns {list}: The required returns.
+    Raises:
+        ValueError: If a range's step is zero or steps away from its stop.
+    """
+    if ':' in text:
+        (start, stop, step) = [float(part) for part in text.split(':')]
+        if step == 0 or (stop - start) / step < 0:
+            raise ValueError('Step %f cannot reach %f from %f.' % (
+                step, stop, start))
+        num_steps = int(round((stop - start) / step))
+        return [round(start + i * step, 10) for i in xrange(num_steps + 1)]
+    return [float(part) for part in text.split(',')]
+
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('--desired_return', type=float,
@@ -99,13 +277,45 @@ def main():
     parser.add_argument('--set_date', type=str, help='Some date to run as')
     parser.add_argument('--use_genetic', dest='use_genetic',
                         action='store_true')
+    parser.add_argument('--num_workers', type=int, default=1,
+                        help='Number of processes for the binary solver.')
+    parser.add_argument('--chunk_size', type=int,
+                        help='Sells handed to a worker process at a time.')
+    parser.add_argument('--solver', choices=SOLVERS, default='binary',
+                        help='Which optimizer to run.')
+    parser.add_argument('--max_time', type=float, default=3600,
+                        help='Seconds the solver may run.')
+    parser.add_argument('--max_evaluations', type=int,
+                        help='Candidate budget for the annealing solver.')
+    parser.add_argument('--sweep_returns', type=_parseReturns,
+                        help='Returns to sweep, e.g. 1.03:1.10:0.01 or '
+                        '1.03,1.05.')
+    parser.add_argument('--sweep_workers', type=int, default=1,
+                        help='Number of processes to split a sweep over.')
+    parser.add_argument('--serve', action='store_true',
+                        help='Keep the database resident and answer '
+                        'requests on localhost.')
+    parser.add_argument('--port', type=int, default=Config.SERVER_PORT,
+                        help='Port for --serve.')
+    parser.add_argument('--refresh', dest='refresh', action='store_true',
+                        help='Refresh cached tickers from the API, the '
+                        'default unless --no-solve.')
+    parser.add_argument('--no-refresh', dest='refresh', action='store_false')
+    parser.add_argument('--polish', dest='polish', action='store_true')
+    parser.add_argument('--no-polish', dest='polish', action='store_false')
     parser.set_defaults(solve=True)
+    parser.set_defaults(polish=True)
+    parser.set_defaults(refresh=None)
     parser.set_defaults(use_genetic=False)
     args = parser.parse_args()
     required_return = args.desired_return
 
-    if not args.desired_return and args.solve:
-        raise ValueError('Desired return or no-solve must be specified.')
+    if not (args.desired_return or args.sweep_returns or args.serve) \
+            and args.solve:
+        raise ValueError(
+            'Desired return, sweep returns, or no-solve must be specified.')
+    if args.sweep_workers > 1 and args.num_workers > 1:
+        raise ValueError('Sweep workers cannot start solver workers.')
 
     if args.set_date:
         Config.TODAY = datetime.datetime.strptime(
@@ -117,22 +327,49 @@ def main():
     print('Reading data...')
 
     # Get initial data.
-    current_portfolio, stock_db = getInputData()
+    # Without refreshing, an unchanged store loads the cached database.
+    refresh = args.solve if args.refresh is None else args.refresh
+    current_portfolio, stock_db = getInputData(refresh=refresh)
 
     # Write stock database.
     DataIO.writeStockDatabase(stock_db, 'output/StockDatabase.csv')
 
+    if args.serve:
+        # A run as of a set date has nothing new to refresh.
+        serve(current_portfolio, stock_db, args.port,
+              refresh=args.refresh is not False and not args.set_date)
+        return
+
     if not args.solve:
         return
 
+    solver_args = {
+        'use_genetic': args.use_genetic,
+        'num_workers': args.num_workers,
+        'chunk_size': args.chunk_size,
+        'solver': args.solver,
+        'max_time': args.max_time,
+        'max_evaluations': args.max_evaluations,
+        'polish': args.polish,
+    }
+    if args.sweep_returns:
+        sweepReturns(
+            args.sweep_returns, stock_db, args.sweep_workers, solver_args)
+        return
+
     desired_portfolio = optimizeForReturn(
-        required_return, stock_db, args.use_genetic)
+        required_return, stock_db, **solver_args)
 
     tf = getTrades(current_portfolio, desired_portfolio)
 
     # Print trade factory.
     DataIO.writeTrades(tf, 'data/Trades.csv')
 
+    # Print the trades to make, in order.
+    DataIO.writeTrades(
+        RebalancePlanner(current_portfolio, desired_portfolio),
+        'data/RebalancePlan.csv')
+
 
 if __name__ == '__main__':
     main()
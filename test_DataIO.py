@@ -0,0 +1,161 @@
+import numpy as np
+import os
+import shutil
+import tempfile
+from time import time
+import unittest
+
+import Config
+import DataIO
+from PriceStore import PriceStore
+from RecordedApiServer import RecordedApiServer, recordDailyAdjusted
+from TokenBucket import TokenBucket
+
+
+class Test_DataIO(unittest.TestCase):
+
+    def setUp(self):
+        self.dates = np.array(
+            ['2017-01-02', '2017-01-03', '2017-01-04'], dtype='M8[D]')
+        self.prices = np.array([1.0, 2.0, 3.0])
+
+    def test_mergeCompactData(self):
+        compact_data = (
+            np.array(['2017-01-04', '2017-01-05'], dtype='M8[D]'),
+            np.array([3.0, 4.0]), 100.0)
+        (dates, prices, timestamp) = DataIO._mergeCompactData(
+            self.dates, self.prices, compact_data)
+        self.assertEqual(dates.astype(str).tolist(), [
+            '2017-01-02', '2017-01-03', '2017-01-04', '2017-01-05'])
+        self.assertEqual(prices.tolist(), [1.0, 2.0, 3.0, 4.0])
+        self.assertEqual(timestamp, 100.0)
+
+    def test_mergeCompactDataReadjusted(self):
+        # A split re-adjusted the overlapping close.
+        compact_data = (
+            np.array(['2017-01-04', '2017-01-05'], dtype='M8[D]'),
+            np.array([1.5, 2.0]), 100.0)
+        self.assertIsNone(DataIO._mergeCompactData(
+            self.dates, self.prices, compact_data))
+
+    def test_mergeCompactDataNoOverlap(self):
+        compact_data = (
+            np.array(['2017-02-01'], dtype='M8[D]'), np.array([4.0]), 100.0)
+        self.assertIsNone(DataIO._mergeCompactData(
+            self.dates, self.prices, compact_data))
+
+    def test_parseTimeSeries(self):
+        text = (
+            '{"Meta Data": {"1. Information": "Daily"}, '
+            '"Time Series (Daily)": {'
+            '"2017-01-04": {"4. close": "9.0", "5. adjusted close": "3.0000",'
+            ' "6. volume": "100"}, '
+            '"2017-01-03": {"5. adjusted close": "2.5000"}}}')
+        (dates, prices) = DataIO._parseTimeSeries(text)
+        self.assertEqual(
+            dates.astype(str).tolist(), ['2017-01-03', '2017-01-04'])
+        self.assertEqual(prices.tolist(), [2.5, 3.0])
+        self.assertIsNone(DataIO._parseTimeSeries(
+            '{"Note": "Thank you for using the API."}'))
+
+    def test_stringToFloat(self):
+        self.assertEqual(DataIO._stringToFloat('0.04%'), 0.0004)
+        self.assertEqual(DataIO._stringToFloat('-$1,470.50'), -1470.5)
+
+    def test_refreshTicker(self):
+        directory = tempfile.mkdtemp()
+        old_store = DataIO.price_store
+        old_call_api = DataIO._callApi
+        calls = []
+
+        def callApi(ticker, size, use_local_cache=True):
+            # Refreshes always reach the API.
+            self.assertFalse(use_local_cache)
+            calls.append((ticker, size))
+            return {ticker: (
+                np.array(['2017-01-04', '2017-01-05'], dtype='M8[D]'),
+                np.array([1.5, 2.0]), 100.0)}
+
+        DataIO.price_store = PriceStore(os.path.join(directory, 'store'))
+        DataIO._callApi = callApi
+        try:
+            DataIO._refreshTicker('A')
+            DataIO.price_store.write('B', self.dates, self.prices, 0.0)
+            DataIO._refreshTicker('B')
+        finally:
+            DataIO.price_store = old_store
+            DataIO._callApi = old_call_api
+            shutil.rmtree(directory)
+        # Uncached tickers and disagreeing overlaps fall back to full.
+        self.assertEqual(
+            calls, [('A', 'full'), ('B', 'compact'), ('B', 'full')])
+
+    def test_getAPIData(self):
+        dates = np.arange(
+            np.datetime64(Config.TODAY.date(), 'D') - 4,
+            np.datetime64(Config.TODAY.date(), 'D') + 1).astype(str).tolist()
+        recordings = {}
+        for t in range(6):
+            recordings['T%d' % t] = recordDailyAdjusted(
+                dates, [t + 1.0] * len(dates))
+        server = RecordedApiServer(recordings, num_503s={'T0': 2})
+        directory = tempfile.mkdtemp()
+        old_config = (
+            Config.BASE_REQUEST, Config.API_BACKOFF,
+            Config.MINIMUM_AMOUNT_DATA)
+        old_rate_limiter = DataIO.rate_limiter
+        old_store = DataIO.price_store
+        Config.BASE_REQUEST = server.getBaseRequest()
+        Config.API_BACKOFF = 0.001
+        Config.MINIMUM_AMOUNT_DATA = 5
+        DataIO.rate_limiter = TokenBucket(1000)
+        DataIO.price_store = PriceStore(os.path.join(directory, 'store'))
+        try:
+            cache_data = DataIO._getAPIData(sorted(recordings))
+            store = PriceStore(os.path.join(directory, 'store'))
+            stored_tickers = sorted(store.getTickers())
+            stored_prices = store.read('T3')[1].tolist()
+        finally:
+            server.stop()
+            (Config.BASE_REQUEST, Config.API_BACKOFF,
+             Config.MINIMUM_AMOUNT_DATA) = old_config
+            DataIO.rate_limiter = old_rate_limiter
+            DataIO.price_store = old_store
+            shutil.rmtree(directory)
+        self.assertEqual(sorted(cache_data.keys()), sorted(recordings))
+        self.assertEqual(cache_data['T3'][1].tolist(), [4.0] * 5)
+        self.assertEqual(stored_tickers, sorted(recordings))
+        self.assertEqual(stored_prices, [4.0] * 5)
+        # T0 was retried through its 503s.
+        self.assertEqual(server.requests.count(('T0', 'full')), 3)
+
+    def test_updatePriceStoreWithoutCalls(self):
+        directory = tempfile.mkdtemp()
+        old_store = DataIO.price_store
+        old_call_api = DataIO._callApi
+        old_minimum = Config.MINIMUM_AMOUNT_DATA
+        calls = []
+
+        def callApi(ticker, size, use_local_cache=True):
+            calls.append((ticker, size))
+
+        Config.MINIMUM_AMOUNT_DATA = 3
+        DataIO.price_store = PriceStore(os.path.join(directory, 'store'))
+        DataIO._callApi = callApi
+        try:
+            for ticker in ('A', 'B'):
+                DataIO.price_store.write(
+                    ticker, self.dates, self.prices, time() - 60.0)
+            ticker_list = DataIO.updatePriceStore(['A', 'B'], max_calls=0)
+        finally:
+            DataIO.price_store = old_store
+            DataIO._callApi = old_call_api
+            Config.MINIMUM_AMOUNT_DATA = old_minimum
+            shutil.rmtree(directory)
+        # Fresh cached tickers aren't refreshed without a call budget.
+        self.assertEqual(ticker_list, ['A', 'B'])
+        self.assertEqual(calls, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
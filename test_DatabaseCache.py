@@ -0,0 +1,106 @@
+from decimal import Decimal
+import numpy as np
+import os
+import shutil
+import tempfile
+import unittest
+
+import Config
+from DatabaseCache import DatabaseCache
+from Stock import Stock, buildStocks
+from StockDatabase import StockDatabase
+
+
+class Test_DatabaseCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = DatabaseCache(
+            os.path.join(self.directory, 'database_cache'), max_entries=2)
+        self.old_minimum = Config.MINIMUM_AMOUNT_DATA
+        Config.MINIMUM_AMOUNT_DATA = 4
+        dates = np.arange(
+            np.datetime64('2018-01-01'), np.datetime64('2018-01-11'))
+        self.price_dict = {
+            'A': (dates, 10.0 + np.arange(10.0)),
+            'B': (dates[[0, 1, 2, 4, 5, 6, 7, 8, 9]], 20.0 - np.arange(9.0)),
+            'C': (dates[2:], 5.0 + np.arange(8.0) % 3)
+        }
+        self.expense_ratio_dict = {'A': 0.0, 'B': 0.01, 'C': Decimal('0.5')}
+        self.entry_dict = dict(
+            (ticker, {'num_rows': len(dates), 'checksum': i})
+            for i, (ticker, (dates, _)) in enumerate(
+                sorted(self.price_dict.items())))
+
+    def tearDown(self):
+        Config.MINIMUM_AMOUNT_DATA = self.old_minimum
+        shutil.rmtree(self.directory)
+
+    def getDatabase(self):
+        return StockDatabase(
+            buildStocks(self.price_dict, self.expense_ratio_dict))
+
+    def test_getKey(self):
+        key = self.cache.getKey(self.expense_ratio_dict, self.entry_dict)
+        self.assertEqual(
+            key, self.cache.getKey(self.expense_ratio_dict, self.entry_dict))
+        self.entry_dict['A'] = dict(self.entry_dict['A'], timestamp=1.0)
+        self.assertEqual(
+            key, self.cache.getKey(self.expense_ratio_dict, self.entry_dict))
+
+        self.entry_dict['A']['checksum'] = 100
+        self.assertNotEqual(
+            key, self.cache.getKey(self.expense_ratio_dict, self.entry_dict))
+        self.entry_dict['A']['checksum'] = 0
+        self.expense_ratio_dict['A'] = 0.1
+        self.assertNotEqual(
+            key, self.cache.getKey(self.expense_ratio_dict, self.entry_dict))
+        self.expense_ratio_dict['A'] = 0.0
+        Config.MINIMUM_AMOUNT_DATA = 5
+        self.assertNotEqual(
+            key, self.cache.getKey(self.expense_ratio_dict, self.entry_dict))
+
+    def test_saveLoad(self):
+        self.assertIsNone(self.cache.load('missing'))
+        expected = self.getDatabase()
+        self.cache.save('key', expected)
+        stock_db = self.cache.load('key')
+
+        self.assertListEqual(stock_db.tickers, expected.tickers)
+        self.assertListEqual(stock_db.dates.tolist(), expected.dates.tolist())
+        self.assertTrue(
+            np.array_equal(stock_db.price_array, expected.price_array))
+        self.assertTrue(np.array_equal(
+            stock_db.price_change_array, expected.price_change_array))
+        for ticker in expected.tickers:
+            stock = stock_db.stock_dict[ticker]
+            expected_stock = expected.stock_dict[ticker]
+            self.assertEqual(stock.ticker, ticker)
+            self.assertEqual(
+                stock.expense_ratio, float(expected_stock.expense_ratio))
+            self.assertEqual(
+                stock.cons_annual_return, expected_stock.cons_annual_return)
+            self.assertListEqual(
+                stock.date_array.tolist(), expected_stock.date_array.tolist())
+
+        # A loaded database can still be updated.
+        (dates, prices) = self.price_dict['A']
+        stock_db.addStock(Stock.fromArrays(
+            dates, prices * 2, 'D', 0.0))
+        self.assertEqual(stock_db.price_array.shape, (7, 4))
+        self.assertTrue(np.array_equal(
+            self.cache.load('key').price_array, expected.price_array))
+
+    def test_prune(self):
+        stock_db = self.getDatabase()
+        for key in ('a', 'b', 'c'):
+            self.cache.save(key, stock_db)
+            os.utime(os.path.join(self.directory, 'database_cache', key),
+                     (ord(key), ord(key)))
+        self.cache.save('d', stock_db)
+        self.assertEqual(sorted(os.listdir(
+            os.path.join(self.directory, 'database_cache'))), ['c', 'd'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import numpy as np
+import unittest
+
+import Config
+import Portfolio as Portfolio_module
+from MaskedStatsCache import MaskedStatsCache
+
+
+class FakeStockDatabase(object):
+
+    def __init__(self, price_change_array):
+        self.price_change_array = price_change_array
+        self.tickers = range(price_change_array.shape[1])
+
+
+class Test_MaskedStatsCache(unittest.TestCase):
+
+    def setUp(self):
+        Config.DAYS_IN_YEAR = 1
+        np.random.seed(0)
+        market = 0.01 * np.random.randn(200, 1)
+        self.price_change_array = (
+            1.0005 + market + 0.005 * np.random.randn(200, 8))
+        self.stock_db = FakeStockDatabase(self.price_change_array)
+        self.portfolio = Portfolio_module.Portfolio(
+            self.stock_db,
+            percent_allocations=[0.5, 0.3, 0.2, 0, 0, 0, 0, 0])
+        self.cache = MaskedStatsCache(self.price_change_array)
+        self.cache.rebase(self.portfolio, 1.0)
+
+    def assertMatchesDirect(self, allocation_matrix):
+        allocation_matrix = np.asarray(allocation_matrix, dtype=np.float64)
+        returns_matrix = np.matmul(
+            self.price_change_array, allocation_matrix.T)
+        expected = Portfolio_module._getDownsideCorrels(
+            self.price_change_array, allocation_matrix, returns_matrix, 1.0)
+        actual = self.cache.getDownsideCorrels(
+            allocation_matrix, returns_matrix, 1.0)
+        for k in range(len(allocation_matrix)):
+            self.assertAlmostEqual(actual[k], expected[k])
+
+    def test_tradeCandidates(self):
+        # Each trade flips a few dates in or out of the base mask.
+        allocation_matrix = []
+        for buy in range(1, 8):
+            allocations = np.copy(self.portfolio.allocation_array)
+            allocations[0] -= 0.25
+            allocations[buy] += 0.25
+            allocation_matrix.append(allocations)
+        self.assertMatchesDirect(allocation_matrix)
+
+    def test_soldOut(self):
+        self.assertMatchesDirect([[0, 0.3, 0.2, 0.5, 0, 0, 0, 0]])
+
+    def test_directFallback(self):
+        # Two tickers outside the base support can't use the cache.
+        self.assertMatchesDirect([[0.2, 0.2, 0.2, 0.2, 0.2, 0, 0, 0]])
+
+    def test_rebaseSameKey(self):
+        cross_products = self.cache._cross_products
+        self.cache.rebase(self.portfolio, 1.0)
+        self.assertIs(self.cache._cross_products, cross_products)
+
+    def test_sharesPriceChanges(self):
+        # A mapped array isn't copied into each worker process.
+        self.assertIs(self.cache._price_changes, self.price_change_array)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,167 @@
+import csv
+import json
+import numpy as np
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+import urllib2
+
+import Config
+import DataIO
+from OptimizationServer import OptimizationServer
+from PriceStore import PriceStore
+from RecordedApiServer import RecordedApiServer, recordDailyAdjusted
+from Stock import buildStocks
+from StockDatabase import StockDatabase
+from TokenBucket import TokenBucket
+
+
+class Test_OptimizationServer(unittest.TestCase):
+
+    def setUp(self):
+        self.old_minimum = Config.MINIMUM_AMOUNT_DATA
+        Config.MINIMUM_AMOUNT_DATA = 4
+        random_state = np.random.RandomState(2)
+        self.dates = np.arange(
+            np.datetime64('2018-01-01'), np.datetime64('2018-04-01'))
+        self.price_dict = {}
+        for ticker in 'ABCD':
+            self.price_dict[ticker] = (self.dates, 10 * np.cumprod(
+                1 + 0.01 * random_state.randn(len(self.dates))))
+        stock_db = StockDatabase(buildStocks(
+            dict((ticker, (dates[:-5], prices[:-5]))
+                 for ticker, (dates, prices) in self.price_dict.iteritems()),
+            dict.fromkeys(self.price_dict, 0.001)))
+        self.directory = tempfile.mkdtemp()
+        self.server = OptimizationServer(
+            stock_db, {'A': 0.5, 'B': 0.5}, port=0, refresh_interval=0,
+            trades_filename=os.path.join(self.directory, 'Trades.csv'),
+            plan_filename=os.path.join(self.directory, 'RebalancePlan.csv'))
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.stop()
+        self.thread.join()
+        shutil.rmtree(self.directory)
+        Config.MINIMUM_AMOUNT_DATA = self.old_minimum
+
+    def request(self, path, body=None):
+        url = 'http://127.0.0.1:%d%s' % (self.server.server_address[1], path)
+        try:
+            response = urllib2.urlopen(
+                url, None if body is None else json.dumps(body))
+            return response.getcode(), json.loads(response.read())
+        except urllib2.HTTPError as e:
+            return e.code, json.loads(e.read())
+
+    def test_score(self):
+        (status, response) = self.request(
+            '/score', {'allocations': {'A': 0.25, 'C': 0.75},
+                       'required_return': 1.0})
+        self.assertEqual(status, 200)
+        self.assertEqual(response['allocations'], {'A': 0.25, 'C': 0.75})
+        self.assertIn('score', response)
+
+        (status, response) = self.request(
+            '/score', {'allocations': {'Z': 1.0}, 'required_return': 1.0})
+        self.assertEqual(status, 400)
+        self.assertIn('Z', response['error'])
+        self.assertEqual(self.request('/score', {})[0], 400)
+        self.assertEqual(self.request('/missing', {})[0], 404)
+
+    def test_optimize(self):
+        (status, response) = self.request(
+            '/optimize', {'required_return': 1.0, 'solver': 'gradient',
+                          'polish': False})
+        self.assertEqual(status, 200)
+        self.assertAlmostEqual(sum(response['allocations'].values()), 1.0)
+        self.assertEqual(self.request(
+            '/optimize', {'required_return': 1.0, 'solver': 'magic'})[0], 400)
+
+    def test_trades(self):
+        (status, response) = self.request(
+            '/trades', {'allocations': {'C': 0.5, 'D': 0.5}})
+        self.assertEqual(status, 200)
+        self.assertTrue(response['trades'])
+        with open(os.path.join(self.directory, 'RebalancePlan.csv')) as f:
+            rows = list(csv.reader(f))
+        self.assertEqual(len(rows), len(response['trades']) + 1)
+        self.assertTrue(
+            os.path.exists(os.path.join(self.directory, 'Trades.csv')))
+
+    def test_applyPrices(self):
+        (status, response) = self.request('/status')
+        self.assertEqual(status, 200)
+        self.assertEqual(response['num_dates'], len(self.dates) - 5)
+        # Unknown tickers are ignored.
+        self.price_dict['Z'] = self.price_dict['A']
+        self.assertEqual(self.server.applyPrices(self.price_dict), 5)
+        response = self.request('/status')[1]
+        self.assertEqual(response['num_dates'], len(self.dates))
+        self.assertEqual(response['last_date'], str(self.dates[-1]))
+        self.assertEqual(response['num_refreshed'], 4)
+
+    def test_importantTickers(self):
+        server = OptimizationServer(
+            self.server.stock_db, {'A': 1.0}, port=0, refresh_interval=3600,
+            important_tickers=['A', 'C'])
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            # The last desired portfolio's tickers count as much as held ones.
+            self.assertEqual(
+                server._scheduler._important_tickers, set(['A', 'C']))
+        finally:
+            server.stop()
+            thread.join()
+
+    def test_refresh(self):
+        store_directory = tempfile.mkdtemp()
+        old_config = (Config.BASE_REQUEST, Config.TODAY)
+        old_rate_limiter = DataIO.rate_limiter
+        old_store = DataIO.price_store
+        DataIO.rate_limiter = TokenBucket(1000)
+        DataIO.price_store = PriceStore(
+            os.path.join(store_directory, 'store'))
+        for ticker, (dates, prices) in self.price_dict.iteritems():
+            DataIO.price_store.write(ticker, dates[:-5], prices[:-5], 0.0)
+        recordings = {}
+        api_server = RecordedApiServer(recordings)
+        Config.BASE_REQUEST = api_server.getBaseRequest()
+
+        def record(num_dates):
+            for ticker, (dates, prices) in self.price_dict.iteritems():
+                recordings[ticker] = recordDailyAdjusted(
+                    dates[num_dates - 20:num_dates].astype(str).tolist(),
+                    prices[num_dates - 20:num_dates])
+
+        try:
+            record(len(self.dates) - 3)
+            self.server._refresh(['A', 'B', 'C', 'D'])
+            timestamp = DataIO.price_store.getTimestamp('A')
+            first_status = self.request('/status')[1]
+            # The second refresh reaches the API for its new days.
+            record(len(self.dates))
+            self.server._refresh(['A', 'B', 'C', 'D'])
+            second_status = self.request('/status')[1]
+            num_stored = len(DataIO.price_store.read('A')[0])
+            self.assertGreater(
+                DataIO.price_store.getTimestamp('A'), timestamp)
+        finally:
+            api_server.stop()
+            (Config.BASE_REQUEST, Config.TODAY) = old_config
+            DataIO.rate_limiter = old_rate_limiter
+            DataIO.price_store = old_store
+            shutil.rmtree(store_directory)
+        self.assertEqual(api_server.requests.count(('A', 'compact')), 2)
+        self.assertEqual(num_stored, len(self.dates))
+        self.assertEqual(first_status['num_dates'], len(self.dates) - 3)
+        self.assertEqual(second_status['num_dates'], len(self.dates))
+        self.assertEqual(second_status['num_refreshed'], 8)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -6,7 +6,8 @@ import unittest
 import Config
 from Stock import Stock
 from StockDatabase import StockDatabase
-from Portfolio import Portfolio
+import Portfolio as Portfolio_module
+from Portfolio import Portfolio, getBatchScores
 
 
 class Test_Portfolio(unittest.TestCase):
@@ -115,6 +116,79 @@ class Test_Portfolio(unittest.TestCase):
         self.assertAlmostEqual(portfolio.score, -5.80858974126046)
         self.assertAlmostEqual(score, -5.80858974126046)
 
+    def test_getTradeScore(self):
+        portfolio = Portfolio(
+            self.stock_db, percent_allocations=[0.5, 0.4, 0.1])
+        traded = Portfolio(
+            self.stock_db, percent_allocations=[0.4, 0.4, 0.2])
+        score = portfolio.getTradeScore(1.021, 0, 2, 0.1)
+        self.assertAlmostEqual(score, traded.getScore(1.021))
+        # The original portfolio is untouched.
+        self.assertListEqual(list(portfolio.allocation_array), [0.5, 0.4, 0.1])
+
+    def test_getTradeScores(self):
+        portfolio = Portfolio(
+            self.stock_db, percent_allocations=[0.5, 0.4, 0.1])
+        scores, average_returns, _, _ = portfolio.getTradeScores(
+            1.023, [0, 1], [2, 2], [0.1, 0.2])
+        traded = Portfolio(
+            self.stock_db, percent_allocations=[0.5, 0.2, 0.3])
+        self.assertAlmostEqual(scores[0], portfolio.getTradeScore(
+            1.023, 0, 2, 0.1))
+        self.assertAlmostEqual(scores[1], traded.getScore(1.023))
+        self.assertAlmostEqual(average_returns[1], traded.average_return)
+
+    def test_getBatchScores(self):
+        allocation_matrix = [[0.5, 0.4, 0.1], [0.2, 0.3, 0.5]]
+        scores, average_returns, downside_risks, downside_correls = (
+            getBatchScores(self.stock_db, allocation_matrix, 1.023))
+        for k, allocations in enumerate(allocation_matrix):
+            portfolio = Portfolio(
+                self.stock_db, percent_allocations=allocations)
+            self.assertAlmostEqual(scores[k], portfolio.getScore(1.023))
+            self.assertAlmostEqual(
+                average_returns[k], portfolio.average_return)
+            self.assertAlmostEqual(
+                downside_risks[k], portfolio.downside_risk)
+            self.assertAlmostEqual(
+                downside_correls[k], portfolio.downside_correl)
+
+    def test_getDownsideCorrelsMatchesCorrcoef(self):
+        np.random.seed(0)
+        price_change_array = 1.0 + 0.01 * np.random.randn(50, 6)
+        allocation_matrix = np.random.rand(3, 6)
+        allocation_matrix /= allocation_matrix.sum(axis=1)[:, None]
+        returns_matrix = np.matmul(price_change_array, allocation_matrix.T)
+        downside_correls = Portfolio_module._getDownsideCorrels(
+            price_change_array, allocation_matrix, returns_matrix, 1.0)
+        for k in range(3):
+            below_desired = returns_matrix[:, k] < 1.0
+            correl = np.corrcoef(
+                price_change_array[below_desired], rowvar=False)
+            self.assertAlmostEqual(
+                downside_correls[k],
+                np.dot(np.dot(allocation_matrix[k], correl),
+                       allocation_matrix[k]))
+
+    def test_getScoreGradient(self):
+        allocations = np.array([0.5, 0.4, 0.1])
+        portfolio = Portfolio(
+            self.stock_db, percent_allocations=allocations)
+        gradient = portfolio.getScoreGradient(1.023)
+        # Central differences, small enough not to move any date across.
+        epsilon = 1e-7
+        for i in range(3):
+            step = np.zeros(3)
+            step[i] = epsilon
+            higher = Portfolio(
+                self.stock_db, percent_allocations=allocations + step)
+            lower = Portfolio(
+                self.stock_db, percent_allocations=allocations - step)
+            self.assertAlmostEqual(
+                gradient[i],
+                (higher.getScore(1.023) - lower.getScore(1.023))
+                / (2 * epsilon), 4)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,12 +1,13 @@
 from collections import OrderedDict
 from decimal import Decimal
+import numpy as np
 import unittest
 
 import Config
 from Stock import Stock
 from StockDatabase import StockDatabase
 from Portfolio import Portfolio
-from PortfolioFactory import PortfolioFactory
+from PortfolioFactory import PortfolioFactory, _projectToSimplex
 
 
 class Test_Portfolio(unittest.TestCase):
@@ -61,6 +62,60 @@ class Test_Portfolio(unittest.TestCase):
         self.assertAlmostEqual(
             pf.desired_portfolio.score, 16.123, 3)
 
+    def test_parallelMatchesSerial(self):
+        serial = PortfolioFactory(self.stock_db, 1.0)
+        parallel = PortfolioFactory(
+            self.stock_db, 1.0, num_workers=2, chunk_size=1)
+        self.assertListEqual(
+            list(parallel.desired_portfolio.allocation_array),
+            list(serial.desired_portfolio.allocation_array))
+        self.assertEqual(
+            parallel.desired_portfolio.score,
+            serial.desired_portfolio.score)
+
+    def test_warmStart(self):
+        cold = PortfolioFactory(self.stock_db, 1.0)
+        warm = PortfolioFactory(
+            self.stock_db, 1.0,
+            init_allocation=cold.desired_portfolio.allocation_array,
+            init_trade_amount=0.125)
+        self.assertAlmostEqual(
+            warm.desired_portfolio.score, cold.desired_portfolio.score)
+
+    def test_anneal(self):
+        np.random.seed(0)
+        pf = PortfolioFactory(
+            self.stock_db, 1.0, solver='anneal', max_evaluations=4096)
+        self.assertAlmostEqual(
+            pf.desired_portfolio.allocation_array[0], 0.481, 2)
+        self.assertAlmostEqual(
+            pf.desired_portfolio.allocation_array.sum(), 1.0)
+
+    def test_gradient(self):
+        pf = PortfolioFactory(
+            self.stock_db, 1.0, solver='gradient', polish=False)
+        self.assertAlmostEqual(
+            pf.desired_portfolio.allocation_array[0], 0.481, 2)
+        self.assertAlmostEqual(
+            pf.desired_portfolio.allocation_array.sum(), 1.0)
+
+    def test_lineSearch(self):
+        pf = PortfolioFactory(self.stock_db, 1.0, solver='line_search')
+        self.assertAlmostEqual(
+            pf.desired_portfolio.allocation_array[0], 0.481, 3)
+        self.assertAlmostEqual(
+            pf.desired_portfolio.score, 16.123, 3)
+
+    def test_projectToSimplex(self):
+        projected = _projectToSimplex(np.array([0.8, 0.6, -0.2]))
+        self.assertAlmostEqual(projected[0], 0.6)
+        self.assertAlmostEqual(projected[1], 0.4)
+        self.assertEqual(projected[2], 0.0)
+
+    def test_unknownSolver(self):
+        with self.assertRaises(ValueError):
+            PortfolioFactory(self.stock_db, 1.0, solver='bogus')
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,50 @@
+import datetime
+import numpy as np
+import unittest
+
+import Config
+from PriceSeries import cleanPrices
+
+
+class Test_PriceSeries(unittest.TestCase):
+
+    def setUp(self):
+        self.dates = np.arange(
+            np.datetime64('2018-01-01'), np.datetime64('2018-01-06'))
+        self.prices = np.array([1.0, 0.001, 3.0, np.nan, 5.0])
+
+    def test_cleanPrices(self):
+        (dates, prices) = cleanPrices(
+            self.dates, self.prices, as_of=datetime.datetime(2018, 1, 5),
+            min_length=2)
+        # The as-of day is kept, bad prices are dropped.
+        self.assertEqual(
+            dates.astype(str).tolist(),
+            ['2018-01-01', '2018-01-03', '2018-01-05'])
+        self.assertEqual(prices.tolist(), [1.0, 3.0, 5.0])
+
+    def test_cleanPricesAsOf(self):
+        (dates, prices) = cleanPrices(
+            self.dates, self.prices,
+            as_of=datetime.datetime(2018, 1, 3, 12), min_length=2)
+        self.assertEqual(prices.tolist(), [1.0, 3.0])
+
+    def test_cleanPricesTooShort(self):
+        self.assertEqual(
+            cleanPrices(
+                self.dates, self.prices,
+                as_of=datetime.datetime(2018, 1, 3), min_length=3),
+            (None, None))
+
+    def test_cleanPricesDefaults(self):
+        Config.MINIMUM_AMOUNT_DATA = 4
+        Config.TODAY = datetime.datetime(2018, 1, 5)
+        try:
+            self.assertEqual(
+                cleanPrices(self.dates, self.prices), (None, None))
+        finally:
+            Config.TODAY = datetime.datetime.today()
+
+
+if __name__ == '__main__':
+    unittest.main()
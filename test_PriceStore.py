@@ -0,0 +1,175 @@
+import bz2
+import cPickle as pickle
+from decimal import Decimal
+import json
+import numpy as np
+import os
+import shutil
+import tempfile
+from time import time
+import unittest
+
+import Config
+import DataIO
+from PriceStore import CODECS, PriceStore
+
+
+class Test_PriceStore(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store = PriceStore(os.path.join(self.directory, 'price_store'))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_writeRead(self):
+        self.assertFalse(self.store.exists())
+        self.store.write(
+            'A', ['2017-01-03', '2017-01-02'], [Decimal('2.5'), 1.5], 100.0)
+        self.assertTrue(self.store.exists())
+
+        store = PriceStore(os.path.join(self.directory, 'price_store'))
+        self.assertEqual(store.getTickers(), ['A'])
+        self.assertEqual(store.getTimestamp('A'), 100.0)
+        self.assertIsNone(store.getTimestamp('B'))
+        (dates, prices) = store.read('A')
+        self.assertEqual(
+            dates.astype(str).tolist(), ['2017-01-02', '2017-01-03'])
+        self.assertEqual(prices.tolist(), [1.5, 2.5])
+
+    def test_manifest(self):
+        self.store.write('A', ['2017-01-02', '2017-01-03'], [1.5, 2.5], 100.0)
+        entry = PriceStore(
+            os.path.join(self.directory, 'price_store')).getEntry('A')
+        self.assertEqual(entry['timestamp'], 100.0)
+        self.assertEqual(entry['num_rows'], 2)
+        self.assertEqual(entry['first_date'], '2017-01-02')
+        self.assertEqual(entry['last_date'], '2017-01-03')
+        self.assertTrue(self.store.verify('A'))
+        self.assertFalse(self.store.verify('B'))
+
+        # Rewriting the same prices only touches the manifest.
+        os.utime(self.store._getFilename('A', 'raw'), (1000, 1000))
+        self.store.write('A', ['2017-01-02', '2017-01-03'], [1.5, 2.5], 200.0)
+        self.assertEqual(os.path.getmtime(self.store._getFilename('A', 'raw')), 1000)
+        self.assertEqual(self.store.getTimestamp('A'), 200.0)
+
+        np.save(self.store._getFilename('A', 'raw'), np.zeros(
+            2, dtype=self.store.read('A')[0].base.dtype))
+        self.assertFalse(self.store.verify('A'))
+
+    def test_codecs(self):
+        for codec in CODECS:
+            store = PriceStore(os.path.join(self.directory, codec), codec)
+            store.write(
+                'A', ['2017-01-03', '2017-01-02'], [2.5, 1.5], 100.0)
+            (dates, prices) = PriceStore(
+                os.path.join(self.directory, codec)).read('A')
+            self.assertEqual(
+                dates.astype(str).tolist(), ['2017-01-02', '2017-01-03'])
+            self.assertEqual(prices.tolist(), [1.5, 2.5])
+            self.assertEqual(store.getEntry('A')['codec'], codec)
+            self.assertTrue(store.verify('A'))
+        self.assertRaises(
+            ValueError, PriceStore, self.directory, 'snappy')
+
+    def test_convert(self):
+        self.store.write('A', ['2017-01-02', '2017-01-03'], [1.5, 2.5], 100.0)
+        entry = self.store.getEntry('A')
+        store = PriceStore(os.path.join(self.directory, 'price_store'), 'zlib')
+        self.assertEqual(store.convert(), 1)
+        self.assertEqual(store.convert(), 0)
+        self.assertFalse(os.path.exists(store._getFilename('A', 'raw')))
+        self.assertTrue(os.path.exists(store._getFilename('A', 'zlib')))
+        self.assertEqual(
+            store.getEntry('A'), dict(entry, codec='zlib'))
+        self.assertEqual(store.read('A')[1].tolist(), [1.5, 2.5])
+
+    def test_migrateIndex(self):
+        self.store.write('A', ['2017-01-02', '2017-01-03'], [1.5, 2.5], 100.0)
+        entry = self.store.getEntry('A')
+        os.remove(self.store._getManifestFilename())
+        with open(self.store._getIndexFilename(), 'w') as f:
+            json.dump({'A': 100.0}, f)
+        store = PriceStore(os.path.join(self.directory, 'price_store'))
+        self.assertEqual(store.getEntry('A'), entry)
+        self.assertFalse(os.path.exists(store._getIndexFilename()))
+
+    def test_migratePickleCache(self):
+        cache_directory = os.path.join(self.directory, 'cache_files')
+        os.mkdir(cache_directory)
+        contents = {
+            '2017-01-02': Decimal('1.5'),
+            '2017-01-03': Decimal('2.5'),
+            '_timestamp': 100.0
+        }
+        with bz2.BZ2File(
+                os.path.join(cache_directory, 'A.pkl.bz2'), 'wb') as f:
+            f.write(pickle.dumps(contents))
+        # No timestamp, so it's dropped like the old cache would.
+        with bz2.BZ2File(
+                os.path.join(cache_directory, 'B.pkl.bz2'), 'wb') as f:
+            f.write(pickle.dumps({'2017-01-02': Decimal('1.0')}))
+
+        self.assertEqual(self.store.migratePickleCache(cache_directory), 1)
+        self.assertEqual(self.store.getTickers(), ['A'])
+        self.assertEqual(self.store.getTimestamp('A'), 100.0)
+        self.assertEqual(self.store.read('A')[1].tolist(), [1.5, 2.5])
+
+    def test_retrieveCache(self):
+        old_store = DataIO.price_store
+        old_minimum = Config.MINIMUM_AMOUNT_DATA
+        DataIO.price_store = self.store
+        Config.MINIMUM_AMOUNT_DATA = 2
+        try:
+            dates = np.arange(
+                np.datetime64(Config.TODAY.date(), 'D') - 2,
+                np.datetime64(Config.TODAY.date(), 'D') + 2)
+            self.store.write('A', dates, [1.0, 0.001, 3.0, 4.0], time())
+            self.store.write('B', dates, [1.0, 2.0, 3.0, 4.0], 0.0)
+            self.store.write('C', dates, [0.0, 0.0, 3.0, 4.0], time())
+            # Too short by the manifest alone, so never decoded.
+            self.store.write('E', dates[:1], [1.0], time())
+
+            output = DataIO._retrieveCacheFiles(['A', 'B', 'C', 'D', 'E'])
+            self.assertEqual(sorted(output.keys()), ['A', 'C', 'E'])
+            self.assertEqual(output['C'], 'too_short')
+            self.assertEqual(output['E'], 'too_short')
+            # Future dates and tiny prices are dropped.
+            self.assertEqual(
+                output['A'][0][:2].tolist(), dates[[0, 2]].tolist())
+            self.assertEqual(output['A'][1].tolist()[:2], [1.0, 3.0])
+            self.assertEqual(
+                output['A'][2], self.store.getTimestamp('A'))
+        finally:
+            DataIO.price_store = old_store
+            Config.MINIMUM_AMOUNT_DATA = old_minimum
+
+    def test_retrieveCacheLoaders(self):
+        old_store = DataIO.price_store
+        old_config = (Config.MINIMUM_AMOUNT_DATA, Config.CACHE_LOADER)
+        DataIO.price_store = self.store
+        Config.MINIMUM_AMOUNT_DATA = 2
+        try:
+            dates = np.arange(
+                np.datetime64(Config.TODAY.date(), 'D') - 4,
+                np.datetime64(Config.TODAY.date(), 'D'))
+            for t in range(4):
+                self.store.write(
+                    'T%d' % t, dates, np.arange(4.0) + t, time())
+            outputs = []
+            for loader in ('serial', 'thread', 'process'):
+                Config.CACHE_LOADER = loader
+                outputs.append(DataIO._retrieveCacheFiles(
+                    ['T0', 'T1', 'T2', 'T3']))
+        finally:
+            DataIO.price_store = old_store
+            (Config.MINIMUM_AMOUNT_DATA, Config.CACHE_LOADER) = old_config
+        for output in outputs:
+            self.assertEqual(sorted(output), ['T0', 'T1', 'T2', 'T3'])
+            self.assertEqual(output['T3'][1].tolist(), [3.0, 4.0, 5.0, 6.0])
+
+
+if __name__ == '__main__':
+    unittest.main()
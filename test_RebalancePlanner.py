@@ -0,0 +1,111 @@
+import numpy as np
+import unittest
+
+import Config
+from Portfolio import Portfolio
+from RebalancePlanner import RebalancePlanner
+from Stock import buildStocks
+from StockDatabase import StockDatabase
+from TradeFactory import TradeFactory
+
+
+class Test_RebalancePlanner(unittest.TestCase):
+
+    def setUp(self):
+        self.old_minimum = Config.MINIMUM_AMOUNT_DATA
+        Config.MINIMUM_AMOUNT_DATA = 4
+        random_state = np.random.RandomState(1)
+        dates = np.arange(
+            np.datetime64('2018-01-01'), np.datetime64('2018-04-01'))
+        price_dict = {}
+        for ticker in 'ABCDEFGH':
+            price_dict[ticker] = (dates, 10 * np.cumprod(
+                1 + 0.01 * random_state.randn(len(dates))))
+        self.stock_db = StockDatabase(
+            buildStocks(price_dict, dict.fromkeys(price_dict, 0.001)))
+        self.current_portfolio = Portfolio(
+            self.stock_db,
+            percent_allocations=[0.3, 0.25, 0.1, 0.2, 0.15, 0, 0, 0])
+        self.desired_portfolio = Portfolio(
+            self.stock_db,
+            percent_allocations=[0.1, 0.05, 0.1, 0, 0.15, 0.3, 0.2, 0.1])
+
+    def tearDown(self):
+        Config.MINIMUM_AMOUNT_DATA = self.old_minimum
+
+    def test_getTradeList(self):
+        planner = RebalancePlanner(
+            self.current_portfolio, self.desired_portfolio,
+            target_correlation=2.0, max_trades=100)
+        trade_list = planner.trade_list
+        best_trade = TradeFactory(
+            self.current_portfolio, self.desired_portfolio).trade_list[0]
+        self.assertEqual(trade_list[0].sell_ticker, best_trade.sell_ticker)
+        self.assertEqual(trade_list[0].buy_ticker, best_trade.buy_ticker)
+
+        # Each trade's correlation is that of the portfolio after it.
+        allocation_array = np.array(self.current_portfolio.allocation_array)
+        for trade in trade_list:
+            allocation_array[self.stock_db.tickers.index(
+                trade.sell_ticker)] -= trade.trade_percentage
+            allocation_array[self.stock_db.tickers.index(
+                trade.buy_ticker)] += trade.trade_percentage
+            portfolio = Portfolio(
+                self.stock_db, percent_allocations=allocation_array)
+            self.assertAlmostEqual(trade.new_correlation, np.corrcoef(
+                portfolio.backtested_returns,
+                self.desired_portfolio.backtested_returns)[0, 1])
+        # With no target, it trades all the way to the desired portfolio.
+        self.assertTrue(np.allclose(
+            allocation_array, self.desired_portfolio.allocation_array))
+        self.assertAlmostEqual(planner.correlation, 1.0)
+        self.assertLessEqual(len(trade_list), 7)
+
+    def test_greedy(self):
+        trade_list = RebalancePlanner(
+            self.current_portfolio, self.desired_portfolio,
+            target_correlation=2.0, max_trades=100).trade_list
+
+        # Every step takes the best trade of all those then open.
+        allocation_array = np.array(self.current_portfolio.allocation_array)
+        for trade in trade_list:
+            differences = (
+                allocation_array - self.desired_portfolio.allocation_array)
+            best = None
+            for sell in np.flatnonzero(differences > 1e-12):
+                for buy in np.flatnonzero(differences < -1e-12):
+                    trade_percentage = min(
+                        differences[sell], -differences[buy])
+                    allocations = np.copy(allocation_array)
+                    allocations[sell] -= trade_percentage
+                    allocations[buy] += trade_percentage
+                    portfolio = Portfolio(
+                        self.stock_db, percent_allocations=allocations)
+                    correlation = np.corrcoef(
+                        portfolio.backtested_returns,
+                        self.desired_portfolio.backtested_returns)[0, 1]
+                    if best is None or correlation > best[0]:
+                        best = (correlation, sell, buy, allocations)
+            (correlation, sell, buy, allocation_array) = best
+            self.assertEqual(trade.sell_ticker, self.stock_db.tickers[sell])
+            self.assertEqual(trade.buy_ticker, self.stock_db.tickers[buy])
+            self.assertAlmostEqual(trade.new_correlation, correlation)
+
+    def test_stopping(self):
+        self.assertEqual(len(RebalancePlanner(
+            self.current_portfolio, self.desired_portfolio,
+            target_correlation=2.0, max_trades=2).trade_list), 2)
+
+        trade_list = RebalancePlanner(
+            self.current_portfolio, self.desired_portfolio,
+            target_correlation=0.9, max_trades=100).trade_list
+        self.assertGreaterEqual(trade_list[-1].new_correlation, 0.9)
+        for trade in trade_list[:-1]:
+            self.assertLess(trade.new_correlation, 0.9)
+
+        self.assertListEqual(RebalancePlanner(
+            self.desired_portfolio, self.desired_portfolio).trade_list, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
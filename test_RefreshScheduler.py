@@ -0,0 +1,75 @@
+import threading
+from time import time
+import unittest
+
+import Config
+from RefreshScheduler import RefreshScheduler
+
+
+class FakePriceStore(object):
+
+    def __init__(self, timestamps):
+        self.timestamps = timestamps
+
+    def getTimestamp(self, ticker):
+        return self.timestamps.get(ticker)
+
+
+class Test_RefreshScheduler(unittest.TestCase):
+
+    def setUp(self):
+        Config.REFRESH_IMPORTANCE = 4.0
+        now = time()
+        self.store = FakePriceStore(
+            {'A': now - 10.0, 'B': now - 50.0, 'C': now - 20.0})
+        self.scheduler = RefreshScheduler(self.store, important_tickers=['A'])
+
+    def test_getQueue(self):
+        self.store.timestamps = {'A': 90.0, 'B': 50.0, 'C': 80.0}
+        queue = self.scheduler.getQueue(['A', 'B', 'C', 'D'], now=100.0)
+        # A is 10s stale but important, so it counts as 40s. D isn't cached.
+        self.assertEqual(
+            sorted(queue), [(-50.0, 'B'), (-40.0, 'A'), (-20.0, 'C')])
+
+    def test_getRefreshList(self):
+        self.assertEqual(
+            self.scheduler.getRefreshList(['A', 'B', 'C'], 2)[0], 'B')
+        self.assertEqual(
+            len(self.scheduler.getRefreshList(['A', 'B', 'C'], 2)), 2)
+        self.assertEqual(self.scheduler.getRefreshList(['A', 'B'], -1), [])
+
+    def test_start(self):
+        refreshed = []
+        done = threading.Event()
+
+        def refresh(ticker_list):
+            refreshed.append(ticker_list)
+            for ticker in ticker_list:
+                self.store.timestamps[ticker] = time()
+            if len(refreshed) == 3:
+                done.set()
+
+        self.scheduler.start(['A', 'B', 'C'], refresh, 1, max_passes=3)
+        done.wait(5)
+        self.scheduler.stop()
+        # Staleness is re-read every pass, so refreshed tickers go to the back.
+        self.assertEqual(refreshed, [['B'], ['A'], ['C']])
+
+    def test_startSurvivesErrors(self):
+        refreshed = []
+        done = threading.Event()
+
+        def refresh(ticker_list):
+            refreshed.append(ticker_list)
+            if len(refreshed) == 1:
+                raise IOError('Too many 503s from API.')
+            done.set()
+
+        self.scheduler.start(['A', 'B', 'C'], refresh, 2, max_passes=2)
+        done.wait(5)
+        self.scheduler.stop()
+        self.assertEqual(len(refreshed), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,10 +1,11 @@
 from collections import OrderedDict
 from decimal import Decimal
 import numpy as np
+from scipy.stats.mstats import gmean
 import unittest
 
 import Config
-from Stock import Stock
+from Stock import Stock, buildStocks
 
 
 class Test_Stock(unittest.TestCase):
@@ -28,30 +29,92 @@ class Test_Stock(unittest.TestCase):
         expected = [1.02, 1.01, 1.02, 1.01]
         self.assertListEqual(list(self.stock._getReturnArray()), expected)
 
-    def test_getMeanAnnualReturn(self):
+    def test_meanAnnualReturn(self):
         test_data = np.array(
-            [1.02, 1.01, 1.02, 1.01], dtype=np.float64)
-        self.stock.return_array = test_data
+            [100, 102, 103.02, 105.0804, 106.131204], dtype=np.float64)
+        stock = Stock.fromArrays(self.stock.date_array, test_data, '', 0)
         self.assertAlmostEqual(
-            self.stock._getMeanAnnualReturn(),
+            stock._mean_annual_return,
             np.power(1.0149876846543509, Config.DAYS_IN_YEAR))
 
-    def test_getStDevAnnualReturn(self):
+    def test_stDevAnnualReturn(self):
         test_data = np.array(
-            [1.0, 3.0], dtype=np.float64)
-        self.stock.return_array = test_data
+            [1.0, 1.0, 3.0], dtype=np.float64)
+        stock = Stock.fromArrays(
+            self.stock.date_array[:3], test_data, '', 0)
         self.assertAlmostEqual(
-            self.stock._getStDevAnnualReturn(),
+            stock._st_dev_annual_return,
             np.power(2, 0.5) * np.power(Config.DAYS_IN_YEAR, 0.5))
 
     def test_getConservativeAnnualReturn(self):
         self.stock._mean_annual_return = 1.01
         self.stock._st_dev_annual_return = 0.01
         self.stock.expense_ratio = Decimal('0.01')
-        self.stock.return_array = range(4 * Config.DAYS_IN_YEAR)
+        self.stock._price_array = np.ones(4 * Config.DAYS_IN_YEAR + 1)
         self.assertAlmostEqual(
             self.stock._getConservativeAnnualReturn(0.05), 0.9893473584)
 
+    def test_appendPrices(self):
+        dates = np.arange(
+            np.datetime64('2018-01-01'), np.datetime64('2018-01-09'))
+        prices = np.array([100, 101, 102, 103, 104, 102, 106, 105],
+                          dtype=np.float64)
+        stock = Stock.fromArrays(dates[:5], prices[:5], '', Decimal('0.01'))
+        # Days already known are ignored.
+        stock.appendPrices(dates[3:], prices[3:])
+        expected = Stock.fromArrays(dates, prices, '', Decimal('0.01'))
+        self.assertListEqual(
+            stock.date_array.tolist(), expected.date_array.tolist())
+        self.assertListEqual(
+            list(stock.return_array), list(expected.return_array))
+        self.assertAlmostEqual(
+            stock._mean_annual_return, expected._mean_annual_return)
+        self.assertAlmostEqual(
+            stock._st_dev_annual_return, expected._st_dev_annual_return)
+        self.assertAlmostEqual(
+            stock.cons_annual_return, expected.cons_annual_return)
+
+    def test_buildStocks(self):
+        dates = np.arange(
+            np.datetime64('2018-01-01'), np.datetime64('2018-01-09'))
+        price_dict = {
+            'A': (dates, np.array([100, 101, 102, 103, 104, 102, 106, 105],
+                                  dtype=np.float64)),
+            'B': (dates[2:], np.array([10, 11, 10, 12, 13, 12],
+                                      dtype=np.float64)),
+            'C': (dates[:3], np.array([5, 4, 6], dtype=np.float64))
+        }
+        expense_ratio_dict = {'A': 0, 'B': Decimal('0.01'), 'C': 0.5}
+        stock_dict = buildStocks(price_dict, expense_ratio_dict)
+        for ticker, (dates, prices) in price_dict.iteritems():
+            stock = stock_dict[ticker]
+            expected = Stock.fromArrays(
+                dates, prices, ticker, expense_ratio_dict[ticker])
+            self.assertListEqual(stock.date_array.tolist(), dates.tolist())
+            self.assertListEqual(list(stock._price_array), list(prices))
+            self.assertAlmostEqual(
+                stock._mean_annual_return, _getMeanAnnualReturn(expected))
+            self.assertAlmostEqual(
+                stock._st_dev_annual_return,
+                _getStDevAnnualReturn(expected))
+            self.assertAlmostEqual(
+                stock.cons_annual_return, expected.cons_annual_return)
+        # Every stock is a view into the same arrays.
+        self.assertIs(
+            stock_dict['A']._price_array.base,
+            stock_dict['B']._price_array.base)
+
+
+def _getMeanAnnualReturn(stock):
+    """Calculate a stock's mean annual return directly from its returns."""
+    return np.power(gmean(stock.return_array), Config.DAYS_IN_YEAR)
+
+
+def _getStDevAnnualReturn(stock):
+    """Calculate a stock's annual st dev directly from its returns."""
+    return np.std(stock.return_array, ddof=1) * np.power(
+        Config.DAYS_IN_YEAR, 0.5)
+
 
 if __name__ == '__main__':
     unittest.main()
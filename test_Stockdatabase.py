@@ -62,6 +62,79 @@ class Test_StockDatabase(unittest.TestCase):
             [1.0097087378640777, 1.0098039215686274])
         self.assertEqual(len(stock_db.price_change_array), 3)
 
+    def test_getCommonDates(self):
+        # Stock 3 is missing a day in the middle, and is given out of order.
+        test_data = OrderedDict()
+        test_data['2018-01-05'] = Decimal('312.00')
+        test_data['2018-01-04'] = Decimal('309.00')
+        test_data['2018-01-02'] = Decimal('303.00')
+        test_data['2018-01-01'] = Decimal('300.00')
+        self.test_stock_dict['3'] = Stock(test_data, '3', 0)
+        stock_db = StockDatabase(self.test_stock_dict)
+        self.assertListEqual(
+            stock_db.dates.astype(str).tolist(),
+            ['2018-01-01', '2018-01-02', '2018-01-04', '2018-01-05'])
+        self.assertListEqual(list(stock_db.price_array[2]), [208, 309])
+        self.assertListEqual(list(stock_db.price_array[3]), [210, 312])
+
+    def assertDatabasesEqual(self, stock_db, expected):
+        self.assertListEqual(stock_db.tickers, expected.tickers)
+        self.assertListEqual(
+            stock_db.dates.tolist(), expected.dates.tolist())
+        self.assertTrue(
+            np.array_equal(stock_db.price_array, expected.price_array))
+        self.assertTrue(np.allclose(
+            stock_db.price_change_array, expected.price_change_array))
+
+    def getStocks(self, num_days):
+        dates = np.arange(
+            np.datetime64('2018-01-01'), np.datetime64('2018-01-01') + 20)
+        stock_dict = {}
+        for i, ticker in enumerate(['A', 'B', 'C']):
+            prices = 10.0 * (i + 1) + np.arange(20.0)
+            # B skips a day.
+            kept = dates != np.datetime64('2018-01-07') if ticker == 'B' \
+                else np.ones(20, dtype=bool)
+            stock_dict[ticker] = Stock.fromArrays(
+                dates[kept][:num_days], prices[kept][:num_days], ticker,
+                Decimal('0.01') * i)
+        return stock_dict
+
+    def test_appendPrices(self):
+        stock_db = StockDatabase(self.getStocks(8))
+        full_stocks = self.getStocks(20)
+        price_dict = dict(
+            (ticker, (stock.date_array, stock._price_array))
+            for ticker, stock in full_stocks.iteritems())
+        # A alone gets a day that can't be added until the others have it.
+        self.assertEqual(stock_db.appendPrices(
+            {'A': (price_dict['A'][0][:9], price_dict['A'][1][:9])}), 0)
+        for num_days in (10, 15, 20):
+            stock_db.appendPrices(dict(
+                (ticker, (dates[:num_days], prices[:num_days]))
+                for ticker, (dates, prices) in price_dict.iteritems()))
+        self.assertDatabasesEqual(stock_db, StockDatabase(full_stocks))
+        self.assertEqual(len(stock_db.dates), 19)
+
+    def test_addRemoveStock(self):
+        stocks = self.getStocks(20)
+        stock_db = StockDatabase({'A': stocks['A'], 'C': stocks['C']})
+        self.assertRaises(ValueError, stock_db.addStock, stocks['A'])
+        self.assertTrue(stock_db.addStock(stocks['B']))
+        self.assertDatabasesEqual(stock_db, StockDatabase(stocks))
+        self.assertFalse(stock_db.addStock(self.test_stock_dict['1']))
+
+        stock_db.removeStock('A')
+        del stocks['A']
+        expected = StockDatabase(stocks)
+        self.assertDatabasesEqual(stock_db, expected)
+
+        # Removing and re-adding the only stock rebuilds from its days.
+        stock_db = StockDatabase({'C': stocks['C']})
+        stock_db.removeStock('C')
+        self.assertTrue(stock_db.addStock(stocks['C']))
+        self.assertDatabasesEqual(stock_db, StockDatabase({'C': stocks['C']}))
+
 
 if __name__ == '__main__':
     unittest.main()
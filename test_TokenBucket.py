@@ -0,0 +1,23 @@
+from time import time
+import unittest
+
+from TokenBucket import TokenBucket
+
+
+class Test_TokenBucket(unittest.TestCase):
+
+    def test_acquire(self):
+        bucket = TokenBucket(100, capacity=5)
+        start_time = time()
+        for _ in range(5):
+            bucket.acquire()
+        # The burst is free...
+        self.assertLess(time() - start_time, 0.04)
+        for _ in range(5):
+            bucket.acquire()
+        # ...then tokens come at the rate.
+        self.assertGreaterEqual(time() - start_time, 0.045)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import csv
+import numpy as np
+import os
+import shutil
+import tempfile
+import unittest
+
+import Config
+import DataIO
+from Portfolio import Portfolio
+from Stock import buildStocks
+from StockDatabase import StockDatabase
+from Trade import Trade
+from TradeFactory import TradeFactory
+
+
+class Test_TradeFactory(unittest.TestCase):
+
+    def setUp(self):
+        self.old_minimum = Config.MINIMUM_AMOUNT_DATA
+        Config.MINIMUM_AMOUNT_DATA = 4
+        random_state = np.random.RandomState(0)
+        dates = np.arange(
+            np.datetime64('2018-01-01'), np.datetime64('2018-03-01'))
+        price_dict = {}
+        for ticker in 'ABCDEF':
+            price_dict[ticker] = (dates, 10 * np.cumprod(
+                1 + 0.01 * random_state.randn(len(dates))))
+        self.stock_db = StockDatabase(
+            buildStocks(price_dict, dict.fromkeys(price_dict, 0.001)))
+        self.current_portfolio = Portfolio(
+            self.stock_db,
+            percent_allocations=[0.4, 0.3, 0.1, 0.2, 0.0, 0.0])
+        self.desired_portfolio = Portfolio(
+            self.stock_db,
+            percent_allocations=[0.1, 0.3, 0.2, 0.0, 0.25, 0.15])
+
+    def tearDown(self):
+        Config.MINIMUM_AMOUNT_DATA = self.old_minimum
+
+    def test_getTradeList(self):
+        trade_list = TradeFactory(
+            self.current_portfolio, self.desired_portfolio).trade_list
+        # A and D are overweight, C, E and F underweight, B neither.
+        self.assertItemsEqual(
+            [(trade.sell_ticker, trade.buy_ticker) for trade in trade_list],
+            [(sell, buy) for sell in 'AD' for buy in 'CEF'])
+        correlations = [trade.new_correlation for trade in trade_list]
+        self.assertListEqual(correlations, sorted(correlations, reverse=True))
+
+        for trade in trade_list:
+            expected = Trade(
+                trade.buy_ticker, trade.sell_ticker, self.stock_db,
+                self.current_portfolio, self.desired_portfolio)
+            self.assertEqual(expected.sell_ticker, trade.sell_ticker)
+            self.assertAlmostEqual(
+                expected.trade_percentage, trade.trade_percentage)
+            self.assertAlmostEqual(
+                expected.new_correlation, trade.new_correlation)
+
+    def test_noTrades(self):
+        self.assertListEqual(TradeFactory(
+            self.desired_portfolio, self.desired_portfolio).trade_list, [])
+        trade = Trade('B', 'B', self.stock_db, self.current_portfolio,
+                      self.desired_portfolio)
+        self.assertIsNone(trade.buy_ticker)
+        self.assertIsNone(trade.new_correlation)
+
+    def test_writeTrades(self):
+        trade_factory = TradeFactory(
+            self.current_portfolio, self.desired_portfolio)
+        directory = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(directory, 'Trades.csv')
+            DataIO.writeTrades(trade_factory, filename)
+            with open(filename, 'r') as f:
+                rows = list(csv.reader(f))
+        finally:
+            shutil.rmtree(directory)
+        self.assertListEqual(
+            rows[0], ['Sell', 'Buy', 'Trade Percentage', 'New Correlation'])
+        self.assertEqual(len(rows), 7)
+        best_trade = trade_factory.trade_list[0]
+        self.assertListEqual(
+            rows[1][:2], [best_trade.sell_ticker, best_trade.buy_ticker])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,21 @@
+import unittest
+
+import main
+
+
+class Test_main(unittest.TestCase):
+
+    def test_parseReturns(self):
+        self.assertEqual(main._parseReturns('1.03,1.05'), [1.03, 1.05])
+        self.assertEqual(
+            main._parseReturns('1.03:1.05:0.01'), [1.03, 1.04, 1.05])
+        self.assertEqual(
+            main._parseReturns('1.05:1.03:-0.01'), [1.05, 1.04, 1.03])
+        self.assertEqual(main._parseReturns('1.03:1.03:0.01'), [1.03])
+        self.assertRaises(ValueError, main._parseReturns, '1.03:1.05:0')
+        self.assertRaises(ValueError, main._parseReturns, '1.03:1.10:-0.01')
+        self.assertRaises(ValueError, main._parseReturns, '1.03:1.10')
+
+
+if __name__ == '__main__':
+    unittest.main()